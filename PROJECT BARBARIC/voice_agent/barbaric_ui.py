@@ -1,17 +1,21 @@
 import sys
+import json
 import threading
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, filedialog
+from tkinter import scrolledtext, messagebox, filedialog, simpledialog
 import speech_recognition as sr
 import math
 import random
 import time
+from collections import deque
 
 # Import your main agent logic
 import main as barbaric
 
 
 class BarbaricUI(tk.Tk):
+    _HUD_GRID_STEP = 24
+
     def __init__(self):
         super().__init__()
         self.title("Barbaric Voice Agent")
@@ -28,6 +32,10 @@ class BarbaricUI(tk.Tk):
         self._hud_angle = 0.0
         self._hud_pulse = 0.0
         self._hud_running = True
+        self._hud_items = None
+        self._hud_last = 0.0
+        self._viz_items = None
+        self._frame_times = deque(maxlen=240)
 
         # Build UI
         self.create_widgets()
@@ -38,11 +46,11 @@ class BarbaricUI(tk.Tk):
         # Hook TTS to UI log
         self._orig_speak = barbaric.speak
 
-        def ui_speak(text: str):
+        def ui_speak(text: str, priority: str = 'chat'):
             ui_text = text.replace('Barbaric says: ', '')
             self.display_response(ui_text)
             try:
-                self._orig_speak(text)
+                self._orig_speak(text, priority=priority)
             except Exception:
                 pass
         barbaric.speak = ui_speak
@@ -53,13 +61,36 @@ class BarbaricUI(tk.Tk):
         except Exception:
             pass
 
+        # Mirror shell command output in the log as it streams
+        barbaric.COMMAND_OUTPUT_HOOK = self._on_command_output
+        # TTS, speech model, LLM connection, OCR and phrase cache warm up once the window is on screen
+        self._shown = False
+        self.bind('<Map>', self._on_first_map, add='+')
+
         # Theme
         try:
             self.apply_theme(barbaric.SETTINGS.get("theme", "dark"))
         except Exception:
             pass
 
-        # OCR availability info
+        # Auto-start Always Listen
+        if self.always_listen_var.get():
+            self.start_always_listen()
+
+        # Start HUD; agent state changes arrive as batched events on the Tk loop
+        self.after(0, self._hud_step)
+        barbaric.state_bus.attach_tk(self, self._on_state_events)
+
+    def _on_first_map(self, event=None):
+        if self._shown or (event is not None and event.widget is not self):
+            return
+        self._shown = True
+        barbaric.warm_up(on_done=self._after_warm_up)
+
+    def _after_warm_up(self):
+        # Runs on the warm-up thread; display_response is thread-safe
+        if not barbaric.SETTINGS.get("features", {}).get("ocr", True):
+            return
         try:
             ok, err = barbaric.ocr_is_available()
             if not ok:
@@ -67,15 +98,6 @@ class BarbaricUI(tk.Tk):
         except Exception:
             pass
 
-        # Auto-start Always Listen
-        if self.always_listen_var.get():
-            self.start_always_listen()
-
-        # Start HUD + TTS watchers
-        self.after(0, self._hud_draw)
-        self.after(33, self._hud_step)
-        threading.Thread(target=self._tts_watcher, daemon=True).start()
-
     def create_widgets(self):
         self.header = tk.Label(self, text="Barbaric Voice Agent", font=("Segoe UI", 20, "bold"), fg="#00ff99", bg="#23272e")
         self.header.pack(pady=10)
@@ -118,6 +140,9 @@ class BarbaricUI(tk.Tk):
         self.text_area = scrolledtext.ScrolledText(self, wrap=tk.WORD, font=("Consolas", 12), bg="#181a20", fg="#ffffff", height=15)
         self.text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
         self.text_area.config(state=tk.DISABLED)
+        self._transcript_scheduled = False
+        # Ctrl+F searches the full transcript, including lines trimmed from the window
+        self.bind('<Control-f>', self.on_search_transcript)
 
         self.status = tk.Label(self, text="Say a command or type below.", font=("Segoe UI", 12), fg="#cccccc", bg="#23272e")
         self.status.pack(pady=5)
@@ -128,6 +153,8 @@ class BarbaricUI(tk.Tk):
         self.input_entry = tk.Entry(self.input_frame, font=("Segoe UI", 12), bg="#2c2f36", fg="#ffffff")
         self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         self.input_entry.bind('<Return>', self.on_enter)
+        # Esc stops the running plan and any speech
+        self.bind('<Escape>', self.on_cancel)
 
         self.send_btn = tk.Button(self.input_frame, text="Send", command=self.on_send, bg="#00ff99", fg="#23272e", font=("Segoe UI", 12, "bold"))
         self.send_btn.pack(side=tk.RIGHT)
@@ -144,6 +171,7 @@ class BarbaricUI(tk.Tk):
         label = {
             'idle': ("Idle.", "#cccccc", "#00e0ff"),
             'listening': ("Listening…", "#00e0ff", "#00b7ff"),
+            'recognizing': ("Recognizing…", "#4dd0e1", "#00acc1"),
             'thinking': ("Thinking…", "#ffaa33", "#ff7b00"),
             'speaking': ("Speaking…", "#1bd1ff", "#00e0ff"),
             'acting': ("Executing…", "#b388ff", "#7a5cff"),
@@ -162,6 +190,11 @@ class BarbaricUI(tk.Tk):
         # animate accent transition
         self._accent_target = accent
 
+    def _on_state_events(self, events: list):
+        # Only the newest state is shown; the rest of the burst is history (see state_bus.history)
+        last = events[-1]
+        self.set_agent_state(last['state'], last['detail'])
+
     def _interp_color(self, c1: str, c2: str, t: float) -> str:
         def hex_to_rgb(h):
             h = h.lstrip('#')
@@ -175,13 +208,37 @@ class BarbaricUI(tk.Tk):
         b = int(b1 + (b2 - b1) * t)
         return rgb_to_hex(r, g, b)
 
+    def _hud_build(self, w: int, h: int):
+        """Create every HUD canvas item once for this canvas size; frames only move/reconfigure them."""
+        c = self.hud_canvas
+        c.delete("all")
+        grid_color = "#1a232d"
+        step = self._HUD_GRID_STEP
+        # Lines overhang the canvas by a step so the grid can scroll a full step and wrap
+        for x in range(0, w + step * 2, step):
+            c.create_line(x, -step, x, h + step * 2, fill=grid_color, tags=('grid',))
+        for y in range(0, h + step * 2, step):
+            c.create_line(-step, y, w + step * 2, y, fill=grid_color, tags=('grid',))
+        arcs = []
+        for i in range(2):
+            arcs.append((c.create_arc(0, 0, 1, 1, start=0, extent=1, outline=self._accent, style=tk.ARC, width=3),
+                         c.create_arc(0, 0, 1, 1, start=0, extent=1, outline="#66ffff", style=tk.ARC, width=1)))
+        ring = c.create_oval(0, 0, 1, 1, outline=self._accent, width=2)
+        label = c.create_text(0, 0, text="", fill="#bde9ff", font=("Segoe UI", 12, "bold"))
+        clock = c.create_text(0, 0, text="", fill="#9fb3c8", font=("Consolas", 11), anchor='ne')
+        self._hud_items = {'size': (w, h), 'arcs': arcs, 'ring': ring, 'label': label, 'clock': clock,
+                           'grid_offset': 0, 'accent': self._accent, 'text': None, 'time': None}
+
     def _hud_draw(self):
         c = self.hud_canvas
         if not c.winfo_ismapped():
             return
-        c.delete("all")
         w = c.winfo_width() or c.winfo_reqwidth()
         h = c.winfo_height() or 180
+        items = self._hud_items
+        if items is None or items['size'] != (w, h):
+            self._hud_build(w, h)
+            items = self._hud_items
         cx, cy = w // 2, h // 2
         # Smooth accent transition
         try:
@@ -192,33 +249,64 @@ class BarbaricUI(tk.Tk):
         except Exception:
             pass
         accent = self._accent
+        recolor = accent != items['accent']
+        items['accent'] = accent
 
-        # Background grid
-        grid_color = "#1a232d"
-        step = 24
+        # Background grid: scroll every line with a single move
+        step = self._HUD_GRID_STEP
         offset = int((time.time() * 20) % step)
-        for x in range(-offset, w, step):
-            c.create_line(x, 0, x, h, fill=grid_color)
-        for y in range(-offset, h, step):
-            c.create_line(0, y, w, y, fill=grid_color)
+        delta = items['grid_offset'] - offset
+        if delta:
+            c.move('grid', delta, delta)
+            items['grid_offset'] = offset
 
         # Outer and inner arcs (rotating)
         pulse = 1.0 + 0.06 * math.sin(self._hud_pulse)
-        r1 = int(72 * pulse)
-        r2 = int(110 * pulse)
-        for i, rad in enumerate((r1, r2)):
+        for i, rad in enumerate((int(72 * pulse), int(110 * pulse))):
             start = (self._hud_angle * (1.6 + 0.2 * i)) % 360
             extent = 220 if i == 0 else 100
-            c.create_arc(cx - rad, cy - rad, cx + rad, cy + rad, start=start, extent=extent, outline=accent, style=tk.ARC, width=3)
-            c.create_arc(cx - rad, cy - rad, cx + rad, cy + rad, start=(start + 180) % 360, extent=extent - 40, outline="#66ffff", style=tk.ARC, width=1)
+            bold, thin = items['arcs'][i]
+            box = (cx - rad, cy - rad, cx + rad, cy + rad)
+            c.coords(bold, *box)
+            c.coords(thin, *box)
+            if recolor:
+                c.itemconfigure(bold, start=start, extent=extent, outline=accent)
+            else:
+                c.itemconfigure(bold, start=start, extent=extent)
+            c.itemconfigure(thin, start=(start + 180) % 360, extent=extent - 40)
 
         # Central ring with label
-        c.create_oval(cx - 56, cy - 56, cx + 56, cy + 56, outline=accent, width=2)
-        c.create_text(cx, cy, text=self._agent_state.upper(), fill="#bde9ff", font=("Segoe UI", 12, "bold"))
+        c.coords(items['ring'], cx - 56, cy - 56, cx + 56, cy + 56)
+        if recolor:
+            c.itemconfigure(items['ring'], outline=accent)
+        c.coords(items['label'], cx, cy)
+        text = self._agent_state.upper()
+        if text != items['text']:
+            c.itemconfigure(items['label'], text=text)
+            items['text'] = text
 
         # Corner stats (time)
         t = time.strftime("%H:%M:%S")
-        c.create_text(w - 10, 10, text=t, fill="#9fb3c8", font=("Consolas", 11), anchor='ne')
+        c.coords(items['clock'], w - 10, 10)
+        if t != items['time']:
+            c.itemconfigure(items['clock'], text=t)
+            items['time'] = t
+
+    def _hud_interval(self) -> int:
+        """Frame interval (ms): full rate while the agent is busy, a low tick when idle or hidden."""
+        ui = barbaric.SETTINGS.get("ui", {})
+        try:
+            hidden = self.state() in ('iconic', 'withdrawn') or not self.hud_canvas.winfo_viewable()
+        except Exception:
+            hidden = False
+        if hidden:
+            fps = ui.get("fps_hidden", 2)
+        elif self._agent_state == 'idle' and not any(l > 0.03 for l in self._viz_levels):
+            # Nothing spinning fast and the bars are flat (mic off or silent)
+            fps = ui.get("fps_idle", 8)
+        else:
+            fps = ui.get("fps_active", 30)
+        return max(1, int(1000 / max(0.5, float(fps))))
 
     def _hud_step(self):
         if not self._hud_running:
@@ -237,97 +325,219 @@ class BarbaricUI(tk.Tk):
             speed = 7.0; pulse = 0.9
         else:
             speed = 1.6; pulse = 0.25
-        self._hud_angle = (self._hud_angle + speed) % 360
-        self._hud_pulse += pulse
+        # Speeds are per 33 ms frame; scale by the real interval so motion looks the same at any rate
+        now = time.perf_counter()
+        frames = min(30.0, (now - self._hud_last) / 0.033) if self._hud_last else 1.0
+        self._hud_last = now
+        self._hud_angle = (self._hud_angle + speed * frames) % 360
+        self._hud_pulse += pulse * frames
         try:
+            # The visualizer rides on the HUD tick so both follow the same hidden/idle rate
+            if self._viz_running:
+                self._viz_step(frames)
+            t0 = time.perf_counter()
             self._hud_draw()
+            if self._viz_running:
+                self._viz_draw_bars()
+            self._frame_times.append(time.perf_counter() - t0)
         finally:
-            self.after(33, self._hud_step)
+            self.after(self._hud_interval(), self._hud_step)
 
-    def _tts_watcher(self):
-        # Observe the main module's TTS flag to reflect 'speaking' state visually
-        prev = False
-        while True:
-            try:
-                cur = bool(getattr(barbaric, 'TTS_IS_PLAYING', None) and barbaric.TTS_IS_PLAYING.is_set())
-            except Exception:
-                cur = False
-            if cur and not prev:
-                self.after(0, lambda: self.set_agent_state('speaking'))
-            elif (not cur) and prev:
-                # return to listening if active, else idle
-                next_state = 'listening' if self._viz_running else 'idle'
-                self.after(0, lambda s=next_state: self.set_agent_state(s))
-            prev = cur
-            time.sleep(0.08)
+    def bench_startup_child(self):
+        """Child side of barbaric.bench_startup(): print milestones on stdout, then exit."""
+        done = {'listen': False, 'warm': False}
+
+        def mark(name, detail=''):
+            print(f"STARTUP {name} {detail}".rstrip(), flush=True)
+
+        def finish_if_done():
+            if all(done.values()):
+                mark('timing', json.dumps(barbaric.STARTUP_TIMING))
+                self.after(0, self.destroy)
+
+        def on_event(event):
+            if done['listen']:
+                return
+            if event['state'] == 'listening':
+                mark('listen')
+            elif event['state'] == 'error':
+                mark('listen_failed', event['detail'] or '')
+            else:
+                return
+            done['listen'] = True
+            self.listen_stop.set()
+            finish_if_done()
+
+        def on_map(event=None):
+            if event is not None and event.widget is not self:
+                return
+            self.unbind('<Map>')
+            mark('window')
+            barbaric.state_bus.subscribe(on_event)
+            self.on_speak()
+            barbaric.warm_up(on_done=warm_done)
+
+        def warm_done():
+            done['warm'] = True
+            finish_if_done()
+
+        # Replace the normal first-map hook so warm-up isn't started twice
+        self._shown = True
+        self.bind('<Map>', on_map)
+
+    def bench_render(self, frames: int = 300) -> dict:
+        """Frame time, CPU and canvas item churn of the HUD + visualizer, per agent state.
+        CPU % is projected at the frame rate _hud_interval() picks for that state."""
+        self.update()
+        results = {}
+        saved = (self._agent_state, self._viz_running)
+        self._viz_running = False  # drive the bars by hand below
+        try:
+            for state in ('idle', 'listening', 'thinking'):
+                self._agent_state = state
+                self._viz_levels[:] = [0.0] * len(self._viz_levels)  # silent mic: the rate idle really gets
+                interval = self._hud_interval()
+                first_id = self.hud_canvas.create_line(0, 0, 0, 0)
+                self.hud_canvas.delete(first_id)
+                times = []
+                cpu0 = time.process_time()
+                for _ in range(frames):
+                    self._viz_levels[:] = [random.random() for _ in self._viz_levels]
+                    t0 = time.perf_counter()
+                    self._hud_angle = (self._hud_angle + 3.0) % 360
+                    self._hud_pulse += 0.4
+                    self._hud_draw()
+                    self._viz_draw_bars()
+                    self.update_idletasks()
+                    times.append(time.perf_counter() - t0)
+                cpu = time.process_time() - cpu0
+                last_id = self.hud_canvas.create_line(0, 0, 0, 0)
+                self.hud_canvas.delete(last_id)
+                times.sort()
+                r = {
+                    'interval_ms': interval,
+                    'mean_ms': sum(times) / len(times) * 1000,
+                    'p95_ms': times[int(len(times) * 0.95)] * 1000,
+                    'cpu_pct': cpu / frames * (1000.0 / interval) * 100,
+                    'items': len(self.hud_canvas.find_all()) + len(self.viz_canvas.find_all()),
+                    'new_items_per_frame': (last_id - first_id - 1) / frames,
+                }
+                results[state] = r
+                print(f"{state:>9}: {1000 / interval:4.0f} fps  frame {r['mean_ms']:5.2f} ms (p95 {r['p95_ms']:5.2f})"
+                      f"  CPU {r['cpu_pct']:5.1f}%  items {r['items']}  new/frame {r['new_items_per_frame']:.1f}")
+        finally:
+            self._agent_state, self._viz_running = saved
+        return results
 
     # ===== Visualizer =====
-    def _viz_draw_bars(self):
+    def _viz_build(self, w: int, h: int):
         c = self.viz_canvas
         c.delete("all")
+        # One rectangle per bar carries both the fill and the outline
+        bars = [c.create_rectangle(0, 0, 0, 0, fill=self._viz_color, outline="#66ffff", width=1)
+                for _ in self._viz_levels]
+        cx, cy, r = w // 2, h // 2, 22
+        c.create_oval(cx - r, cy - r, cx + r, cy + r, outline="#1bd1ff", width=2)
+        self._viz_items = {'size': (w, h), 'bars': bars, 'heights': [None] * len(bars)}
+
+    def _viz_draw_bars(self):
+        c = self.viz_canvas
         w = c.winfo_width() or c.winfo_reqwidth()
         h = c.winfo_height() or 90
+        items = self._viz_items
+        if items is None or items['size'] != (w, h):
+            self._viz_build(w, h)
+            items = self._viz_items
         n = len(self._viz_levels)
         gap = 4
         bar_w = max(2, (w - gap * (n + 1)) // n)
+        heights = items['heights']
         for i, lvl in enumerate(self._viz_levels):
             scale = max(0.02, min(1.0, lvl))
             bh = int(scale * (h - 12))
+            if bh == heights[i]:
+                continue  # unchanged bars cost nothing
+            heights[i] = bh
             x0 = gap + i * (bar_w + gap)
-            y0 = h - bh - 6
-            x1 = x0 + bar_w
-            y1 = h - 6
-            c.create_rectangle(x0, y0, x1, y1, fill=self._viz_color, width=0)
-            c.create_rectangle(x0, y0, x1, y1, outline="#66ffff", width=1)
-        cx = w // 2
-        cy = h // 2
-        r = 22
-        c.create_oval(cx - r, cy - r, cx + r, cy + r, outline="#1bd1ff", width=2)
-        if self._viz_running:
-            self.after(33, self._viz_draw_bars)
+            c.coords(items['bars'][i], x0, h - bh - 6, x0 + bar_w, h - 6)
 
-    def _viz_step(self):
-        if not self._viz_running:
-            return
+    def _viz_step(self, frames: float = 1.0):
+        """Ease the bars towards the latest audio bands; frames = elapsed time in 33 ms frames."""
+        # Latest band levels published by the capture thread; never blocks on audio
         n = len(self._viz_levels)
-        t = time.time()
-        base = 0.06 + 0.02 * math.sin(t * 2.1)
+        _seq, stamp, _rms, bands = barbaric.audio_levels.latest()
+        if bands and time.monotonic() - stamp < 0.3:
+            m = len(bands)
+            target = [bands[i * m // n] for i in range(n)] if m != n else bands
+        else:
+            target = (0.0,) * n  # no live audio (capture off or stalled): let the bars fall
+        # fast attack, slower release (per-frame rates, compounded over the elapsed frames)
+        attack = 1.0 - 0.4 ** frames
+        release = 1.0 - 0.8 ** frames
         for i in range(n):
-            phase = (i / n) * math.pi * 2
-            wave = 0.6 + 0.4 * math.sin(t * 4.0 + phase)
-            level = min(1.0, base * (1.5 + wave) + 0.02 * random.random())
-            self._viz_levels[i] = self._viz_levels[i] * 0.65 + level * 0.35
-        self.after(33, self._viz_step)
+            cur = self._viz_levels[i]
+            t = target[i]
+            self._viz_levels[i] = cur + (t - cur) * (attack if t > cur else release)
 
     def start_visualizer(self):
         if self._viz_running:
             return
-        self._viz_running = True
-        self.after(0, self._viz_draw_bars)
-        self.after(33, self._viz_step)
-        try:
-            self.set_agent_state('listening')
-        except Exception:
-            pass
+        self._viz_running = True  # picked up by the next _hud_step
 
     def stop_visualizer(self):
         if not self._viz_running:
             return
         self._viz_running = False
-        try:
-            if not (getattr(barbaric, 'TTS_IS_PLAYING', None) and barbaric.TTS_IS_PLAYING.is_set()):
-                self.set_agent_state('idle')
-        except Exception:
-            pass
+        # Flatten the bars so the HUD can drop back to its idle rate
+        self._viz_levels[:] = [0.0] * len(self._viz_levels)
+        self._viz_draw_bars()
+        # Mic closed: drop a leftover listening state (speaking is an overlay and survives)
+        if barbaric.state_bus.pipeline_state in ('listening', 'recognizing'):
+            barbaric.state_bus.publish('idle')
 
     # ===== IO =====
+    def _log(self, line: str, kind: str = 'agent'):
+        # Safe from any thread: lines queue in the transcript and reach the widget once per frame
+        barbaric.transcript.append(line, kind)
+        if not self._transcript_scheduled:
+            self._transcript_scheduled = True
+            self.after(33, self._flush_transcript)
+
+    def _flush_transcript(self):
+        self._transcript_scheduled = False
+        batch = barbaric.transcript.drain()
+        if not batch:
+            return
+        ta = self.text_area
+        # Only follow the tail if the user hasn't scrolled up to read something
+        follow = ta.yview()[1] >= 0.999
+        ta.config(state=tk.NORMAL)
+        ta.insert(tk.END, ''.join(e['text'] + '\n' for e in batch))
+        max_lines = int(barbaric.SETTINGS.get("transcript", {}).get("max_lines", 2000))
+        excess = int(ta.index('end-1c').split('.')[0]) - 1 - max_lines
+        if max_lines > 0 and excess > 0:
+            ta.delete('1.0', f'{excess + 1}.0')
+        ta.config(state=tk.DISABLED)
+        if follow:
+            ta.see(tk.END)
+
+    def on_search_transcript(self, event=None):
+        query = simpledialog.askstring("Search transcript", "Find:", parent=self)
+        if not query:
+            return
+        hits = barbaric.transcript.search(query, limit=200)
+        win = tk.Toplevel(self)
+        win.title(f"Transcript: {query}")
+        win.configure(bg="#23272e")
+        out = scrolledtext.ScrolledText(win, wrap=tk.WORD, font=("Consolas", 11), bg="#181a20", fg="#ffffff", width=100, height=25)
+        out.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(h['t']))}  {h['text']}" for h in hits]
+        out.insert(tk.END, '\n'.join(lines) if lines else f"No matches for '{query}'.")
+        out.see(tk.END)
+        out.config(state=tk.DISABLED)
+
     def display_response(self, text):
-        def _append():
-            self.text_area.config(state=tk.NORMAL)
-            self.text_area.insert(tk.END, f"Barbaric: {text}\n")
-            self.text_area.see(tk.END)
-            self.text_area.config(state=tk.DISABLED)
-        self.after(0, _append)
+        self._log(f"Barbaric: {text}")
 
     def on_enter(self, event):
         self.on_send()
@@ -335,55 +545,55 @@ class BarbaricUI(tk.Tk):
     def on_send(self):
         user_input = self.input_entry.get().strip()
         if user_input:
-            self.text_area.config(state=tk.NORMAL)
-            self.text_area.insert(tk.END, f"You: {user_input}\n")
-            self.text_area.config(state=tk.DISABLED)
+            self._log(f"You: {user_input}", 'user')
             self.input_entry.delete(0, tk.END)
             def _run(u=user_input):
+                # process_input publishes thinking/acting/idle (or error) on the state bus
                 try:
-                    self.set_agent_state('thinking')
-                    response = barbaric.get_ai_response(u)
-                    self.set_agent_state('acting')
-                    barbaric.handle_ai_response(response)
-                    # if TTS starts, watcher will override; otherwise success
-                    if not (getattr(barbaric, 'TTS_IS_PLAYING', None) and barbaric.TTS_IS_PLAYING.is_set()):
-                        self.set_agent_state('success')
+                    barbaric.process_input(u)
                 except Exception as e:
-                    self.set_agent_state('error', str(e))
-                finally:
-                    if not (getattr(barbaric, 'TTS_IS_PLAYING', None) and barbaric.TTS_IS_PLAYING.is_set()):
-                        self.set_agent_state('idle')
+                    self.display_response(f"Request failed: {e}")
             threading.Thread(target=_run, daemon=True).start()
 
     def on_speak(self):
+        # Pressing Speak while the agent talks is an explicit barge-in
+        try:
+            barbaric.cancel_speech()
+        except Exception:
+            pass
         self.start_visualizer()
         def _listen_and_process():
             try:
                 utterance = barbaric.listen()
                 if not utterance:
                     return
-                self.after(0, lambda: self._append_user_voice(utterance))
-                self.set_agent_state('thinking')
-                response = barbaric.get_ai_response(utterance)
-                self.set_agent_state('acting')
-                barbaric.handle_ai_response(response)
+                self._append_user_voice(utterance)
+                barbaric.process_input(utterance)
             except Exception as e:
-                self.set_agent_state('error', str(e))
+                barbaric.state_bus.publish('error', str(e))
                 self.display_response(f"Voice input failed: {e}")
             finally:
-                self.stop_visualizer()
-                if not (getattr(barbaric, 'TTS_IS_PLAYING', None) and barbaric.TTS_IS_PLAYING.is_set()):
-                    self.set_agent_state('idle')
+                self.after(0, self.stop_visualizer)
         threading.Thread(target=_listen_and_process, daemon=True).start()
 
+    def _on_command_output(self, stream: str, line: str):
+        self._log(f"  {'!' if stream == 'stderr' else '|'} {line}", stream)
+
+    def on_cancel(self, event=None):
+        try:
+            barbaric.cancel_plan()
+            barbaric.cancel_speech()
+        except Exception:
+            pass
+        self.display_response("Stopped.")
+
     def _append_user_voice(self, utterance: str):
-        self.text_area.config(state=tk.NORMAL)
-        self.text_area.insert(tk.END, f"You (voice): {utterance}\n")
-        self.text_area.config(state=tk.DISABLED)
+        self._log(f"You (voice): {utterance}", 'user')
 
     def on_close(self):
         self.stop_always_listen()
         if messagebox.askokcancel("Quit", "Do you want to quit Barbaric?"):
+            barbaric.transcript.close()
             self.destroy()
             sys.exit()
 
@@ -401,6 +611,11 @@ class BarbaricUI(tk.Tk):
             return
         self.listen_stop.clear()
         self.start_visualizer()
+        # Keep the LLM connection alive across idle gaps between utterances
+        try:
+            barbaric.warm_up_llm()
+        except Exception:
+            pass
 
         def _loop():
             try:
@@ -408,11 +623,8 @@ class BarbaricUI(tk.Tk):
                     try:
                         utterance = barbaric.listen()
                         if utterance:
-                            self.after(0, lambda u=utterance: self._append_user_voice(u))
-                            self.set_agent_state('thinking')
-                            response = barbaric.get_ai_response(utterance)
-                            self.set_agent_state('acting')
-                            barbaric.handle_ai_response(response)
+                            self._append_user_voice(utterance)
+                            barbaric.process_input(utterance)
                         else:
                             self.listen_stop.wait(0.2)
                     except Exception as e:
@@ -438,34 +650,34 @@ class BarbaricUI(tk.Tk):
                 if not ok:
                     self.display_response("OCR not available. Please configure Tesseract in Settings.")
                     return
-                self.set_agent_state('ocr_scan')
+                barbaric.state_bus.publish('ocr_scan')
                 txt = barbaric.screen_ocr()
                 snippet = (txt[:800] + '…') if len(txt) > 800 else txt
                 self.display_response("Screen OCR:\n" + (snippet or "<no text found>"))
-                self.set_agent_state('success')
+                barbaric.state_bus.publish('success')
             except Exception as e:
-                self.set_agent_state('error', str(e))
+                barbaric.state_bus.publish('error', str(e))
                 self.display_response(f"Screen analysis failed: {e}")
             finally:
-                self.set_agent_state('idle')
+                barbaric.state_bus.publish('idle')
         threading.Thread(target=_run, daemon=True).start()
 
     def on_test_ocr(self):
         def _run():
             try:
-                self.set_agent_state('ocr_scan')
+                barbaric.state_bus.publish('ocr_scan')
                 ok, msg = barbaric.test_ocr()
                 if ok:
                     self.display_response(f"OCR test passed: {msg}")
-                    self.set_agent_state('success')
+                    barbaric.state_bus.publish('success')
                 else:
                     self.display_response(f"OCR test failed: {msg}")
-                    self.set_agent_state('warning')
+                    barbaric.state_bus.publish('warning')
             except Exception as e:
-                self.set_agent_state('error', str(e))
+                barbaric.state_bus.publish('error', str(e))
                 self.display_response(f"OCR test error: {e}")
             finally:
-                self.set_agent_state('idle')
+                barbaric.state_bus.publish('idle')
         threading.Thread(target=_run, daemon=True).start()
 
     # ===== Settings =====
@@ -492,6 +704,14 @@ class BarbaricUI(tk.Tk):
         mic_menu.configure(bg="#3b3f46", fg="#ffffff")
         mic_menu.pack(fill=tk.X, padx=12)
 
+        # Speech recognizer backend
+        tk.Label(win, text="Speech recognizer", bg="#23272e", fg="#ffffff").pack(pady=(10, 0))
+        stt_names = list(getattr(barbaric, 'STT_BACKENDS', {}) or ['google'])
+        stt_var = tk.StringVar(value=barbaric.SETTINGS.get("stt", {}).get("backend", "google"))
+        stt_menu = tk.OptionMenu(win, stt_var, *stt_names)
+        stt_menu.configure(bg="#3b3f46", fg="#ffffff")
+        stt_menu.pack(fill=tk.X, padx=12)
+
         # Cursor step
         tk.Label(win, text="Cursor step (px)", bg="#23272e", fg="#ffffff").pack(pady=(10, 0))
         curstep_var = tk.IntVar(value=int(barbaric.SETTINGS.get("cursor_step", 80)))
@@ -527,6 +747,13 @@ class BarbaricUI(tk.Tk):
             except ValueError:
                 idx = None
             barbaric.SETTINGS["mic_device_index"] = idx
+            stt_cfg = barbaric.SETTINGS.setdefault("stt", {})
+            if stt_var.get() != stt_cfg.get("backend"):
+                stt_cfg["backend"] = stt_var.get()
+                try:
+                    barbaric.preload_stt()
+                except Exception:
+                    pass
             barbaric.SETTINGS["theme"] = theme_var.get()
             self.apply_theme(theme_var.get())
             try:
@@ -648,4 +875,14 @@ class BarbaricUI(tk.Tk):
 
 if __name__ == "__main__":
     app = BarbaricUI()
+    if '--bench-startup' in sys.argv:
+        # Launched by barbaric.bench_startup()
+        app.bench_startup_child()
+    if '--bench-ui' in sys.argv:
+        app.after(500, lambda: (app.bench_render(), app.destroy()))
+    if '--viz-wav' in sys.argv[:-1]:
+        # Drive capture and the visualizer from a WAV file: python barbaric_ui.py --viz-wav speech.wav
+        barbaric.use_wav_input(sys.argv[sys.argv.index('--viz-wav') + 1])
+        barbaric.get_audio_capture()
+        app.start_visualizer()
     app.mainloop()
@@ -1,25 +1,63 @@
+import time
+_IMPORT_T0 = time.perf_counter()
 import os
 import speech_recognition as sr
-import pyttsx3
-from cerebras.cloud.sdk import Cerebras
 import subprocess
-import time
 import json
 import platform
 import threading
 import queue
 import ctypes
 from ctypes import wintypes
-import pyautogui
 import importlib.util
+from abc import ABC, abstractmethod
 import types
 import glob
 from pathlib import Path
+from collections import OrderedDict, deque
 import re
+import hashlib
+import heapq
+import difflib
+import sys
+import math
+import array
+
+
+class _LazyModule:
+    """Module stand-in that imports the real one on first attribute access.
+
+    Keeps slow imports (pyautogui pulls in pyscreeze/PIL/pymsgbox) off the
+    startup path; call sites keep using ``pyautogui.click()`` unchanged.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
 
-# Initialize text-to-speech engine (prefer Windows SAPI5) and speaking state
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+pyautogui = _LazyModule('pyautogui')
+
+
+# Text-to-speech engine (prefer Windows SAPI5), created on first use by get_tts_engine()
 def _init_engine():
     try:
+        import pyttsx3
         drv = 'sapi5' if platform.system() == 'Windows' else None
         eng = pyttsx3.init(driverName=drv)
         eng.setProperty('rate', 135)
@@ -43,11 +81,210 @@ def _init_engine():
         print(f"Failed to init pyttsx3: {e}")
         raise
 
-engine = _init_engine()
+engine = None
+# Voice id of the engine, recorded when it is created (read without touching the engine)
+_tts_voice: str | None = None
+
+
+class _EngineThread:
+    """Daemon thread that owns the pyttsx3 engine. pyttsx3 isn't thread-safe and
+    SAPI5 is apartment-threaded, so the engine is created here and every call
+    into it (say, runAndWait, save_to_file, setProperty) is run here as well.
+    The one exception is engine.stop(), which must interrupt runAndWait from outside."""
+
+    def __init__(self):
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _loop(self):
+        while True:
+            fn, done, box = self._q.get()
+            try:
+                box['result'] = fn()
+            except BaseException as e:
+                box['error'] = e
+            finally:
+                done.set()
+
+    def call(self, fn, wait: bool = True):
+        """Run fn on the engine thread; with wait, block for its result (exceptions re-raised)."""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            return fn()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='tts-engine', daemon=True)
+                self._thread.start()
+        done, box = threading.Event(), {}
+        self._q.put((fn, done, box))
+        if not wait:
+            return None
+        done.wait()
+        if 'error' in box:
+            raise box['error']
+        return box.get('result')
+
+
+_engine_thread = _EngineThread()
+
+
+def _create_engine():
+    global engine, _tts_voice
+    if engine is None:
+        eng = _init_engine()
+        try:
+            eng.setProperty('rate', SETTINGS["voice_rate"])
+        except Exception:
+            pass
+        try:
+            _tts_voice = str(eng.getProperty('voice'))
+        except Exception:
+            _tts_voice = ''
+        engine = eng
+    return engine
+
+
+def get_tts_engine():
+    """pyttsx3 engine, initialized on first use (voice enumeration alone can take a second on SAPI5).
+    Only use the returned engine on the engine thread (see _EngineThread)."""
+    if engine is None:
+        _engine_thread.call(_create_engine)
+    return engine
 
 # Signal to coordinate with listeners and UI
 TTS_IS_PLAYING = threading.Event()
 
+
+class AgentStateBus:
+    """Publish/subscribe channel for what the agent is doing.
+
+    Pipeline states (listening, recognizing, thinking, acting, idle, error, ...)
+    come from publish(). Speech is an overlay: speaking(True) shows 'speaking'
+    and speaking(False) restores the pipeline state underneath. Every event
+    carries a sequence number and monotonic/wall timestamps. Subscribers are
+    called on the publishing thread, so they must be quick; attach_tk() wraps
+    one so events reach Tk in a single batched after() callback.
+    """
+
+    STATES = ('idle', 'listening', 'recognizing', 'thinking', 'acting', 'speaking',
+              'ocr_scan', 'success', 'warning', 'error')
+
+    def __init__(self, history: int = 200):
+        self._lock = threading.Lock()
+        self._subscribers: list = []
+        self._seq = 0
+        self._base: tuple[str, str | None] = ('idle', None)
+        self._speaking = False
+        self._current: dict | None = None
+        self.history: deque = deque(maxlen=history)
+        self.time_in_state: dict[str, float] = {}
+        self.delivery: deque = deque(maxlen=200)  # publish -> Tk callback latency (s)
+
+    @property
+    def state(self) -> str:
+        return self._current['state'] if self._current else 'idle'
+
+    @property
+    def pipeline_state(self) -> str:
+        # State underneath the speaking overlay
+        return self._base[0]
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subscribers.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+    def _emit(self, state: str, detail: str | None):
+        # Caller holds the lock; returns the event to deliver (None if nothing changed)
+        cur = self._current
+        if cur is not None and cur['state'] == state and cur['detail'] == detail:
+            return None
+        now = time.monotonic()
+        if cur is not None:
+            self.time_in_state[cur['state']] = self.time_in_state.get(cur['state'], 0.0) + now - cur['t']
+        self._seq += 1
+        event = {'seq': self._seq, 'state': state, 'detail': detail, 't': now, 'wall': time.time(),
+                 'prev': cur['state'] if cur else None, 'since_prev': now - cur['t'] if cur else 0.0}
+        self._current = event
+        self.history.append(event)
+        return event
+
+    def _deliver(self, event):
+        if event is None:
+            return
+        for fn in list(self._subscribers):
+            try:
+                fn(event)
+            except Exception as e:
+                print('State subscriber failed:', e)
+
+    def publish(self, state: str, detail: str | None = None):
+        with self._lock:
+            self._base = (state, detail)
+            event = None if self._speaking and state not in ('error',) else self._emit(state, detail)
+        self._deliver(event)
+
+    def speaking(self, active: bool):
+        with self._lock:
+            if active == self._speaking:
+                return
+            self._speaking = active
+            event = self._emit('speaking', None) if active else self._emit(*self._base)
+        self._deliver(event)
+
+    def attach_tk(self, widget, fn):
+        """Deliver events to fn(events) on the Tk thread, coalescing bursts into one after() call."""
+        pending: deque = deque()
+        lock = threading.Lock()
+        scheduled = [False]
+
+        def _flush():
+            with lock:
+                scheduled[0] = False
+                events = list(pending)
+                pending.clear()
+            if not events:
+                return
+            now = time.monotonic()
+            for e in events:
+                self.delivery.append(now - e['t'])
+            fn(events)
+
+        def _on_event(event):
+            with lock:
+                pending.append(event)
+                if scheduled[0]:
+                    return
+                scheduled[0] = True
+            try:
+                widget.after(0, _flush)
+            except Exception:
+                with lock:
+                    scheduled[0] = False
+        return self.subscribe(_on_event)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            totals = dict(self.time_in_state)
+            cur = self._current
+            if cur is not None:
+                totals[cur['state']] = totals.get(cur['state'], 0.0) + time.monotonic() - cur['t']
+            lat = sorted(self.delivery)
+        return {
+            'time_in_state': totals,
+            'transitions': self._seq,
+            'delivery_ms_mean': (sum(lat) / len(lat) * 1000) if lat else 0.0,
+            'delivery_ms_p95': (lat[int(len(lat) * 0.95)] * 1000) if lat else 0.0,
+        }
+
+
+state_bus = AgentStateBus()
+
 AGENT_NAME = "Barbaric"
 
 # Runtime settings (tunable from UI)
@@ -56,15 +293,174 @@ SETTINGS = {
     "timeout": 6,
     "phrase_time_limit": 16,
     "always_listen": False,
+    # Speech recognition backend: google (online), vosk or whisper (offline, CPU)
+    "stt": {
+        "backend": "google",
+        "fallback": "google",
+        "vosk_model": str(Path(__file__).resolve().parent / 'models' / 'vosk-model-small-en-in-0.4'),
+        "whisper_model": "base.en",
+        "whisper_compute_type": "int8",
+        "threads": 0,
+    },
+    # Keep the mic open and segment utterances with VAD instead of reopening it per turn
+    "continuous_capture": True,
+    "capture": {
+        "sample_rate": 16000,
+        "frame_ms": 30,
+        "pause": 0.8,          # trailing silence that ends an utterance when eou is off (s)
+        "eou": True,           # adapt the pause to how the speech ended (see required_pause)
+        "eou_min_pause": 0.35,
+        "eou_max_pause": 1.1,
+        "eou_fall_ratio": 0.7, # tail/body energy below this counts as trailing off
+        "start_ms": 90,        # voiced audio needed to start one (ms)
+        "min_speech": 0.25,    # shorter bursts are treated as noise (s)
+        "pre_roll": 0.3,       # audio kept from before the onset (s)
+        "energy_ratio": 2.5,   # speech threshold relative to the noise floor
+        "min_energy": 300,
+        "max_age": 8.0,        # drop utterances nobody picked up within this time (s)
+        "idle_timeout": 60.0,  # release the mic after this long without a listener (s)
+        "barge_in": True,      # speaking over the agent interrupts its TTS
+        "barge_in_ms": 250,    # voiced audio needed to count as a barge-in (ms)
+        "echo_ratio": 3.0,     # speech threshold relative to TTS echo during playback
+        "echo_learn": 0.3,     # playback time used to measure the echo before barge-in can trigger (s)
+        "levels": True,        # publish RMS/spectrum band levels for the visualizer
+        "viz_bands": 40,
+    },
     "mic_device_index": None,
     "voice_rate": 135,
+    # pyttsx3 (speak directly), or opt in to pyttsx3_file / gtts (render chunks to files, prefetching the next one)
+    "tts_engine": "pyttsx3",
+    "tts_prefetch": 1,
+    # Speech lanes: urgent > chat > ack; acks are merged or dropped when they pile up
+    "tts_queue": {
+        "max_acks": 3,
+        "ack_ttl": 4.0,
+    },
+    # On-disk audio for recurring phrases (cache/tts), pre-rendered at startup
+    "tts_cache": {
+        "enabled": True,
+        "max_mb": 64,
+        "max_chars": 160,  # longer chunks are one-off output, not worth caching
+        "phrases": [
+            "Hello! I am Barbaric, your smart assistant. How can I help you today?",
+            "I could not find that text on screen.",
+            "I could not read any text from the screen.",
+            "I analyzed the screen and found some text.",
+            "Skills are disabled in settings.",
+            "Performing mouse action: click",
+            "Performing mouse action: double_click",
+            "Performing mouse action: scroll",
+            "Sorry, I could not process the AI response.",
+            "Command cancelled for your safety.",
+            "Workflow cancelled.",
+            "Goodbye!",
+        ],
+    },
     "theme": "dark",
+    # HUD frame rates: while the agent is busy, when idle, and when the window is hidden
+    "ui": {
+        "fps_active": 30,
+        "fps_idle": 8,
+        "fps_hidden": 2,
+    },
+    # Conversation window keeps the newest max_lines; everything is kept in cache/transcript/
+    "transcript": {
+        "max_lines": 2000,
+        "persist": True,
+        "max_bytes": 2 * 1024 * 1024,
+        "backups": 5,
+    },
     # Use provided Tesseract path by default; can be overridden in UI Settings
     "tesseract_cmd": r"D:\\Raghav\\EVOLUTION\\Image to text via tesseract\\tesseract.exe",
     # Default cursor navigation step (pixels) for voice cursor_nav
     "cursor_step": 80,
     # Guard for self-evolution; when true, LLM can update skills files
     "dev_mode": False,
+    # Stream the LLM plan and run each step as soon as it is complete
+    "stream_llm": True,
+    # Run independent plan steps (commands, observe, skills) concurrently; UI input stays ordered
+    "concurrent_steps": True,
+    # Shell commands: hard timeout (s), output kept in memory (KB), spoken progress interval (s),
+    # stop waiting on a command that printed nothing for detach_silent s, say "stop" to cancel.
+    # A silent command keeps running in the background (still timed out, cancellable and logged),
+    # except launches of the gui_apps below, which are left running untracked.
+    "commands": {
+        "timeout": 120,
+        "max_output_kb": 256,
+        "progress_every": 10,
+        "detach_silent": 5,
+        "voice_cancel": True,
+        "gui_apps": ["start", "explorer", "open", "xdg-open", "notepad", "calc", "mspaint", "write",
+                     "wordpad", "code", "chrome", "msedge", "firefox", "winword", "excel", "powerpnt"],
+    },
+    "plan_workers": 4,
+    # Handle simple commands ("grid five", "scroll down") locally without the LLM
+    "intent_router": True,
+    # LLM connection pool / keep-alive tuning (seconds)
+    "llm": {
+        "keepalive_interval": 30.0,
+        "keepalive_expiry": 300.0,
+        "max_connections": 4,
+        "connect_timeout": 5.0,
+        "read_timeout": 60.0,
+        # Send the static system prompt as a content part tagged for provider-side
+        # prompt caching (only for backends that accept `cache_control`)
+        "prompt_cache_marker": False,
+    },
+    # Cache of LLM plans for repeated utterances (persisted in cache/responses.json)
+    "response_cache": {
+        "enabled": True,
+        "max_entries": 256,
+        "ttl": 7 * 24 * 3600,
+        # Only plans made of these actions are cached; "chat" steps (spoken acknowledgements)
+        # may ride along but a chat-only plan is an answer and is never cached
+        "actions": ["key", "window", "grid_nav", "cursor_nav", "mouse", "show_grid", "hide_grid"],
+    },
+    # Screen OCR cache: tile size for change detection (px), how long a snapshot may be
+    # reused without recapturing (s), and how far dirty tiles are grown before re-OCR (px)
+    "ocr": {
+        "tile": 128,
+        "staleness": 1.5,
+        "tile_margin": 8,
+        # OCR backend: "auto" (tesserocr, then tesseract CLI over stdin, then pytesseract),
+        # or one of those names. workers=0 sizes the pool to the CPU (max 4).
+        # tesserocr is optional (pip install tesserocr; needs the Tesseract libraries and,
+        # if they aren't found, tessdata pointing at the folder with eng.traineddata).
+        "engine": "auto",
+        "workers": 0,
+        "lang": "eng",
+        "tessdata": None,
+        # Tiled OCR for big captures: "auto" (regions of at least tiled_min_px),
+        # True/"on", or False/"off"
+        "tiled": "auto",
+        "tiled_size": 1024,
+        "tiled_overlap": 48,
+        "tiled_min_px": 2000000,
+        # Search near the mouse (or the step's cell/region) before OCRing the whole
+        # screen; roi_sizes are the half-heights of the boxes tried (width is 2x)
+        "roi": True,
+        "roi_sizes": [240, 520],
+        # Image clean-up before OCR (needs numpy; skipped without it)
+        "preprocess": {
+            "enabled": True,
+            # Blank out block x block px areas whose grey range is below uniform_range
+            "drop_uniform": True,
+            "block": 16,
+            "uniform_range": 24,
+            "invert_dark": True,
+            # Enlarge text shorter than upscale_below px towards target_height, by at most max_scale
+            "upscale": True,
+            "upscale_below": 12,
+            "target_height": 20,
+            "max_scale": 3.0,
+            # Sauvola threshold: local window (px) and sensitivity k
+            "binarize": True,
+            "window": 31,
+            "k": 0.2,
+        },
+        # Lowest score (0..1) a fuzzy text lookup may return for click/hover/type-at-text
+        "min_match": 0.75,
+    },
     # Runtime feature toggles
     "features": {
         "ocr": True,
@@ -82,14 +478,176 @@ def update_voice_settings(rate: int | None = None):
     try:
         if rate is not None:
             SETTINGS["voice_rate"] = int(rate)
-        engine.setProperty('rate', SETTINGS["voice_rate"])
+        # Not created yet: get_tts_engine() applies the rate when it is
+        if engine is not None:
+            _engine_thread.call(lambda: engine.setProperty('rate', SETTINGS["voice_rate"]), wait=False)
     except Exception:
         pass
 
 API_KEY = os.environ.get("CEREBRAS_API_KEY", "csk-kjdnkhmmcrw4wfced48mjrjmpejewktm2392kx4k3vm2n56c")
 if not API_KEY:
     raise ValueError("Missing Cerebras API key.")
-client = Cerebras(api_key=API_KEY)
+
+
+# ===== LLM client session (pooled, pre-warmed, keep-alive) =====
+# Timings of the most recent LLM request (seconds, relative to request start)
+LAST_LLM_TIMING: dict[str, float] = {}
+
+
+class LLMSession:
+    """Owns the Cerebras client and keeps its HTTP connection warm.
+
+    The SDK is built on a pooled httpx client with a long keep-alive so idle
+    gaps between utterances don't force a new TCP/TLS handshake. `start()`
+    pre-connects in the background and launches a ping thread that touches the
+    API whenever the connection has been idle for `keepalive_interval` seconds.
+    Per-request timings (connect, headers, ttfb, total) end up in LAST_LLM_TIMING.
+    """
+
+    def __init__(self, api_key: str | None = None, sdk=None):
+        self.api_key = api_key
+        self._sdk = sdk
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_used = 0.0
+        self._started = False
+        self._stop = threading.Event()
+        self.stats = {"requests": 0, "cold_connects": 0, "pings": 0, "ping_failures": 0}
+
+    # --- construction ---
+    def _build(self):
+        cfg = SETTINGS.get("llm", {})
+        # Imported here: the SDK (httpx, pydantic models) is a large share of import time
+        Cerebras = self._sdk_class()
+        try:
+            import httpx
+            session = self
+
+            class _TimedTransport(httpx.HTTPTransport):
+                def handle_request(self, request):
+                    rec = session._begin_record()
+                    t0 = time.perf_counter()
+                    prev = request.extensions.get('trace')
+
+                    def trace(name, info):
+                        now = time.perf_counter() - t0
+                        if name == 'connection.connect_tcp.started':
+                            rec['_connect_start'] = now
+                        elif name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                            if 'connect' not in rec:
+                                session.stats["cold_connects"] += 1
+                            rec['connect'] = now - rec.get('_connect_start', 0.0)
+                        elif name.endswith('receive_response_headers.complete'):
+                            rec['headers'] = now
+                        if prev:
+                            prev(name, info)
+                    request.extensions['trace'] = trace
+                    return super().handle_request(request)
+
+            limits = httpx.Limits(
+                max_connections=int(cfg.get("max_connections", 4)),
+                max_keepalive_connections=int(cfg.get("max_connections", 4)),
+                keepalive_expiry=float(cfg.get("keepalive_expiry", 300.0)),
+            )
+            http = httpx.Client(
+                transport=_TimedTransport(limits=limits, retries=1),
+                timeout=httpx.Timeout(float(cfg.get("read_timeout", 60.0)), connect=float(cfg.get("connect_timeout", 5.0))),
+            )
+            return Cerebras(api_key=self.api_key, http_client=http)
+        except Exception as e:
+            print(f"Pooled LLM client unavailable, using default client: {e}")
+            return Cerebras(api_key=self.api_key)
+
+    @staticmethod
+    def _sdk_class():
+        from cerebras.cloud.sdk import Cerebras
+        return Cerebras
+
+    def _ensure(self):
+        if self._sdk is None:
+            with self._lock:
+                if self._sdk is None:
+                    self._sdk = self._build()
+        return self._sdk
+
+    @property
+    def sdk(self):
+        """Client for a user request (marks the connection as recently used)."""
+        sdk = self._ensure()
+        self._last_used = time.monotonic()
+        self.stats["requests"] += 1
+        self._local.rec = {}
+        return sdk
+
+    # --- timing ---
+    def _begin_record(self) -> dict:
+        rec: dict = {}
+        self._local.rec = rec
+        return rec
+
+    def request_timing(self) -> dict:
+        """Transport-level timings of the last request made on this thread (connect is 0 on a pooled connection)."""
+        rec = getattr(self._local, 'rec', None) or {}
+        out = {k: v for k, v in rec.items() if not k.startswith('_')}
+        out.setdefault('connect', 0.0)
+        return out
+
+    # --- warm-up and keep-alive ---
+    def ping(self) -> bool:
+        """Cheap authenticated request that (re)opens the pooled connection."""
+        sdk = self._ensure()
+        models = getattr(sdk, 'models', None)
+        if models is None:
+            return False
+        try:
+            models.list()
+            self.stats["pings"] += 1
+            self._last_used = time.monotonic()
+            return True
+        except Exception as e:
+            self.stats["ping_failures"] += 1
+            print('LLM keep-alive ping failed:', e)
+            return False
+
+    def warm(self) -> bool:
+        return self.ping()
+
+    def start(self):
+        """Pre-connect and start the keep-alive thread (idempotent, non-blocking)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._keepalive_loop, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _keepalive_loop(self):
+        self.warm()
+        while not self._stop.is_set():
+            interval = float(SETTINGS.get("llm", {}).get("keepalive_interval", 30.0))
+            if interval <= 0:
+                self._stop.wait(5.0)
+                continue
+            idle = time.monotonic() - self._last_used
+            if idle >= interval:
+                self.ping()
+                idle = 0.0
+            self._stop.wait(max(1.0, interval - idle))
+
+
+llm_session = LLMSession(API_KEY)
+
+
+def get_llm():
+    return llm_session.sdk
+
+
+def warm_up_llm():
+    """Pre-connect the LLM client in the background and keep it alive."""
+    llm_session.start()
+
 
 recognizer = sr.Recognizer()
 recognizer.dynamic_energy_threshold = True
@@ -102,63 +660,553 @@ def get_microphone():
     return sr.Microphone(device_index=SETTINGS["mic_device_index"]) if SETTINGS["mic_device_index"] is not None else sr.Microphone()
 
 # TTS worker to serialize audio output across threads
-_tts_queue: "queue.Queue[str]" = queue.Queue()
+class TTSScheduler:
+    """Priority queue for speech with three lanes: urgent (errors, warnings,
+    confirmations), chat (replies) and ack (action acknowledgements).
+
+    Higher lanes always speak first. Acks are the only thing allowed to go
+    stale: when more than `tts_queue.max_acks` are waiting the oldest are
+    dropped, acks older than `tts_queue.ack_ttl` seconds are skipped, and acks
+    still waiting together are merged into one utterance. Exposes the same
+    put/get/task_done/join calls as queue.Queue for the worker.
+    """
+
+    LANES = {'urgent': 0, 'chat': 1, 'ack': 2}
+
+    def __init__(self):
+        self._cv = threading.Condition()
+        self._heap: list = []
+        self._seq = 0
+        self._unfinished = 0
+        self.dropped = 0
+        self.merged = 0
+        self._waits: dict[str, deque] = {lane: deque(maxlen=100) for lane in self.LANES}
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("tts_queue", {})
+
+    def put(self, item, lane: str = 'chat'):
+        with self._cv:
+            if item is None:
+                heapq.heappush(self._heap, (-1, self._seq, 'stop', None))
+            else:
+                lane = lane if lane in self.LANES else 'chat'
+                heapq.heappush(self._heap, (self.LANES[lane], self._seq, lane, item))
+                self._unfinished += 1
+                self._trim_acks()
+            self._seq += 1
+            self._cv.notify()
+
+    def _trim_acks(self):
+        limit = int(self._cfg().get("max_acks", 3))
+        acks = sorted(e for e in self._heap if e[2] == 'ack')
+        excess = len(acks) - max(0, limit)
+        if excess > 0:
+            stale = set(id(e) for e in acks[:excess])
+            self._heap = [e for e in self._heap if id(e) not in stale]
+            heapq.heapify(self._heap)
+            self.dropped += excess
+            self._unfinished -= excess
+            self._cv.notify_all()
+
+    def get(self):
+        ttl = float(self._cfg().get("ack_ttl", 4.0))
+        with self._cv:
+            while True:
+                while not self._heap:
+                    self._cv.wait()
+                prio, _seq, lane, item = heapq.heappop(self._heap)
+                if item is None:
+                    return None
+                wait = time.perf_counter() - item[2]
+                if lane == 'ack' and ttl > 0 and wait > ttl:
+                    self.dropped += 1
+                    self._finish_one()
+                    continue
+                self._waits[lane].append(wait)
+                if lane != 'ack':
+                    return item
+                # Fold every other waiting ack into this one
+                rest = sorted(e for e in self._heap if e[2] == 'ack')
+                if not rest:
+                    return item
+                self._heap = [e for e in self._heap if e[2] != 'ack']
+                heapq.heapify(self._heap)
+                prefix = f"{AGENT_NAME} says: "
+                texts = [item[1]] + [e[3][1].replace(prefix, '', 1) for e in rest]
+                self.merged += len(rest)
+                for _ in rest:
+                    self._finish_one()
+                joined = '. '.join(t.rstrip('. ') for t in texts) + '.'
+                return (item[0], joined, item[2])
+
+    def _finish_one(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._cv.notify_all()
+
+    def task_done(self):
+        with self._cv:
+            self._finish_one()
+
+    def join(self):
+        with self._cv:
+            while self._unfinished > 0:
+                self._cv.wait()
+
+    def clear(self):
+        """Drop everything queued (used on barge-in)."""
+        with self._cv:
+            n = sum(1 for e in self._heap if e[3] is not None)
+            self._heap = [e for e in self._heap if e[3] is None]
+            heapq.heapify(self._heap)
+            for _ in range(n):
+                self._finish_one()
+
+    def metrics(self) -> dict:
+        with self._cv:
+            depth = {lane: 0 for lane in self.LANES}
+            for e in self._heap:
+                if e[2] in depth:
+                    depth[e[2]] += 1
+            waits = {lane: (sum(w) / len(w) if w else 0.0) for lane, w in self._waits.items()}
+            max_waits = {lane: (max(w) if w else 0.0) for lane, w in self._waits.items()}
+        return {'depth': depth, 'wait_avg': waits, 'wait_max': max_waits, 'dropped': self.dropped, 'merged': self.merged}
+
+
+_tts_queue = TTSScheduler()
 _tts_lock = threading.Lock()
+# Bumped by cancel_speech(); queued or playing text from an older generation is dropped
+_tts_generation = 0
+# Per-utterance timings: queue wait, time to first audio, total (seconds)
+TTS_TIMINGS: "deque[dict]" = deque(maxlen=50)
+
+
+def _tts_cancelled(gen: int) -> bool:
+    return gen != _tts_generation
+
+
+def _speak_chunks(text: str, gen: int, timing: dict | None = None):
+    # Runs on the engine thread (see _tts_worker).
+    # One runAndWait per chunk so a barge-in can stop between (and, via engine.stop(), within) chunks
+    t0 = time.perf_counter()
+    token = None
+    engine = get_tts_engine()
+    if timing is not None:
+        def _on_start(name=None):
+            timing.setdefault('first_audio', time.perf_counter() - t0)
+        try:
+            token = engine.connect('started-utterance', _on_start)
+        except Exception:
+            token = None
+    try:
+        for chunk in _split_into_tts_chunks(text):
+            if _tts_cancelled(gen):
+                return
+            if not chunk:
+                continue
+            cached = tts_audio_cache.get(chunk, 'pyttsx3')
+            if cached and _play_audio_file(cached, should_stop=lambda: _tts_cancelled(gen)):
+                if timing is not None:
+                    timing.setdefault('first_audio', time.perf_counter() - t0)
+                continue
+            engine.say(chunk)
+            engine.runAndWait()
+    finally:
+        if token is not None:
+            try:
+                engine.disconnect(token)
+            except Exception:
+                pass
+
+
+# --- File-based synthesis: render chunk N+1 while chunk N plays ---
+def _tts_tmp_path(suffix: str) -> str:
+    import tempfile
+    fd, path = tempfile.mkstemp(prefix='barbaric_tts_', suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def _synth_pyttsx3_file(chunk: str) -> str:
+    path = _tts_tmp_path('.wav')
+
+    def _render():
+        eng = get_tts_engine()
+        eng.save_to_file(chunk, path)
+        eng.runAndWait()
+    with _tts_lock:
+        _engine_thread.call(_render)
+    if os.path.getsize(path) <= 44:
+        raise RuntimeError('pyttsx3 produced no audio')
+    return path
+
+
+def _synth_gtts(chunk: str) -> str:
+    from gtts import gTTS
+    path = _tts_tmp_path('.mp3')
+    gTTS(text=chunk, lang='en').save(path)
+    return path
+
+
+_TTS_SYNTHESIZERS = {
+    'pyttsx3_file': _synth_pyttsx3_file,
+    'gtts': _synth_gtts,
+}
+
+
+# --- Content-addressed cache of synthesized phrases ---
+class TTSAudioCache:
+    """On-disk audio for recurring phrases, keyed on engine, voice, rate and text.
+
+    Files live in cache/tts/ named by the SHA-1 of the key; their mtime doubles
+    as the LRU clock, and the oldest files are evicted once the directory grows
+    past SETTINGS['tts_cache']['max_mb']. Lookups never create the pyttsx3
+    engine: its voice is read only once the engine exists and is remembered in
+    cache/tts/voice.txt for the next session.
+    """
+
+    _EXT = {'pyttsx3': '.wav', 'gtts': '.mp3'}
+
+    def __init__(self, root: Path | None = None):
+        self._root = root
+        self._lock = threading.Lock()
+        self._sizes: dict[str, int] | None = None
+        self._voice: str | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = cache_dir() / 'tts'
+        return self._root
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("tts_cache", {})
+
+    def enabled_for(self, chunk: str) -> bool:
+        cfg = self._cfg()
+        return bool(cfg.get("enabled", True)) and 0 < len(chunk) <= int(cfg.get("max_chars", 160))
+
+    def _voice_key(self, kind: str) -> str:
+        if kind != 'pyttsx3':
+            return ''  # gTTS has a single voice per language
+        if engine is not None:
+            voice = _tts_voice or ''
+            if voice and voice != self._voice:
+                self._voice = voice
+                try:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    (self.root / 'voice.txt').write_text(voice, encoding='utf-8')
+                except Exception:
+                    pass
+            return voice
+        if self._voice is None:
+            try:
+                self._voice = (self.root / 'voice.txt').read_text(encoding='utf-8').strip()
+            except Exception:
+                self._voice = ''
+        return self._voice
+
+    def _path(self, chunk: str, kind: str) -> Path:
+        key = f"{kind}|{self._voice_key(kind)}|{SETTINGS.get('voice_rate')}|{chunk}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.root / (digest + self._EXT.get(kind, '.wav'))
+
+    def _index(self) -> dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            try:
+                for p in self.root.glob('*.*'):
+                    if p.suffix in self._EXT.values():
+                        self._sizes[str(p)] = p.stat().st_size
+            except Exception:
+                pass
+        return self._sizes
+
+    def owns(self, path: str) -> bool:
+        try:
+            return Path(path).resolve().parent == self.root.resolve()
+        except Exception:
+            return False
+
+    def get(self, chunk: str, kind: str) -> str | None:
+        if not self.enabled_for(chunk):
+            return None
+        p = self._path(chunk, kind)
+        if p.exists():
+            try:
+                os.utime(p, None)
+            except Exception:
+                pass
+            self.hits += 1
+            return str(p)
+        self.misses += 1
+        return None
+
+    def put(self, chunk: str, kind: str, src: str) -> str:
+        """Move a freshly synthesized file into the cache and return its cached path."""
+        if not self.enabled_for(chunk):
+            return src
+        dst = self._path(chunk, kind)
+        with self._lock:
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                os.replace(src, dst)
+            except Exception as e:
+                print('TTS cache store failed:', e)
+                return src
+            self._index()[str(dst)] = dst.stat().st_size
+            self._evict()
+        return str(dst)
+
+    def _evict(self):
+        cap = float(self._cfg().get("max_mb", 64)) * 1024 * 1024
+        sizes = self._index()
+        total = sum(sizes.values())
+        if total <= cap:
+            return
+        def _mtime(p):
+            try:
+                return os.path.getmtime(p)
+            except Exception:
+                return 0.0
+        for p in sorted(sizes, key=_mtime):
+            if total <= cap * 0.9:
+                break
+            try:
+                os.remove(p)
+            except Exception:
+                pass
+            total -= sizes.pop(p, 0)
+
+    def stats(self) -> dict:
+        sizes = self._index()
+        return {'files': len(sizes), 'bytes': sum(sizes.values()), 'hits': self.hits, 'misses': self.misses}
+
+
+tts_audio_cache = TTSAudioCache()
+
+
+def _synth_cached(chunk: str, mode: str) -> str:
+    kind = 'gtts' if mode == 'gtts' else 'pyttsx3'
+    hit = tts_audio_cache.get(chunk, kind)
+    if hit:
+        return hit
+    path = _TTS_SYNTHESIZERS[mode](chunk)
+    return tts_audio_cache.put(chunk, kind, path)
+
+
+def prerender_phrases(phrases: list[str] | None = None, background: bool = True):
+    """Synthesize the configured recurring phrases into the audio cache ahead of time."""
+    def _run():
+        mode = SETTINGS.get("tts_engine", "pyttsx3")
+        if mode not in _TTS_SYNTHESIZERS:
+            mode = 'pyttsx3_file'
+        done = 0
+        for phrase in phrases if phrases is not None else SETTINGS.get("tts_cache", {}).get("phrases", []):
+            for chunk in _split_into_tts_chunks(_tts_text(phrase)):
+                if not chunk or not tts_audio_cache.enabled_for(chunk):
+                    continue
+                try:
+                    _synth_cached(chunk, mode)
+                    done += 1
+                except Exception as e:
+                    print('Phrase pre-render failed:', e)
+                    return
+        print(f'[Barbaric] Pre-rendered {done} phrase chunks.')
+    if background:
+        threading.Thread(target=_run, daemon=True).start()
+    else:
+        _run()
+
+
+def _speak_pipelined(text: str, gen: int, mode: str, timing: dict):
+    """Synthesize chunks on a producer thread (up to `tts_prefetch` ahead) while this thread plays them.
+
+    Cached phrases skip synthesis entirely. A chunk that fails to synthesize or play is
+    spoken directly by pyttsx3; if that fails too it is skipped and the rest still plays.
+    """
+    chunks = [c for c in _split_into_tts_chunks(text) if c]
+    ready: "queue.Queue[tuple[str, str | None] | None]" = queue.Queue(maxsize=max(1, int(SETTINGS.get("tts_prefetch", 1))))
+    stop = threading.Event()  # set when the consumer leaves, so the producer never blocks on a full queue
+    t0 = time.perf_counter()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _discard(path):
+        if path and not tts_audio_cache.owns(path):
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+    def _produce():
+        try:
+            for chunk in chunks:
+                if _tts_cancelled(gen) or stop.is_set():
+                    break
+                try:
+                    path = _synth_cached(chunk, mode)
+                except Exception as e:
+                    print(f"TTS synthesis failed ({e}); speaking chunk directly.")
+                    path = None
+                if not _put((chunk, path)):
+                    _discard(path)
+                    break
+        finally:
+            _put(None)
+
+    threading.Thread(target=_produce, daemon=True).start()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            chunk, path = item
+            try:
+                if _tts_cancelled(gen):
+                    continue
+                timing.setdefault('first_audio', time.perf_counter() - t0)
+                played = False
+                if path is not None:
+                    try:
+                        played = _play_audio_file(path, should_stop=lambda: _tts_cancelled(gen))
+                    except Exception as e:
+                        print(f"TTS playback failed ({e}); speaking chunk directly.")
+                if not played:
+                    def _say(c=chunk):
+                        eng = get_tts_engine()
+                        eng.say(c)
+                        eng.runAndWait()
+                    try:
+                        with _tts_lock:
+                            _engine_thread.call(_say)
+                    except Exception as e:
+                        print(f"TTS fallback failed ({e}); skipping chunk.")
+            finally:
+                _discard(path)
+    finally:
+        stop.set()
+        # Drop whatever the producer had already queued
+        while True:
+            try:
+                item = ready.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                _discard(item[1])
+
 
 def _tts_worker():
     while True:
-        text = _tts_queue.get()
-        if text is None:
+        item = _tts_queue.get()
+        if item is None:
             break
+        gen, text, queued_at = item
+        mode = SETTINGS.get("tts_engine", "pyttsx3")
+        timing = {'engine': mode, 'queue_wait': time.perf_counter() - queued_at, 'chars': len(text)}
+        t0 = time.perf_counter()
         try:
+            if _tts_cancelled(gen):
+                timing['cancelled'] = True
+                continue
             # Mark speaking and guard the engine
             TTS_IS_PLAYING.set()
+            state_bus.speaking(True)
+            if mode in _TTS_SYNTHESIZERS:
+                _speak_pipelined(text, gen, mode, timing)
+                continue
             with _tts_lock:
                 try:
-                    for chunk in _split_into_tts_chunks(text):
-                        if not chunk:
-                            continue
-                        engine.say(chunk)
-                    engine.runAndWait()
+                    _engine_thread.call(lambda: _speak_chunks(text, gen, timing))
                 except Exception as inner:
                     # Reinitialize engine once and retry
                     print(f"pyttsx3 failed, restarting engine: {inner}")
-                    try:
-                        globals()['engine'] = _init_engine()
-                        for chunk in _split_into_tts_chunks(text):
-                            if not chunk:
-                                continue
-                            engine.say(chunk)
-                        engine.runAndWait()
-                    except Exception as inner2:
-                        raise inner2
+
+                    def _retry():
+                        globals()['engine'] = None
+                        _create_engine()
+                        _speak_chunks(text, gen, timing)
+                    _engine_thread.call(_retry)
         except Exception as e:
             print(f"pyttsx3 failed: {e}. Trying gTTS fallback...")
             try:
-                from gtts import gTTS
-                temp_path = "barbaric_tts_fallback.mp3"
-                gTTS(text=text, lang='en').save(temp_path)
-                _play_mp3_windows(temp_path)
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+                timing['engine'] = 'gtts'
+                _speak_pipelined(text, gen, 'gtts', timing)
             except Exception as e2:
                 print(f"gTTS fallback also failed: {e2}")
         finally:
+            timing['total'] = time.perf_counter() - t0
+            if _tts_cancelled(gen):
+                timing['cancelled'] = True
+            TTS_TIMINGS.append(timing)
             TTS_IS_PLAYING.clear()
+            if not any(_tts_queue.metrics()['depth'].values()):
+                state_bus.speaking(False)
             _tts_queue.task_done()
 
-_tts_thread = threading.Thread(target=_tts_worker, daemon=True)
-_tts_thread.start()
+_tts_thread: threading.Thread | None = None
+_tts_thread_lock = threading.Lock()
+
+
+def _ensure_tts_thread():
+    # Started by the first speak() or the background warm-up, not at import
+    global _tts_thread
+    if _tts_thread is None:
+        with _tts_thread_lock:
+            if _tts_thread is None:
+                t = threading.Thread(target=_tts_worker, daemon=True)
+                t.start()
+                _tts_thread = t
+
 
-def speak(text):
+def cancel_speech():
+    """Stop the current utterance and drop everything queued (barge-in)."""
+    global _tts_generation
+    _tts_generation += 1
+    _tts_queue.clear()
+    if TTS_IS_PLAYING.is_set() and engine is not None:
+        try:
+            engine.stop()
+        except Exception:
+            pass
+
+def _tts_text(text: str) -> str:
     # Always prefix with agent name for clarity
     if SETTINGS.get("features", {}).get("tts_prefix", True):
         if AGENT_NAME.lower() not in text.lower():
             text = f"{AGENT_NAME} says: {text}"
+    return text
+
+
+def speak(text, priority: str = 'chat'):
+    """Queue text for speech. priority: 'urgent' (errors/confirmations), 'chat' or 'ack'."""
+    text = _tts_text(text)
+    _ensure_tts_thread()
     # Send as a single TTS unit to avoid choppy audio; worker handles splitting
-    _tts_queue.put(text)
+    _tts_queue.put((_tts_generation, text, time.perf_counter()), lane=priority)
+
+
+def tts_busy() -> bool:
+    """True while the agent is speaking or has speech queued."""
+    return TTS_IS_PLAYING.is_set() or any(_tts_queue.metrics()['depth'].values())
+
+
+def tts_queue_metrics() -> dict:
+    """Queue depth per lane, average/max wait (s), dropped and merged acknowledgements."""
+    return _tts_queue.metrics()
 
 
 def _split_into_tts_chunks(text: str, max_len: int = 180) -> list[str]:
@@ -201,12 +1249,13 @@ def _split_into_tts_chunks(text: str, max_len: int = 180) -> list[str]:
 
 
 # --- Windows-native MP3 playback via winmm (MCI) ---
-def _play_mp3_windows(path: str):
+def _play_mp3_windows(path: str, should_stop=None):
     if platform.system() != 'Windows':
         return
     mciSendString = ctypes.windll.winmm.mciSendStringW
     alias = f"barbaric_mp3"
-    cmd = f'open "{path}" type mpegvideo alias {alias}'
+    kind = 'waveaudio' if path.lower().endswith('.wav') else 'mpegvideo'
+    cmd = f'open "{path}" type {kind} alias {alias}'
     mciSendString(cmd, None, 0, None)
     mciSendString(f'play {alias}', None, 0, None)
     # Wait until done
@@ -214,100 +1263,1225 @@ def _play_mp3_windows(path: str):
     while True:
         mciSendString(f'status {alias} mode', status_buf, 128, None)
         mode = status_buf.value.strip()
-        if mode in ("stopped", "not ready"):
+        if mode in ("stopped", "not ready", ""):
+            break
+        if should_stop is not None and should_stop():
+            mciSendString(f'stop {alias}', None, 0, None)
             break
         time.sleep(0.05)
     mciSendString(f'close {alias}', None, 0, None)
 
-def listen():
-    # Avoid listening while TTS is speaking to prevent feedback and timeouts
-    if TTS_IS_PLAYING.is_set():
-        # Wait briefly for TTS to finish instead of immediately bailing
-        waited = 0.0
-        while TTS_IS_PLAYING.is_set() and waited < 3.0:
-            time.sleep(0.05)
-            waited += 0.05
-        if TTS_IS_PLAYING.is_set():
-            return ''
 
-    with get_microphone() as source:
-        print('Listening...')
-        # Quick ambient calibration (int seconds for type-checkers)
-        recognizer.adjust_for_ambient_noise(source, duration=1)
-        try:
-            audio = recognizer.listen(source, timeout=SETTINGS["timeout"], phrase_time_limit=SETTINGS["phrase_time_limit"])
-        except sr.WaitTimeoutError:
-            print('Listening timed out while waiting for speech.')
-            # Do not speak here to avoid spamming UI; return quietly
-            return ''
-        try:
-            # Try Google with alternatives and choose the longest/best
-            recog = getattr(recognizer, "recognize_google")  # type: ignore[attr-defined]
-            result_all = recog(audio, language=SETTINGS["language"], show_all=True)  # type: ignore[call-arg]
-            candidate = ''
-            if isinstance(result_all, dict) and 'alternative' in result_all:
-                alts = result_all.get('alternative') or []
-                # Prefer transcript with highest confidence/longest length
-                def score(alt):
-                    txt = (alt.get('transcript') or '').strip()
-                    conf = alt.get('confidence', 0.0)
-                    return (conf, len(txt))
-                if alts:
-                    best = max(alts, key=score)
-                    candidate = (best.get('transcript') or '').strip()
-            if not candidate:
-                candidate = recog(audio, language=SETTINGS["language"])  # type: ignore[attr-defined]
-            candidate = (candidate or '').strip()
-            # If result seems too short, attempt a brief follow-up capture to complete it
-            if len(candidate.split()) < 4:
-                try:
-                    audio2 = recognizer.listen(source, timeout=1.2, phrase_time_limit=3)
-                    result2 = recog(audio2, language=SETTINGS["language"])  # type: ignore[attr-defined]
-                    if result2:
-                        candidate = (candidate + ' ' + result2).strip()
-                except Exception:
-                    pass
-            print(f'You said: {candidate}')
-            return candidate
-        except sr.UnknownValueError:
-            print('Sorry, I did not understand.')
+def _play_audio_file(path: str, should_stop=None) -> bool:
+    """Play a WAV/MP3 file to completion (or until should_stop()); False if no player is available."""
+    if platform.system() == 'Windows':
+        _play_mp3_windows(path, should_stop=should_stop)
+        return True
+    import shutil
+    if path.lower().endswith('.wav'):
+        candidates = [['afplay', path], ['aplay', '-q', path], ['paplay', path]]
+    else:
+        candidates = [['afplay', path], ['mpg123', '-q', path], ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', path]]
+    for cmd in candidates:
+        if shutil.which(cmd[0]):
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            while proc.poll() is None:
+                if should_stop is not None and should_stop():
+                    proc.terminate()
+                    break
+                time.sleep(0.05)
+            return True
+    return False
+
+# ===== Continuous audio capture with voice-activity detection =====
+def _frame_rms(frame: bytes, width: int = 2) -> float:
+    """Root-mean-square level of a little-endian PCM frame."""
+    if not frame:
+        return 0.0
+    if width == 2:
+        samples = array.array('h')
+        samples.frombytes(frame[:len(frame) - (len(frame) % 2)])
+        if sys.byteorder != 'little':
+            samples.byteswap()
+    elif width == 1:
+        samples = array.array('b', bytes((b - 128) & 0xFF for b in frame))
+    else:
+        # 24/32-bit input: use the most significant 16 bits of each sample
+        samples = array.array('h', [int.from_bytes(frame[i + width - 2:i + width], 'little', signed=True)
+                                    for i in range(0, len(frame) - width + 1, width)])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class WavAudioSource:
+    """Audio source that streams a WAV file frame by frame (stands in for the microphone).
+
+    With `realtime=True` reads are paced like a live device; otherwise the file is
+    consumed as fast as possible, which is what tests and benchmarks want.
+    """
+
+    def __init__(self, path, frame_ms: int = 30, realtime: bool = False):
+        import wave
+        self._wav = wave.open(str(path), 'rb')
+        if self._wav.getnchannels() != 1:
+            raise ValueError('WavAudioSource expects mono audio')
+        self.SAMPLE_RATE = self._wav.getframerate()
+        self.SAMPLE_WIDTH = self._wav.getsampwidth()
+        self.CHUNK = max(1, int(self.SAMPLE_RATE * frame_ms / 1000))
+        self.realtime = realtime
+
+    def read(self, n_frames: int | None = None) -> bytes:
+        n = n_frames or self.CHUNK
+        data = self._wav.readframes(n)
+        if self.realtime and data:
+            time.sleep(n / float(self.SAMPLE_RATE))
+        return data
+
+    def close(self):
+        try:
+            self._wav.close()
+        except Exception:
+            pass
+
+
+class _MicrophoneSource:
+    """Keeps one sr.Microphone stream open and exposes the same read() API as WavAudioSource."""
+
+    def __init__(self, device_index=None, frame_ms: int = 30):
+        rate = int(SETTINGS.get("capture", {}).get("sample_rate", 16000))
+        chunk = max(1, int(rate * frame_ms / 1000))
+        kwargs = {'sample_rate': rate, 'chunk_size': chunk}
+        if device_index is not None:
+            kwargs['device_index'] = device_index
+        self._mic = sr.Microphone(**kwargs)
+        self._src = self._mic.__enter__()
+        self.SAMPLE_RATE = self._src.SAMPLE_RATE
+        self.SAMPLE_WIDTH = self._src.SAMPLE_WIDTH
+        self.CHUNK = self._src.CHUNK
+
+    def read(self, n_frames: int | None = None) -> bytes:
+        return self._src.stream.read(n_frames or self.CHUNK)
+
+    def close(self):
+        try:
+            self._mic.__exit__(None, None, None)
+        except Exception:
+            pass
+
+
+class VoiceActivitySegmenter:
+    """Energy-based VAD that turns a stream of PCM frames into utterance segments.
+
+    The noise floor is tracked continuously from non-speech frames, so the speech
+    threshold follows the room without a blocking calibration step. A segment
+    starts after `start_ms` of voiced audio (plus `pre_roll` seconds kept from
+    before the onset) and ends when end_of_utterance() decides the speaker is
+    done, or when it hits the phrase time limit.
+    """
+
+    def __init__(self, sample_rate: int, sample_width: int, frame_samples: int):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.frame_sec = frame_samples / float(sample_rate)
+        self.noise_floor: float | None = None
+        self.in_speech = False
+        self.level = 0.0
+        self._frames: list[bytes] = []
+        self._pre: deque = deque()
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._speech_frames = 0
+        self._flagged = False
+        self._voiced_levels: list[float] = []
+        # Level of our own TTS leaking into the mic, tracked only during playback
+        self.echo_floor: float | None = None
+        self.barged_in = False
+        self._play_frames = 0
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("capture", {})
+
+    def threshold(self) -> float:
+        cfg = self._cfg()
+        floor = self.noise_floor if self.noise_floor is not None else 0.0
+        return max(float(cfg.get("min_energy", 300)), floor * float(cfg.get("energy_ratio", 2.5)))
+
+    def _update_floor(self, rms: float):
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        else:
+            self.noise_floor = self.noise_floor * 0.95 + rms * 0.05
+
+    def flag(self):
+        """Mark the segment in progress (e.g. it overlapped our own TTS)."""
+        if self.in_speech:
+            self._flagged = True
+
+    def feed(self, frame: bytes, playback: bool = False) -> tuple[bytes, bool, dict] | None:
+        """Consume one frame; returns (pcm, flagged, meta) when an utterance just ended.
+
+        `playback` means our TTS is audible: the speech threshold is then raised above
+        the measured echo level and onset needs `barge_in_ms` of voice, so only the
+        user talking over the agent starts a segment (and sets `barged_in`).
+        """
+        cfg = self._cfg()
+        rms = _frame_rms(frame, self.sample_width)
+        self.level = rms
+        thr = self.threshold()
+        start_ms = float(cfg.get("start_ms", 90))
+        learning = False
+        if playback:
+            self._play_frames += 1
+            # The first moments of playback only measure how loud the echo is
+            learning = self._play_frames * self.frame_sec < float(cfg.get("echo_learn", 0.3))
+            if learning and not self.in_speech:
+                self.echo_floor = rms if self.echo_floor is None else self.echo_floor * 0.7 + rms * 0.3
+            if self.echo_floor is not None:
+                thr = max(thr, self.echo_floor * float(cfg.get("echo_ratio", 3.0)))
+            start_ms = max(start_ms, float(cfg.get("barge_in_ms", 250)))
+        else:
+            self._play_frames = 0
+        voiced = rms >= thr and not (learning and not self.in_speech)
+        pre_n = max(1, int(float(cfg.get("pre_roll", 0.3)) / self.frame_sec))
+        if not self.in_speech:
+            self._pre.append(frame)
+            while len(self._pre) > pre_n:
+                self._pre.popleft()
+            if voiced:
+                self._voiced_run += 1
+                if self._voiced_run * self.frame_sec >= start_ms / 1000.0:
+                    self.in_speech = True
+                    self.barged_in = playback
+                    self._frames = list(self._pre)
+                    self._pre.clear()
+                    self._silent_run = 0
+                    self._speech_frames = self._voiced_run
+                    self._voiced_levels = [rms]
+            else:
+                self._voiced_run = 0
+                if playback:
+                    if not learning:
+                        self.echo_floor = self.echo_floor * 0.9 + rms * 0.1 if self.echo_floor is not None else rms
+                else:
+                    self._update_floor(rms)
+            return None
+        self._frames.append(frame)
+        if voiced:
+            self._silent_run = 0
+            self._speech_frames += 1
+            self._voiced_levels.append(rms)
+        else:
+            self._silent_run += 1
+        silence = self._silent_run * self.frame_sec
+        length = len(self._frames) * self.frame_sec
+        limit = float(SETTINGS.get("phrase_time_limit", 16) or 0)
+        if silence >= self.required_pause() or (limit and length >= limit):
+            return self._finish()
+        return None
+
+    def required_pause(self) -> float:
+        """Trailing silence needed before the utterance counts as finished.
+
+        With `eou` on, the wait adapts to how the speech ended: a falling energy
+        contour at the end of a phrase usually means the speaker is done, while an
+        abrupt stop (or a very short burst like "scroll ...") is more often a
+        mid-sentence pause, so those get extra patience instead of a second capture.
+        """
+        cfg = self._cfg()
+        if not cfg.get("eou", True):
+            return float(cfg.get("pause", 0.8))
+        need = float(cfg.get("eou_min_pause", 0.35))
+        levels = self._voiced_levels
+        k = max(1, min(len(levels) // 4, int(0.2 / self.frame_sec)))
+        if len(levels) > k:
+            tail = sum(levels[-k:]) / k
+            body = sum(levels[:-k]) / (len(levels) - k)
+            if tail > body * float(cfg.get("eou_fall_ratio", 0.7)):
+                need += 0.35  # no trail-off: probably mid-phrase
+        else:
+            need += 0.35
+        if self._speech_frames * self.frame_sec < 1.0:
+            need += 0.25
+        return min(need, float(cfg.get("eou_max_pause", 1.1)))
+
+    def _finish(self) -> tuple[bytes, bool, dict] | None:
+        frames, flagged, speech = self._frames, self._flagged, self._speech_frames
+        meta = {'speech': speech * self.frame_sec, 'eou_wait': self._silent_run * self.frame_sec}
+        self._frames = []
+        self._flagged = False
+        self.in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._speech_frames = 0
+        self._voiced_levels = []
+        if speech * self.frame_sec < float(self._cfg().get("min_speech", 0.25)):
+            return None  # clicks, bumps, short noises
+        return b''.join(frames), flagged, meta
+
+    def flush(self) -> tuple[bytes, bool, dict] | None:
+        """End of stream: close any open utterance."""
+        return self._finish() if self.in_speech else None
+
+
+# ===== Audio levels (visualizer feed) =====
+class AudioLevels:
+    """Latest-value slot for the visualizer.
+
+    The capture thread publishes by rebinding one immutable tuple, which is a
+    single atomic store under the GIL. Readers take whatever tuple is there.
+    Neither side ever takes a lock or waits on the other.
+    """
+
+    def __init__(self, bands: int = 40):
+        self.bands = bands
+        self._slot: tuple = (0, 0.0, 0.0, (0.0,) * bands)
+
+    def publish(self, rms: float, levels) -> None:
+        seq = self._slot[0] + 1
+        self._slot = (seq, time.monotonic(), rms, tuple(levels))
+
+    def clear(self) -> None:
+        self.publish(0.0, (0.0,) * self.bands)
+
+    def latest(self) -> tuple:
+        """(seq, published_at (monotonic), rms 0..1, band levels 0..1)"""
+        return self._slot
+
+
+audio_levels = AudioLevels(int(SETTINGS.get("capture", {}).get("viz_bands", 40)))
+
+
+class SpectrumAnalyzer:
+    """Band levels of the most recent audio, via a windowed NumPy FFT.
+
+    Frames are appended to a ring of `fft_size` samples. levels() returns
+    `bands` log-spaced bands between 80 Hz and 8 kHz (or Nyquist), mapped from
+    dB to 0..1 over `db_range` dB. Without numpy it falls back to the frame RMS
+    on every band.
+    """
+
+    def __init__(self, sample_rate: int, sample_width: int = 2, bands: int = 40, fft_size: int = 1024,
+                 db_range: float = 60.0):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.bands = bands
+        self.db_range = db_range
+        self._rms = 0.0
+        try:
+            import numpy as np  # type: ignore
+        except Exception:
+            self._np = None
+            return
+        self._np = np
+        self.fft_size = fft_size
+        self._ring = np.zeros(fft_size, dtype=np.float32)
+        self._window = np.hanning(fft_size).astype(np.float32)
+        freqs = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+        hi = min(8000.0, sample_rate / 2.0)
+        edges = np.geomspace(80.0, hi, bands + 1)
+        idx = np.clip(np.searchsorted(freqs, edges), 1, len(freqs) - 1)
+        # Make sure every band owns at least one FFT bin
+        for i in range(1, len(idx)):
+            idx[i] = max(idx[i], idx[i - 1] + 1)
+        self._starts = np.minimum(idx[:-1], len(freqs) - 1)
+        self._counts = np.maximum(1, np.minimum(idx[1:], len(freqs)) - self._starts)
+        self._counts = np.minimum(self._counts, len(freqs) - self._starts)
+        # Full-scale sine in one band ≈ 0 dB after the window gain
+        self._ref = (fft_size * float(self._window.mean()) / 2.0) ** 2
+
+    def push(self, frame: bytes):
+        if not frame:
+            return
+        self._rms = min(1.0, _frame_rms(frame, self.sample_width) / 32768.0)
+        np = self._np
+        if np is None:
+            return
+        if self.sample_width == 2:
+            x = np.frombuffer(frame[:len(frame) - len(frame) % 2], dtype='<i2').astype(np.float32) / 32768.0
+        else:
+            x = np.full(max(1, len(frame) // max(1, self.sample_width)), self._rms, dtype=np.float32)
+        n = min(len(x), self.fft_size)
+        self._ring = np.roll(self._ring, -n)
+        self._ring[-n:] = x[-n:]
+
+    def levels(self) -> tuple[float, list[float]]:
+        np = self._np
+        if np is None:
+            lvl = min(1.0, self._rms * 4.0)
+            return self._rms, [lvl] * self.bands
+        power = np.abs(np.fft.rfft(self._ring * self._window)) ** 2
+        csum = np.concatenate(([0.0], np.cumsum(power)))
+        mean = (csum[self._starts + self._counts] - csum[self._starts]) / self._counts
+        db = 10.0 * np.log10(mean / self._ref + 1e-12)
+        out = np.clip((db + self.db_range) / self.db_range, 0.0, 1.0)
+        return self._rms, out.tolist()
+
+
+def analyze_wav_levels(path, bands: int = 40) -> dict:
+    """Run a WAV file through SpectrumAnalyzer frame by frame (offline check of the visualizer feed).
+    Returns the per-frame levels plus the analysis cost per frame."""
+    source = WavAudioSource(path, frame_ms=int(SETTINGS.get("capture", {}).get("frame_ms", 30)))
+    an = SpectrumAnalyzer(source.SAMPLE_RATE, source.SAMPLE_WIDTH, bands=bands)
+    frames: list[tuple[float, list[float]]] = []
+    cost = 0.0
+    try:
+        while True:
+            frame = source.read()
+            if not frame:
+                break
+            t0 = time.perf_counter()
+            an.push(frame)
+            frames.append(an.levels())
+            cost += time.perf_counter() - t0
+    finally:
+        source.close()
+    return {'frames': frames, 'us_per_frame': cost / max(1, len(frames)) * 1e6, 'sample_rate': source.SAMPLE_RATE}
+
+
+class AudioCapture:
+    """Background thread that keeps the microphone open and queues finished utterances.
+
+    With capture.barge_in on, the mic stays live during TTS and speech that rises
+    above the echo level cancels playback (on_barge_in) and becomes the next
+    command; otherwise segments overlapping our own TTS are dropped. The thread exits on its own after `idle_timeout`
+    seconds without a consumer, releasing the device.
+    """
+
+    def __init__(self, source_factory=None):
+        self._factory = source_factory
+        self.segments: "queue.Queue[tuple[float, sr.AudioData, dict]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._demand = time.monotonic()
+        self.segmenter: VoiceActivitySegmenter | None = None
+        self.analyzer: SpectrumAnalyzer | None = None
+        self.device_index = None
+        self.on_barge_in = cancel_speech
+
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        self._demand = time.monotonic()
+        if self.running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _open(self):
+        frame_ms = int(SETTINGS.get("capture", {}).get("frame_ms", 30))
+        if self._factory is not None:
+            return self._factory()
+        self.device_index = SETTINGS.get("mic_device_index")
+        return _MicrophoneSource(self.device_index, frame_ms=frame_ms)
+
+    @staticmethod
+    def _new_analyzer(source) -> "SpectrumAnalyzer | None":
+        if not SETTINGS.get("capture", {}).get("levels", True):
+            return None
+        return SpectrumAnalyzer(source.SAMPLE_RATE, source.SAMPLE_WIDTH, bands=audio_levels.bands)
+
+    def _emit(self, seg):
+        if seg is None or self.segmenter is None:
+            return
+        pcm, flagged, meta = seg
+        if flagged:
+            return
+        self.segments.put((time.monotonic(), sr.AudioData(pcm, self.segmenter.sample_rate, self.segmenter.sample_width), meta))
+
+    def _run(self):
+        try:
+            source = self._open()
+        except Exception as e:
+            print('Audio capture failed to open microphone:', e)
+            return
+        try:
+            self.segmenter = VoiceActivitySegmenter(source.SAMPLE_RATE, source.SAMPLE_WIDTH, source.CHUNK)
+            self.analyzer = self._new_analyzer(source)
+            idle_timeout = float(SETTINGS.get("capture", {}).get("idle_timeout", 60.0))
+            while not self._stop.is_set():
+                if self._factory is None and SETTINGS.get("mic_device_index") != self.device_index:
+                    # Mic changed in Settings: reopen on the new device
+                    source.close()
+                    source = self._open()
+                    self.segmenter = VoiceActivitySegmenter(source.SAMPLE_RATE, source.SAMPLE_WIDTH, source.CHUNK)
+                    self.analyzer = self._new_analyzer(source)
+                if idle_timeout > 0 and time.monotonic() - self._demand > idle_timeout and not self.segmenter.in_speech:
+                    break
+                frame = source.read(source.CHUNK)
+                if not frame:
+                    self._emit(self.segmenter.flush())
+                    break
+                if self.analyzer is not None:
+                    self.analyzer.push(frame)
+                    audio_levels.publish(*self.analyzer.levels())
+                playing = TTS_IS_PLAYING.is_set()
+                if not SETTINGS.get("capture", {}).get("barge_in", True):
+                    if playing:
+                        self.segmenter.flag()
+                    self._emit(self.segmenter.feed(frame))
+                    continue
+                self._emit(self.segmenter.feed(frame, playback=playing))
+                if self.segmenter.barged_in:
+                    # The user is talking over the agent: stop speaking and keep recording
+                    self.segmenter.barged_in = False
+                    print('[Barbaric] Barge-in detected; stopping speech.')
+                    try:
+                        self.on_barge_in()
+                    except Exception as e:
+                        print('Barge-in handler failed:', e)
+        except Exception as e:
+            print('Audio capture error:', e)
+        finally:
+            source.close()
+            audio_levels.clear()
+
+    def get_segment(self, timeout: float | None = None, meta: dict | None = None) -> sr.AudioData | None:
+        """Next finished utterance, skipping ones that went stale while nobody was listening.
+
+        If `meta` is given it is filled with the segment's speech length and end-of-utterance wait.
+        The timeout only runs once our own speech has finished (a question asked right before
+        listening gets the full `timeout` for its answer); barge-in can still end the wait early.
+        """
+        self._demand = time.monotonic()
+        max_age = float(SETTINGS.get("capture", {}).get("max_age", 8.0))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            busy = deadline is not None and tts_busy()
+            if busy:
+                deadline = max(deadline, time.monotonic() + timeout)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                # Speech already started: give it the rest of the phrase limit
+                if self.segmenter is not None and self.segmenter.in_speech:
+                    deadline = time.monotonic() + float(SETTINGS.get("phrase_time_limit", 16) or 16)
+                    continue
+                return None
+            try:
+                # While speaking, wake up regularly to keep pushing the deadline out
+                ended, audio, info = self.segments.get(timeout=min(remaining, 0.1) if busy else remaining)
+            except queue.Empty:
+                if not self.running():
+                    return None
+                continue
+            if time.monotonic() - ended <= max_age:
+                if meta is not None:
+                    meta.update(info)
+                return audio
+
+    def clear(self):
+        while True:
+            try:
+                self.segments.get_nowait()
+            except queue.Empty:
+                break
+
+
+_AUDIO_CAPTURE: AudioCapture | None = None
+
+
+def get_audio_capture() -> AudioCapture:
+    global _AUDIO_CAPTURE
+    if _AUDIO_CAPTURE is None:
+        _AUDIO_CAPTURE = AudioCapture()
+    _AUDIO_CAPTURE.start()
+    return _AUDIO_CAPTURE
+
+
+def stop_audio_capture():
+    if _AUDIO_CAPTURE is not None:
+        _AUDIO_CAPTURE.stop()
+
+
+def use_wav_input(path, realtime: bool = True):
+    """Feed continuous capture (and the visualizer) from a WAV file instead of the microphone."""
+    global _AUDIO_CAPTURE
+    stop_audio_capture()
+    _AUDIO_CAPTURE = AudioCapture(source_factory=lambda: WavAudioSource(path, realtime=realtime))
+
+
+def segment_wav(path) -> list[sr.AudioData]:
+    """Run the VAD over a WAV file and return the utterances it finds (offline check)."""
+    cap = AudioCapture(source_factory=lambda: WavAudioSource(path))
+    cap._run()
+    out = []
+    while True:
+        try:
+            out.append(cap.segments.get_nowait()[1])
+        except queue.Empty:
+            return out
+
+
+# ===== Speech-to-text backends =====
+class STTBackend(ABC):
+    """Interface for speech recognizers. One warm instance per backend is reused across calls."""
+
+    name = 'base'
+
+    def __init__(self):
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def preload(self):
+        """Load models up front so the first utterance doesn't pay for it."""
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        pass
+
+    @abstractmethod
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """Return the recognized text; raise sr.UnknownValueError when nothing was understood."""
+
+
+class GoogleSTT(STTBackend):
+    """Google Web Speech via speech_recognition (network round-trip per call)."""
+
+    name = 'google'
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        # Try Google with alternatives and choose the longest/best
+        recog = getattr(recognizer, "recognize_google")  # type: ignore[attr-defined]
+        result_all = recog(audio, language=SETTINGS["language"], show_all=True)  # type: ignore[call-arg]
+        candidate = ''
+        if isinstance(result_all, dict) and 'alternative' in result_all:
+            alts = result_all.get('alternative') or []
+            # Prefer transcript with highest confidence/longest length
+            def score(alt):
+                txt = (alt.get('transcript') or '').strip()
+                conf = alt.get('confidence', 0.0)
+                return (conf, len(txt))
+            if alts:
+                best = max(alts, key=score)
+                candidate = (best.get('transcript') or '').strip()
+        if not candidate:
+            # show_all already carries every hypothesis; an empty result means no speech
+            raise sr.UnknownValueError()
+        return candidate
+
+
+class VoskSTT(STTBackend):
+    """Offline Kaldi recognizer (CPU). Needs `pip install vosk` and a model directory."""
+
+    name = 'vosk'
+    SAMPLE_RATE = 16000
+
+    def __init__(self):
+        super().__init__()
+        self._model = None
+
+    def _load(self):
+        from vosk import Model, SetLogLevel  # type: ignore
+        SetLogLevel(-1)
+        path = SETTINGS.get("stt", {}).get("vosk_model")
+        if not path or not Path(path).exists():
+            raise FileNotFoundError(f'Vosk model not found: {path}')
+        self._model = Model(str(path))
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        self.preload()
+        from vosk import KaldiRecognizer  # type: ignore
+        rec = KaldiRecognizer(self._model, self.SAMPLE_RATE)
+        rec.AcceptWaveform(audio.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=2))
+        try:
+            return (json.loads(rec.FinalResult()).get('text') or '').strip()
+        except Exception:
+            return ''
+
+
+class WhisperSTT(STTBackend):
+    """Offline Whisper via faster-whisper (CTranslate2, int8 on CPU)."""
+
+    name = 'whisper'
+    SAMPLE_RATE = 16000
+
+    def __init__(self):
+        super().__init__()
+        self._model = None
+
+    def _load(self):
+        from faster_whisper import WhisperModel  # type: ignore
+        cfg = SETTINGS.get("stt", {})
+        self._model = WhisperModel(
+            cfg.get("whisper_model", "base.en"),
+            device="cpu",
+            compute_type=cfg.get("whisper_compute_type", "int8"),
+            cpu_threads=int(cfg.get("threads", 0) or 0),
+        )
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        self.preload()
+        import numpy as np  # type: ignore
+        pcm = audio.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=2)
+        samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+        lang = (SETTINGS.get("language") or 'en').split('-')[0]
+        segments, _info = self._model.transcribe(samples, language=lang, beam_size=1, condition_on_previous_text=False)
+        return ' '.join(s.text.strip() for s in segments).strip()
+
+
+STT_BACKENDS: dict[str, type[STTBackend]] = {
+    'google': GoogleSTT,
+    'vosk': VoskSTT,
+    'whisper': WhisperSTT,
+}
+_STT_INSTANCES: dict[str, STTBackend] = {}
+_STT_LOCK = threading.Lock()
+
+
+def get_stt(name: str | None = None) -> STTBackend:
+    name = (name or SETTINGS.get("stt", {}).get("backend") or 'google').lower()
+    with _STT_LOCK:
+        inst = _STT_INSTANCES.get(name)
+        if inst is None:
+            cls = STT_BACKENDS.get(name)
+            if cls is None:
+                raise ValueError(f'Unknown STT backend: {name}')
+            inst = cls()
+            _STT_INSTANCES[name] = inst
+    return inst
+
+
+def preload_stt(background: bool = True):
+    """Warm the configured recognizer (model load) at startup."""
+    def _run():
+        try:
+            get_stt().preload()
+        except Exception as e:
+            print('STT preload failed:', e)
+    if background:
+        threading.Thread(target=_run, daemon=True).start()
+    else:
+        _run()
+
+
+def transcribe(audio: sr.AudioData) -> str:
+    """Recognize one utterance with the configured backend, falling back if it is unusable."""
+    backend = get_stt()
+    try:
+        return backend.transcribe(audio)
+    except (ImportError, FileNotFoundError, OSError) as e:
+        fallback = SETTINGS.get("stt", {}).get("fallback")
+        if not fallback or fallback == backend.name:
+            raise
+        print(f'STT backend {backend.name} unavailable ({e}); using {fallback}.')
+        return get_stt(fallback).transcribe(audio)
+
+
+def _word_errors(ref: str, hyp: str) -> tuple[int, int]:
+    """(edit distance in words, reference length), ignoring case and punctuation only.
+    normalize_utterance() is not used: it drops filler words, which would hide real errors."""
+    r = re.findall(r"[\w']+", (ref or '').lower())
+    h = re.findall(r"[\w']+", (hyp or '').lower())
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1], len(r)
+
+
+def _load_wav_audio(path) -> sr.AudioData:
+    import wave
+    with wave.open(str(path), 'rb') as w:
+        if w.getnchannels() != 1:
+            raise ValueError(f'{path}: expected mono audio')
+        return sr.AudioData(w.readframes(w.getnframes()), w.getframerate(), w.getsampwidth())
+
+
+def bench_stt(fixtures_dir, backends: list[str] | None = None) -> dict:
+    """Word error rate and latency per backend over `*.wav` files with matching `*.txt` transcripts."""
+    fixtures = []
+    for wav in sorted(Path(fixtures_dir).glob('*.wav')):
+        ref = wav.with_suffix('.txt')
+        if ref.exists():
+            fixtures.append((wav, ref.read_text(encoding='utf-8').strip()))
+    if not fixtures:
+        print('No fixtures found (need name.wav + name.txt pairs).')
+        return {}
+    results: dict[str, dict] = {}
+    for name in backends or list(STT_BACKENDS):
+        try:
+            stt = get_stt(name)
+            t0 = time.perf_counter()
+            stt.preload()
+            load_s = time.perf_counter() - t0
+        except Exception as e:
+            results[name] = {'error': str(e)}
+            print(f'{name:>8}: unavailable ({e})')
+            continue
+        errors = words = 0
+        lat: list[float] = []
+        for wav, ref in fixtures:
+            audio = _load_wav_audio(wav)
+            t0 = time.perf_counter()
+            try:
+                hyp = stt.transcribe(audio)
+            except Exception:
+                hyp = ''
+            lat.append(time.perf_counter() - t0)
+            e, n = _word_errors(ref, hyp)
+            errors += e
+            words += n
+        lat.sort()
+        results[name] = {
+            'wer': errors / words if words else 0.0,
+            'load_s': load_s,
+            'mean_s': sum(lat) / len(lat),
+            'p90_s': lat[min(len(lat) - 1, int(len(lat) * 0.9))],
+            'files': len(lat),
+        }
+        r = results[name]
+        print(f"{name:>8}: WER {r['wer']*100:5.1f}%  mean {r['mean_s']*1000:6.0f} ms  p90 {r['p90_s']*1000:6.0f} ms  load {r['load_s']:.1f} s")
+    return results
+
+
+# Per-stage timings of the most recent listen() call (seconds)
+LAST_LISTEN_TIMING: dict[str, float] = {}
+
+
+def _listen_continuous(timing: dict) -> str:
+    cap = get_audio_capture()
+    print('Listening...')
+    state_bus.publish('listening')
+    t0 = time.perf_counter()
+    meta: dict = {}
+    audio = cap.get_segment(timeout=SETTINGS["timeout"], meta=meta)
+    timing['capture'] = time.perf_counter() - t0
+    timing.update(meta)
+    if audio is None:
+        print('Listening timed out while waiting for speech.')
+        return ''
+    state_bus.publish('recognizing')
+    t0 = time.perf_counter()
+    try:
+        candidate = transcribe(audio)
+        print(f'You said: {candidate}')
+        return candidate
+    except sr.UnknownValueError:
+        print('Sorry, I did not understand.')
+        return ''
+    finally:
+        timing['recognize'] = time.perf_counter() - t0
+
+
+def listen():
+    t_start = time.perf_counter()
+    timing: dict[str, float] = {}
+    try:
+        heard = _listen(timing)
+        if heard and _running_commands and _is_cancel_utterance(heard):
+            # A background command is still running: "stop" is meant for it, not the LLM
+            print('[Barbaric] Voice cancel:', heard)
+            cancel_commands()
+            return ''
+        return heard
+    finally:
+        timing['total'] = time.perf_counter() - t_start
+        LAST_LISTEN_TIMING.clear()
+        LAST_LISTEN_TIMING.update(timing)
+
+
+def _listen(timing: dict) -> str:
+    if _HELD_UTTERANCES:
+        # Heard while a command was running (see _voice_cancel_loop)
+        return _HELD_UTTERANCES.popleft()
+    continuous = SETTINGS.get("continuous_capture", True)
+    barge_in = continuous and SETTINGS.get("capture", {}).get("barge_in", True)
+    # Avoid listening while TTS is speaking to prevent feedback and timeouts
+    # (with barge-in the capture thread separates the user from our own voice)
+    if TTS_IS_PLAYING.is_set() and not barge_in:
+        # Wait briefly for TTS to finish instead of immediately bailing
+        waited = 0.0
+        while TTS_IS_PLAYING.is_set() and waited < 3.0:
+            time.sleep(0.05)
+            waited += 0.05
+        timing['wait_tts'] = waited
+        if TTS_IS_PLAYING.is_set():
             return ''
 
-def execute_command(command):
+    if continuous:
+        return _listen_continuous(timing)
+
+    with get_microphone() as source:
+        print('Listening...')
+        state_bus.publish('listening')
+        # Quick ambient calibration (int seconds for type-checkers)
+        t0 = time.perf_counter()
+        recognizer.adjust_for_ambient_noise(source, duration=1)
+        timing['calibrate'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        try:
+            audio = recognizer.listen(source, timeout=SETTINGS["timeout"], phrase_time_limit=SETTINGS["phrase_time_limit"])
+        except sr.WaitTimeoutError:
+            print('Listening timed out while waiting for speech.')
+            # Do not speak here to avoid spamming UI; return quietly
+            return ''
+        finally:
+            timing['capture'] = time.perf_counter() - t0
+    state_bus.publish('recognizing')
+    t0 = time.perf_counter()
+    try:
+        candidate = transcribe(audio)
+        print(f'You said: {candidate}')
+        return candidate
+    except sr.UnknownValueError:
+        print('Sorry, I did not understand.')
+        return ''
+    finally:
+        timing['recognize'] = time.perf_counter() - t0
+
+
+_DANGEROUS_COMMANDS = ['del ', 'erase ', 'format ', 'shutdown', 'rd ', 'rmdir ', 'reg ', 'diskpart', 'net user', 'net localgroup', 'taskkill', 'powershell Remove-']
+
+
+def _command_needs_confirmation(command: str) -> bool:
+    if not SETTINGS.get("features", {}).get("safety_confirm", True):
+        return False
+    return any(d in (command or '').lower() for d in _DANGEROUS_COMMANDS)
+
+
+# Called with (stream, line) for every line a command prints; the UI sets this to mirror output in its log
+COMMAND_OUTPUT_HOOK = None
+
+_running_commands: set = set()
+# Utterances heard while listening for "stop" during a command; listen() returns these first
+_HELD_UTTERANCES: deque = deque(maxlen=4)
+_voice_cancel_state = {'users': 0, 'stop': None, 'paused': 0, 'epoch': 0}
+_voice_cancel_lock = threading.Lock()
+_CANCEL_WORDS = {'stop', 'cancel', 'abort', 'halt', 'ruko', 'bas', 'रुको', 'बस', 'रोको'}
+
+
+def _is_cancel_utterance(text: str) -> bool:
+    words = re.findall(r"\w+", (text or '').lower())
+    return 0 < len(words) <= 3 and any(w in _CANCEL_WORDS for w in words)
+
+
+def _voice_cancel_loop(stop: threading.Event):
+    cap = get_audio_capture()
+    while not stop.is_set():
+        if _voice_cancel_state['paused']:
+            # A confirmation owns the microphone; leave its segments to listen()
+            stop.wait(0.1)
+            continue
+        epoch = _voice_cancel_state['epoch']
+        audio = cap.get_segment(timeout=0.5)
+        if audio is None or stop.is_set():
+            continue
+        try:
+            heard = transcribe(audio)
+        except Exception:
+            continue
+        if _voice_cancel_state['paused'] or _voice_cancel_state['epoch'] != epoch:
+            continue  # a confirmation started meanwhile; this speech must not answer it
+        if _is_cancel_utterance(heard):
+            print('[Barbaric] Voice cancel:', heard)
+            cancel_plan()
+        elif heard:
+            _HELD_UTTERANCES.append(heard)
+
+
+class _ConfirmationPending:
+    """Context for asking the user a yes/no question while commands may be running:
+    the voice-cancel listener stops taking segments and utterances held from
+    before the question are discarded, so only a fresh answer counts."""
+
+    def __enter__(self):
+        with _voice_cancel_lock:
+            _voice_cancel_state['paused'] += 1
+            _voice_cancel_state['epoch'] += 1
+        _HELD_UTTERANCES.clear()
+        return self
+
+    def __exit__(self, *exc):
+        with _voice_cancel_lock:
+            _voice_cancel_state['paused'] = max(0, _voice_cancel_state['paused'] - 1)
+        return False
+
+
+def _watch_voice_cancel(active: bool):
+    """Reference-counted background listener for "stop"/"cancel" while execute_command
+    waits on a command (continuous capture only). It is the only reader of the capture
+    queue during that time; otherwise listen() is, and handles cancel words itself."""
+    if not (SETTINGS.get("continuous_capture", True) and SETTINGS.get("commands", {}).get("voice_cancel", True)):
+        return
+    with _voice_cancel_lock:
+        if active:
+            _voice_cancel_state['users'] += 1
+            if _voice_cancel_state['users'] == 1:
+                stop = threading.Event()
+                _voice_cancel_state['stop'] = stop
+                threading.Thread(target=_voice_cancel_loop, args=(stop,), daemon=True).start()
+        else:
+            _voice_cancel_state['users'] = max(0, _voice_cancel_state['users'] - 1)
+            if _voice_cancel_state['users'] == 0 and _voice_cancel_state['stop'] is not None:
+                _voice_cancel_state['stop'].set()
+                _voice_cancel_state['stop'] = None
+
+
+class CommandRun:
+    """One shell command run with Popen: output is read line by line on two
+    reader threads, kept up to a byte cap, and the process tree is killed on
+    timeout or cancel()."""
+
+    def __init__(self, command: str, timeout: float | None = None):
+        cfg = SETTINGS.get("commands", {})
+        self.command = command
+        self.timeout = float(timeout if timeout is not None else cfg.get("timeout", 120))
+        self.max_bytes = int(cfg.get("max_output_kb", 256)) * 1024
+        self.lines: queue.Queue = queue.Queue()
+        self.stdout: list[str] = []
+        self.stderr: list[str] = []
+        self.line_count = 0
+        self.dropped = 0
+        self._kept = 0
+        self._cancel = threading.Event()
+        self._open_streams = 2
+        self.status = 'running'
+        popen_kwargs = {}
+        if platform.system() == 'Windows':
+            popen_kwargs['creationflags'] = getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0) | getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        else:
+            popen_kwargs['start_new_session'] = True
+        self.proc = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, text=True, errors='replace', bufsize=1, **popen_kwargs)
+        self.started = time.monotonic()
+        self._readers = [threading.Thread(target=self._pump, args=(self.proc.stdout, 'stdout'), daemon=True),
+                         threading.Thread(target=self._pump, args=(self.proc.stderr, 'stderr'), daemon=True)]
+        for t in self._readers:
+            t.start()
+
+    def _pump(self, pipe, stream: str):
+        try:
+            for line in pipe:
+                self.lines.put((stream, line.rstrip('\r\n')))
+        except Exception:
+            pass
+        finally:
+            self.lines.put((stream, None))
+
+    def _keep(self, stream: str, line: str):
+        self.line_count += 1
+        # The cap is in bytes: count UTF-8, not characters (non-ASCII output is up to 4x larger)
+        size = len(line.encode('utf-8', 'replace')) + 1
+        if self._kept + size > self.max_bytes:
+            self.dropped += 1
+            return
+        self._kept += size
+        (self.stdout if stream == 'stdout' else self.stderr).append(line)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def kill(self):
+        if self.proc.poll() is not None:
+            return
+        try:
+            if platform.system() == 'Windows':
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(self.proc.pid)], capture_output=True,
+                               creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            else:
+                import signal
+                os.killpg(self.proc.pid, signal.SIGKILL)
+        except Exception:
+            try:
+                self.proc.kill()
+            except Exception:
+                pass
+
+    def follow(self, on_line=None, on_tick=None, detach: float | None = None) -> str:
+        """Consume output until the process exits, times out, is cancelled, or is
+        detached (silent for `detach` seconds, default detach_silent; 0 never detaches).
+        Returns the status; a detached run can be followed again."""
+        if detach is None:
+            detach = float(SETTINGS.get("commands", {}).get("detach_silent", 5))
+        self.status = 'running'
+        while True:
+            try:
+                stream, line = self.lines.get(timeout=0.1)
+            except queue.Empty:
+                stream = line = None
+            if stream is not None:
+                if line is None:
+                    self._open_streams -= 1
+                else:
+                    self._keep(stream, line)
+                    if on_line:
+                        on_line(stream, line)
+            elapsed = time.monotonic() - self.started
+            if self._open_streams == 0 and self.proc.poll() is not None:
+                self.status = 'done'
+            elif self._cancel.is_set():
+                self.kill()
+                self.status = 'cancelled'
+            elif elapsed > self.timeout:
+                self.kill()
+                self.status = 'timeout'
+            elif detach > 0 and self.line_count == 0 and elapsed > detach and self.proc.poll() is None:
+                self.status = 'detached'
+            elif on_tick:
+                on_tick(elapsed)
+            if self.status != 'running':
+                return self.status
+
+    @property
+    def returncode(self):
+        return self.proc.poll()
+
+
+def cancel_commands():
+    for run in list(_running_commands):
+        run.cancel()
+
+
+def _is_gui_launch(command: str) -> bool:
+    # First word of the command, without path or .exe, against the known GUI launchers/apps
+    m = re.match(r'\s*"?([^"\s]+)', command or '')
+    if not m:
+        return False
+    prog = re.split(r'[\\/]', m.group(1))[-1].lower()
+    if prog.endswith('.exe'):
+        prog = prog[:-4]
+    return prog in {a.lower() for a in SETTINGS.get("commands", {}).get("gui_apps", [])}
+
+
+def _follow_in_background(run: CommandRun):
+    """Keep following a command that went quiet: its timeout and cancel still apply
+    and any later output still reaches the log. The run stays in _running_commands,
+    so Esc, cancel_commands() and a "stop" heard by listen() still reach it."""
+    def _log_line(stream, line):
+        print(line)
+        hook = COMMAND_OUTPUT_HOOK
+        if hook is not None:
+            try:
+                hook(stream, line)
+            except Exception:
+                pass
+
+    def _run():
+        try:
+            status = run.follow(_log_line, detach=0)
+        finally:
+            _running_commands.discard(run)
+        if status == 'timeout':
+            speak(f"Background command stopped after {int(run.timeout)} seconds: {run.command[:80]}", priority='urgent')
+        elif status == 'cancelled':
+            speak("Background command cancelled.", priority='urgent')
+        elif run.returncode not in (0, None):
+            speak(f"Background command failed with exit code {run.returncode}.", priority='urgent')
+        else:
+            print(f"[Barbaric] Background command finished: {run.command}")
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def execute_command(command, timeout: float | None = None):
+    """Run a shell command without blocking on its full output: lines stream to
+    COMMAND_OUTPUT_HOOK as they arrive, a short spoken summary is given as output
+    comes in, and the command is killed after `timeout` seconds or on cancel."""
     try:
         print(f"[Barbaric] Executing shell command: {command}")
-        if SETTINGS.get("features", {}).get("speak_ack", True):
-            speak(f"Executing command: {command}")
-        dangerous = ['del ', 'erase ', 'format ', 'shutdown', 'rd ', 'rmdir ', 'reg ', 'diskpart', 'net user', 'net localgroup', 'taskkill', 'powershell Remove-']
-        if SETTINGS.get("features", {}).get("safety_confirm", True):
-            if any(d in command.lower() for d in dangerous):
-                speak("Warning: This command may be dangerous. Do you want to continue?")
+        ack = SETTINGS.get("features", {}).get("speak_ack", True)
+        if ack:
+            speak(f"Executing command: {command}", priority='ack')
+        if _command_needs_confirmation(command):
+            with _ConfirmationPending():
+                speak("Warning: This command may be dangerous. Do you want to continue?", priority='urgent')
                 confirmation = listen().lower()
-                if 'yes' not in confirmation and 'हाँ' not in confirmation and 'haan' not in confirmation:
-                    speak("Command cancelled for your safety.")
-                    return
-        completed = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if completed.stdout:
-            print(completed.stdout)
-            if SETTINGS.get("features", {}).get("speak_ack", True):
-                speak(f"Command output: {completed.stdout[:200]}")
-        if completed.stderr:
-            print(completed.stderr)
-            if SETTINGS.get("features", {}).get("speak_ack", True):
-                speak(f"Command error: {completed.stderr[:200]}")
+            if 'yes' not in confirmation and 'हाँ' not in confirmation and 'haan' not in confirmation:
+                speak("Command cancelled for your safety.", priority='urgent')
+                return None
+        run = CommandRun(command, timeout)
+        _running_commands.add(run)
+        _watch_voice_cancel(True)
+        every = float(SETTINGS.get("commands", {}).get("progress_every", 10))
+        state = {'spoke_out': False, 'spoke_err': False, 'reported': 0, 'last_line': '', 'next_report': every}
+
+        def _on_line(stream, line):
+            print(line)
+            hook = COMMAND_OUTPUT_HOOK
+            if hook is not None:
+                try:
+                    hook(stream, line)
+                except Exception:
+                    pass
+            if not line.strip():
+                return
+            state['last_line'] = line
+            if stream == 'stderr' and not state['spoke_err'] and ack:
+                state['spoke_err'] = True
+                speak(f"Command error: {line[:200]}", priority='urgent')
+            elif stream == 'stdout' and not state['spoke_out'] and ack:
+                state['spoke_out'] = True
+                state['reported'] = run.line_count
+                speak(f"Command output: {line[:200]}", priority='ack')
+
+        def _on_tick(elapsed):
+            if ack and elapsed >= state['next_report']:
+                state['next_report'] = elapsed + every
+                new = run.line_count - state['reported']
+                if new > 0:
+                    state['reported'] = run.line_count
+                    speak(f"{new} more line{'s' if new != 1 else ''}. Latest: {state['last_line'][:120]}", priority='ack')
+
+        status = 'running'
+        try:
+            status = run.follow(_on_line, _on_tick)
+        finally:
+            # The plan moves on now, and listen() takes the microphone back
+            _watch_voice_cancel(False)
+            if status == 'detached' and not _is_gui_launch(command):
+                # Still owned by us: a watcher keeps the registry entry until the process ends
+                _follow_in_background(run)
+            else:
+                _running_commands.discard(run)
+        if run.dropped:
+            print(f"[Barbaric] Output capped: {run.dropped} of {run.line_count} lines not kept.")
+        if status == 'timeout':
+            speak(f"The command took longer than {int(run.timeout)} seconds and was stopped.", priority='urgent')
+        elif status == 'cancelled':
+            speak("Command cancelled.", priority='urgent')
+        elif status == 'detached':
+            where = 'untracked' if _is_gui_launch(command) else 'in the background'
+            print(f"[Barbaric] No output after {SETTINGS.get('commands', {}).get('detach_silent', 5)} s; leaving it running {where}.")
+        elif run.returncode not in (0, None):
+            speak(f"The command failed with exit code {run.returncode}.", priority='urgent')
+        elif ack and state['spoke_out'] and run.line_count - state['reported'] > 0:
+            speak(f"Done. {run.line_count} lines of output. Last: {state['last_line'][:120]}", priority='ack')
+        return run
     except Exception as e:
-        speak('Command execution failed.')
+        speak('Command execution failed.', priority='urgent')
         print('Error:', e)
+        return None
+
+
+def _screen_changed():
+    # Input is about to change the screen; OCR must not serve the cached snapshot
+    cache = globals().get('screen_cache')
+    if cache is not None:
+        cache.invalidate()
+
 
 def type_text(text):
     try:
+        _screen_changed()
         pyautogui.write(text, interval=0.05)
     except Exception as e:
-        speak('Failed to type text.')
+        speak('Failed to type text.', priority='urgent')
         print('Type text error:', e)
 
 def control_mouse(action, value=None, speed: float | None = None):
     try:
+        if action not in ('move', 'move_by', 'path'):
+            _screen_changed()
         if action == 'move' and value and isinstance(value, (list, tuple)) and len(value) == 2:
             dur = 0.2 if speed is None else max(0.01, float(speed))
             pyautogui.moveTo(value[0], value[1], duration=dur)
@@ -339,13 +2513,14 @@ def control_mouse(action, value=None, speed: float | None = None):
                 if isinstance(pt, (list, tuple)) and len(pt) == 2:
                     pyautogui.moveTo(pt[0], pt[1], duration=dur)
         else:
-            speak('Unknown mouse action or missing value.')
+            speak('Unknown mouse action or missing value.', priority='urgent')
     except Exception as e:
-        speak('Failed to control mouse.')
+        speak('Failed to control mouse.', priority='urgent')
         print('Mouse control error:', e)
 
 def control_window(op: str):
     try:
+        _screen_changed()
         op = (op or '').lower()
         if op == 'maximize':
             pyautogui.hotkey('win', 'up')
@@ -356,13 +2531,14 @@ def control_window(op: str):
         elif op == 'switch':
             pyautogui.hotkey('alt', 'tab')
         else:
-            speak('Unknown window operation.')
+            speak('Unknown window operation.', priority='urgent')
     except Exception as e:
-        speak('Failed to control window.')
+        speak('Failed to control window.', priority='urgent')
         print('Window control error:', e)
 
 def press_keys(keys):
     try:
+        _screen_changed()
         if isinstance(keys, str):
             pyautogui.press(keys)
         elif isinstance(keys, list):
@@ -371,44 +2547,107 @@ def press_keys(keys):
             else:
                 pyautogui.hotkey(*keys)
         else:
-            speak('Unknown key format.')
+            speak('Unknown key format.', priority='urgent')
     except Exception as e:
-        speak('Failed to press keys.')
+        speak('Failed to press keys.', priority='urgent')
         print('Key press error:', e)
 
-def get_ai_response(user_input):
-    # Add context for more accurate and optimized LLM responses
-    system_context = f"OS: {platform.system()} {platform.release()} | Python: {platform.python_version()} | User: {os.getlogin()}"
-    system_prompt = (
-    f"You are Barbaric, a smart AI voice assistant for Windows. System context: {system_context}. "
-        "For any user request, generate a JSON array of steps. "
-        "For system actions, generate Windows shell commands (cmd.exe or PowerShell) in the 'command' field. "
-        "To type text, use: {\"action\": \"type\", \"text\": \"the text to type\"}. "
-        "To control the mouse, use: {\"action\": \"mouse\", \"mouse_action\": \"move|move_by|path|click|double_click|right_click|scroll|drag\", \"value\": value, \"speed\": optional_speed}. "
-    "For easy cursor navigation, use: {\"action\": \"cursor_nav\", \"direction\": \"up|down|left|right|center|top_left|top_right|bottom_left|bottom_right\", \"amount\": optional_pixels}. "
-    "To snap to a 3x3 grid cell (like numpad), use: {\"action\": \"grid_nav\", \"cell\": 1-9} where 1=bottom_left, 5=center, 9=top_right. "
-        "To press keys, use: {\"action\": \"key\", \"keys\": \"enter\"} or {\"action\": \"key\", \"keys\": [\"ctrl\", \"c\"]}. "
-    "To control windows, use: {\"action\": \"window\", \"op\": \"maximize|minimize|close|switch\"}. "
-    "To observe the screen, use: {\"action\": \"observe\"}. "
-    "To interact by visible text, use: {\"action\": \"click_text\", \"text\": \"label\"}, {\"action\": \"double_click_text\", \"text\": \"label\"}, {\"action\": \"hover_text\", \"text\": \"label\"}, or {\"action\": \"type_at_text\", \"text\": \"label\", \"value\": \"input\"}. "
-    "To show or hide the on-screen navigation grid, use: {\"action\": \"show_grid\"} or {\"action\": \"hide_grid\"}. "
-    "To run a custom skill, use: {\"action\": \"run_skill\", \"name\": \"skill_name\", \"payload\": { ... }}. "
-    "When developer mode is enabled, you may update a skill via: {\"action\": \"update_skill\", \"name\": \"skill_name\", \"code\": \"python module text\"}. Restrict changes to skills only. "
-    "When OCR is unavailable, fall back to key/mouse actions or ask the user to install Tesseract. "
-        "For chat, use 'action': 'chat' and 'response'. "
-        "For each command step, use: {\"action\": \"command\", \"command\": \"<windows shell command>\"}. "
-        "For confirmation, use action: 'confirm' and provide a response. "
-        "Always use English for all JSON keys and values, responses can be conversational. "
-        "Be concise and only generate the minimum steps needed. "
-        "Example: [{\"action\": \"command\", \"command\": \"notepad.exe\"}, {\"action\": \"type\", \"text\": \"hello world\"}, {\"action\": \"mouse\", \"mouse_action\": \"move\", \"value\": [100,200]}, {\"action\": \"chat\", \"response\": \"Done!\"}] "
-    )
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input}
-        ],
-        model="gpt-oss-120b",
+LLM_MODEL = "gpt-oss-120b"
+
+
+# ===== System prompt assembly =====
+# Each entry is (required features, text). Entries whose features are all enabled are
+# kept; the rest are dropped so disabled actions cost no prompt tokens.
+_PROMPT_SECTIONS: list[tuple[tuple[str, ...], str]] = [
+    ((), "For any user request, generate a JSON array of steps. "),
+    ((), "For system actions, generate Windows shell commands (cmd.exe or PowerShell) in the 'command' field. "),
+    ((), "To type text, use: {\"action\": \"type\", \"text\": \"the text to type\"}. "),
+    ((), "To control the mouse, use: {\"action\": \"mouse\", \"mouse_action\": \"move|move_by|path|click|double_click|right_click|scroll|drag\", \"value\": value, \"speed\": optional_speed}. "),
+    (("cursor_nav",), "For easy cursor navigation, use: {\"action\": \"cursor_nav\", \"direction\": \"up|down|left|right|center|top_left|top_right|bottom_left|bottom_right\", \"amount\": optional_pixels}. "),
+    (("grid_nav",), "To snap to a 3x3 grid cell (like numpad), use: {\"action\": \"grid_nav\", \"cell\": 1-9} where 1=bottom_left, 5=center, 9=top_right. "),
+    ((), "To press keys, use: {\"action\": \"key\", \"keys\": \"enter\"} or {\"action\": \"key\", \"keys\": [\"ctrl\", \"c\"]}. "),
+    ((), "To control windows, use: {\"action\": \"window\", \"op\": \"maximize|minimize|close|switch\"}. "),
+    (("ocr",), "To observe the screen, use: {\"action\": \"observe\"}. "),
+    (("ocr", "click_text"), "To interact by visible text, use: {\"action\": \"click_text\", \"text\": \"label\"}, {\"action\": \"double_click_text\", \"text\": \"label\"}, {\"action\": \"hover_text\", \"text\": \"label\"}, or {\"action\": \"type_at_text\", \"text\": \"label\", \"value\": \"input\"}. "
+                                 "These may add \"cell\": 1-9 (screen grid, 1 bottom-left, 9 top-right) or \"region\": \"window\" to search a smaller area first. "),
+    (("grid_nav",), "To show or hide the on-screen navigation grid, use: {\"action\": \"show_grid\"} or {\"action\": \"hide_grid\"}. "),
+    (("skills",), "To run a custom skill, use: {\"action\": \"run_skill\", \"name\": \"skill_name\", \"payload\": { ... }}. "),
+    (("skills", "dev_mode"), "Developer mode is enabled: you may update a skill via: {\"action\": \"update_skill\", \"name\": \"skill_name\", \"code\": \"python module text\"}. Restrict changes to skills only. "),
+    (("ocr",), "When OCR is unavailable, fall back to key/mouse actions or ask the user to install Tesseract. "),
+    ((), "For chat, use 'action': 'chat' and 'response'. "),
+    ((), "For each command step, use: {\"action\": \"command\", \"command\": \"<windows shell command>\"}; add \"timeout\": seconds for commands expected to run long. "),
+    ((), "For confirmation, use action: 'confirm' and provide a response. "),
+    ((), "Always use English for all JSON keys and values, responses can be conversational. "),
+    ((), "Be concise and only generate the minimum steps needed. "),
+    ((), "Example: [{\"action\": \"command\", \"command\": \"notepad.exe\"}, {\"action\": \"type\", \"text\": \"hello world\"}, {\"action\": \"mouse\", \"mouse_action\": \"move\", \"value\": [100,200]}, {\"action\": \"chat\", \"response\": \"Done!\"}] "),
+]
+
+_SYSTEM_CONTEXT: str | None = None
+_PROMPT_CACHE: dict[str, str] = {}
+
+
+def _system_context() -> str:
+    """OS/Python/user context; computed once since it cannot change while running."""
+    global _SYSTEM_CONTEXT
+    if _SYSTEM_CONTEXT is None:
+        try:
+            user = os.getlogin()
+        except Exception:
+            # No controlling terminal (service, IDE runner): fall back to env
+            user = os.environ.get('USERNAME') or os.environ.get('USER') or 'unknown'
+        _SYSTEM_CONTEXT = f"OS: {platform.system()} {platform.release()} | Python: {platform.python_version()} | User: {user}"
+    return _SYSTEM_CONTEXT
+
+
+def feature_fingerprint() -> str:
+    """Stable key for everything that changes which actions are allowed."""
+    feats = SETTINGS.get("features", {})
+    on = sorted(k for k, v in feats.items() if v)
+    return ','.join(on) + f"|dev={int(bool(SETTINGS.get('dev_mode')))}"
+
+
+def build_system_prompt() -> str:
+    """Static system prompt for the current feature set (cached per fingerprint)."""
+    key = feature_fingerprint()
+    prompt = _PROMPT_CACHE.get(key)
+    if prompt is None:
+        feats = dict(SETTINGS.get("features", {}))
+        feats["dev_mode"] = bool(SETTINGS.get("dev_mode"))
+        parts = [f"You are Barbaric, a smart AI voice assistant for Windows. System context: {_system_context()}. "]
+        for needs, text in _PROMPT_SECTIONS:
+            if all(feats.get(n, False) for n in needs):
+                parts.append(text)
+        prompt = ''.join(parts)
+        _PROMPT_CACHE.clear()
+        _PROMPT_CACHE[key] = prompt
+    return prompt
+
+
+def _build_messages(user_input):
+    # The system prompt is byte-identical across requests with the same feature
+    # set, so the provider can reuse its cached prefix; only the user turn varies.
+    system_prompt = build_system_prompt()
+    if SETTINGS.get("llm", {}).get("prompt_cache_marker", False):
+        system_content = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    else:
+        system_content = system_prompt
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_input}
+    ]
+
+
+def get_ai_response(user_input, llm=None):
+    t0 = time.perf_counter()
+    chat_completion = (llm or get_llm()).chat.completions.create(
+        messages=_build_messages(user_input),
+        model=LLM_MODEL,
     )
+    timing = llm_session.request_timing() if llm is None else {}
+    timing['ttfb'] = timing.get('headers', time.perf_counter() - t0)
+    timing['total'] = time.perf_counter() - t0
+    LAST_LLM_TIMING.clear()
+    LAST_LLM_TIMING.update(timing)
     # Handle non-streaming and streaming results defensively
     try:
         choices = getattr(chat_completion, 'choices', None)
@@ -424,178 +2663,1153 @@ def get_ai_response(user_input):
     try:
         parts = []
         for evt in chat_completion:
-            try:
-                delta = getattr(evt, 'delta', None)
-                if delta is None and isinstance(evt, dict):
-                    delta = evt.get('delta')
-                if delta:
-                    parts.append(delta)
-            except Exception:
-                continue
+            txt = _chunk_text(evt)
+            if txt:
+                parts.append(txt)
         return ''.join(parts)
     except Exception:
         return ''
 
-def handle_ai_response(ai_response):
+
+# ===== Streaming LLM plans =====
+
+def _chunk_text(evt) -> str:
+    """Extract the text delta from a streaming chunk (SDK object or plain dict)."""
     try:
-        data = json.loads(ai_response)
+        choices = getattr(evt, 'choices', None)
+        if choices is None and isinstance(evt, dict):
+            choices = evt.get('choices')
+        if choices:
+            ch = choices[0]
+            delta = getattr(ch, 'delta', None)
+            if delta is None and isinstance(ch, dict):
+                delta = ch.get('delta')
+            if delta is not None:
+                content = getattr(delta, 'content', None)
+                if content is None and isinstance(delta, dict):
+                    content = delta.get('content')
+                return content or ''
+            # Some backends send whole messages even when streaming
+            msg = getattr(ch, 'message', None)
+            if msg is None and isinstance(ch, dict):
+                msg = ch.get('message')
+            if msg is not None:
+                content = getattr(msg, 'content', None)
+                if content is None and isinstance(msg, dict):
+                    content = msg.get('content')
+                return content or ''
+            return ''
+        # Legacy shape: {'delta': 'text'}
+        delta = getattr(evt, 'delta', None)
+        if delta is None and isinstance(evt, dict):
+            delta = evt.get('delta')
+        return delta if isinstance(delta, str) else ''
+    except Exception:
+        return ''
+
+
+class _StepStreamParser:
+    """Incrementally extracts top-level JSON objects from a streamed step array.
+
+    Text is fed as it arrives; every time a top-level `{...}` closes it is decoded
+    and returned, so steps can run before the rest of the array has been generated.
+    Works for a bare object as well as `[{...}, {...}]`, with or without code fences.
+    """
+
+    def __init__(self):
+        self._buf = ''
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, text: str) -> list[dict]:
+        steps: list[dict] = []
+        if not text:
+            return steps
+        self._buf += text
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == '\\':
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_str = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._start >= 0:
+                    try:
+                        obj = json.loads(buf[self._start:i + 1])
+                        if isinstance(obj, dict):
+                            steps.append(obj)
+                    except Exception as e:
+                        print('Skipping malformed streamed step:', e)
+                    self._start = -1
+            i += 1
+        # Drop consumed text so the buffer only holds the open object
+        if self._depth == 0:
+            self._buf = ''
+            self._pos = 0
+        else:
+            self._buf = buf[self._start:]
+            self._pos = i - self._start
+            self._start = 0
+        return steps
+
+
+class StepStream:
+    """Iterable of plan steps decoded while the LLM is still streaming.
+
+    `raw` holds the accumulated response text (for logging on errors) and
+    `timing` the connect / headers / ttfb / first_step / total latencies in seconds.
+    """
+
+    def __init__(self, user_input, llm=None):
+        self.user_input = user_input
+        self.llm = llm
+        self.raw = ''
+        self.timing: dict[str, float] = {}
+
+    def __iter__(self):
+        t0 = time.perf_counter()
+        parser = _StepStreamParser()
+        emitted = 0
+        try:
+            resp = (self.llm or get_llm()).chat.completions.create(
+                messages=_build_messages(self.user_input),
+                model=LLM_MODEL,
+                stream=True,
+            )
+            if self.llm is None:
+                self.timing.update(llm_session.request_timing())
+        except TypeError:
+            # Client without streaming support: fall back to one blocking call
+            resp = [get_ai_response(self.user_input, llm=self.llm)]
+        parts: list[str] = []
+        for evt in resp:
+            txt = evt if isinstance(evt, str) else _chunk_text(evt)
+            if not txt:
+                continue
+            if 'ttfb' not in self.timing:
+                self.timing['ttfb'] = time.perf_counter() - t0
+            parts.append(txt)
+            for step in parser.feed(txt):
+                if emitted == 0:
+                    self.timing['first_step'] = time.perf_counter() - t0
+                emitted += 1
+                yield step
+        self.raw = ''.join(parts)
+        self.timing['total'] = time.perf_counter() - t0
+        LAST_LLM_TIMING.clear()
+        LAST_LLM_TIMING.update(self.timing)
+        if emitted == 0:
+            # Nothing decodable arrived; let the caller report the raw text
+            raise ValueError('No JSON steps found in streamed response.')
+
+
+def stream_ai_steps(user_input, llm=None) -> StepStream:
+    return StepStream(user_input, llm=llm)
+
+
+# ===== Offline LLM stub (for latency measurements without network) =====
+class FakeCerebras:
+    """Stand-in for the Cerebras client that replays a canned plan as chunked deltas.
+
+    `ttfb` is the delay before the first token, `chunk_delay` the gap between
+    chunks of `chunk_size` characters. Non-streaming calls wait for the whole
+    response, like the real API.
+    """
+
+    def __init__(self, response=None, ttfb: float = 0.35, chunk_size: int = 12, chunk_delay: float = 0.03):
+        if response is None:
+            response = [
+                {"action": "chat", "response": "Opening Notepad and writing your note."},
+                {"action": "command", "command": "notepad.exe"},
+                {"action": "type", "text": "Meeting notes for Monday: review the quarterly plan."},
+                {"action": "key", "keys": ["ctrl", "s"]},
+                {"action": "chat", "response": "Done!"},
+            ]
+        self.text = response if isinstance(response, str) else json.dumps(response)
+        self.ttfb = ttfb
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def _chunks(self):
+        time.sleep(self.ttfb)
+        for i in range(0, len(self.text), self.chunk_size):
+            if i:
+                time.sleep(self.chunk_delay)
+            piece = self.text[i:i + self.chunk_size]
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))])
+
+    def _create(self, messages=None, model=None, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._chunks()
+        parts = [_chunk_text(c) for c in self._chunks()]
+        msg = types.SimpleNamespace(content=''.join(parts))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)])
+
+
+def bench_streaming(llm=None, runs: int = 3) -> dict:
+    """Compare time-to-first-action for blocking vs streamed plans (no actions are executed)."""
+    llm = llm or FakeCerebras()
+    blocking: list[float] = []
+    streamed: list[float] = []
+    for _ in range(max(1, runs)):
+        t0 = time.perf_counter()
+        data = json.loads(get_ai_response('bench', llm=llm))
         steps = data if isinstance(data, list) else [data]
-        for step in steps:
-            action = step.get('action')
-            if action == 'command':
-                cmd = step.get('command', '')
-                if cmd:
-                    if SETTINGS.get("features", {}).get("speak_ack", True):
-                        speak(f'Executing: {cmd}')
-                    execute_command(cmd)
-                else:
-                    speak('No command provided by AI.')
-            elif action == 'type':
-                text_to_type = step.get('text', '')
-                if text_to_type:
-                    if SETTINGS.get("features", {}).get("speak_ack", True):
-                        speak(f'Typing: {text_to_type}')
-                    type_text(text_to_type)
-                else:
-                    speak('No text provided to type.')
-            elif action == 'mouse':
-                mouse_action = step.get('mouse_action', '')
-                mouse_value = step.get('value', None)
-                speed = step.get('speed', None)
-                if SETTINGS.get("features", {}).get("speak_ack", True):
-                    speak(f'Performing mouse action: {mouse_action}')
-                control_mouse(mouse_action, mouse_value, speed)
-            elif action == 'cursor_nav':
-                if not SETTINGS.get("features", {}).get("cursor_nav", True):
-                    speak('Cursor navigation is disabled in settings.')
-                    continue
-                direction = step.get('direction', '')
-                amount = step.get('amount', None)
-                cursor_nav(direction, amount)
-            elif action == 'grid_nav':
-                if not SETTINGS.get("features", {}).get("grid_nav", True):
-                    speak('Grid navigation is disabled in settings.')
-                    continue
-                cell = step.get('cell', None)
-                grid_nav(cell)
-            elif action == 'window':
-                op = step.get('op', '')
-                control_window(op)
-            elif action == 'observe':
-                if not SETTINGS.get("features", {}).get("ocr", True):
-                    speak('OCR features are disabled in settings.')
-                    continue
-                txt = screen_ocr()
-                summary = (txt[:600] + '…') if txt and len(txt) > 600 else (txt or '')
-                if summary:
-                    speak('I analyzed the screen and found some text.')
-                    print('SCREEN OCR:\n', summary)
-                else:
-                    speak('I could not read any text from the screen.')
-            elif action == 'click_text':
-                if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
-                    speak('Click by text is disabled in settings.')
-                    continue
-                label = step.get('text', '')
-                if label:
-                    ok = click_by_text(label)
-                    if not ok:
-                        speak('I could not find that text on screen.')
-            elif action == 'double_click_text':
-                if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
-                    speak('Click by text is disabled in settings.')
-                    continue
-                label = step.get('text', '')
-                if label:
-                    ok = click_by_text(label, clicks=2)
-                    if not ok:
-                        speak('I could not find that text on screen.')
-            elif action == 'hover_text':
-                if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
-                    speak('Hover by text is disabled in settings.')
-                    continue
-                label = step.get('text', '')
-                if label:
-                    ok = click_by_text(label, clicks=0, move_only=True)
-                    if not ok:
-                        speak('I could not locate that text to hover.')
-            elif action == 'type_at_text':
-                if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
-                    speak('Type at text is disabled in settings.')
-                    continue
-                label = step.get('text', '')
-                value = step.get('value', '')
-                if label and value:
-                    ok = click_by_text(label)
-                    if ok:
-                        type_text(value)
-                    else:
-                        speak('I could not find the target field by text.')
-            elif action == 'run_skill':
-                if not SETTINGS.get("features", {}).get("skills", False):
-                    speak('Skills are disabled in settings.')
-                    continue
-                name = step.get('name', '')
-                payload = step.get('payload', {})
-                res = run_skill(name, payload)
-                if res is not None:
-                    out = str(res)
-                    print('Skill result:', out)
-                    speak(out[:200])
-            elif action == 'update_skill':
-                if not SETTINGS.get("features", {}).get("skills", False):
-                    speak('Skills are disabled in settings.')
-                elif not SETTINGS.get('dev_mode'):
-                    speak('Developer mode is off; code updates are blocked.')
-                else:
-                    name = step.get('name', '')
-                    code = step.get('code', '')
-                    ok, msg = update_skill(name, code)
-                    speak(msg)
-            elif action == 'show_grid':
-                if not SETTINGS.get("features", {}).get("grid_nav", True):
-                    speak('Grid navigation is disabled in settings.')
-                    continue
-                _ui = get_ui()
-                fn = getattr(_ui, 'show_grid_overlay', None) if _ui else None
-                if callable(fn):
-                    fn()
-                else:
-                    speak('Grid overlay not available.')
-            elif action == 'hide_grid':
-                if not SETTINGS.get("features", {}).get("grid_nav", True):
-                    continue
-                _ui = get_ui()
-                fn = getattr(_ui, 'hide_grid_overlay', None) if _ui else None
-                if callable(fn):
-                    fn()
-                else:
-                    speak('Grid overlay not available.')
-            elif action == 'key':
-                keys = step.get('keys', '')
-                press_keys(keys)
-            elif action == 'chat':
-                resp = step.get('response', '')
-                print('AI:', resp)
-                speak(resp)
-            elif action == 'confirm':
-                resp = step.get('response', '')
-                print('AI:', resp)
-                speak(resp)
-                confirmation = listen().lower()
-                if 'yes' in confirmation:
+        if steps:
+            blocking.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for _step in stream_ai_steps('bench', llm=llm):
+            streamed.append(time.perf_counter() - t0)
+            break
+    res = {
+        'blocking_first_action': sum(blocking) / len(blocking) if blocking else 0.0,
+        'streaming_first_action': sum(streamed) / len(streamed) if streamed else 0.0,
+    }
+    print(f"Time to first action: blocking {res['blocking_first_action']*1000:.0f} ms, streaming {res['streaming_first_action']*1000:.0f} ms")
+    return res
+
+
+# ===== Response cache for repeated utterances =====
+def cache_dir() -> Path:
+    base = Path(__file__).resolve().parent
+    return base / 'cache'
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key."""
+    t = (text or '').lower().strip()
+    t = re.sub(r"[^\w\s']+", ' ', t)
+    t = re.sub(r"\s+", ' ', t).strip()
+    # Politeness doesn't change the plan
+    t = re.sub(r"^(please |barbaric |hey barbaric )+", '', t)
+    t = re.sub(r"( please)+$", '', t)
+    return t
+
+
+class ResponseCache:
+    """LRU + TTL cache of LLM plans keyed on the normalized transcript and feature set.
+
+    Only plans made entirely of deterministic actions (SETTINGS['response_cache']['actions'])
+    are stored, so anything that depends on screen contents or asks the user is
+    always planned fresh. Entries persist as JSON in cache/responses.json.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or (cache_dir() / 'responses.json')
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("response_cache", {})
+
+    def key(self, user_input: str) -> str:
+        return normalize_utterance(user_input) + '||' + feature_fingerprint()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for k, v in data.get('entries', []):
+                    self._entries[k] = v
+        except Exception as e:
+            print('Response cache load failed:', e)
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'entries': list(self._entries.items())}, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print('Response cache save failed:', e)
+
+    def _expired(self, entry: dict) -> bool:
+        ttl = float(self._cfg().get("ttl", 0) or 0)
+        return ttl > 0 and (time.time() - float(entry.get('ts', 0))) > ttl
+
+    def cacheable(self, steps) -> bool:
+        allowed = set(self._cfg().get("actions", []))
+        if not steps or not all(isinstance(s, dict) for s in steps):
+            return False
+        acts = [s.get('action') for s in steps if s.get('action') != 'chat']
+        return bool(acts) and all(a in allowed for a in acts)
+
+    def get(self, user_input: str) -> list[dict] | None:
+        if not self._cfg().get("enabled", True):
+            return None
+        with self._lock:
+            self._load()
+            k = self.key(user_input)
+            entry = self._entries.get(k)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[k]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return [dict(s) for s in entry['steps']]
+
+    def put(self, user_input: str, steps) -> bool:
+        if not self._cfg().get("enabled", True) or not self.cacheable(steps):
+            return False
+        with self._lock:
+            self._load()
+            k = self.key(user_input)
+            self._entries[k] = {'steps': list(steps), 'ts': time.time()}
+            self._entries.move_to_end(k)
+            limit = max(1, int(self._cfg().get("max_entries", 256)))
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._save()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._save()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total) if total else 0.0,
+        }
+
+
+response_cache = ResponseCache()
+
+
+# ===== Transcript log (bounded UI view, rotating on-disk history) =====
+class TranscriptLog:
+    """Append-only conversation transcript shared by the UI and worker threads.
+
+    append() is cheap and thread-safe: lines wait in memory until drain() takes
+    them as one batch (the UI calls it once per frame) and writes them to
+    cache/transcript/transcript.log as JSON lines. The log rotates at
+    SETTINGS['transcript']['max_bytes'] keeping 'backups' older files, so the
+    UI widget can stay capped at 'max_lines' while search() still covers the
+    spilled history by streaming the files instead of loading them.
+    """
+
+    def __init__(self, directory: Path | None = None):
+        self.dir = directory or (cache_dir() / 'transcript')
+        self._lock = threading.Lock()
+        self._pending: list[dict] = []
+        self._file = None
+        self._size = 0
+        self.appended = 0
+        self.rotations = 0
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("transcript", {})
+
+    def path(self, n: int = 0) -> Path:
+        return self.dir / ('transcript.log' if n == 0 else f'transcript.{n}.log')
+
+    def append(self, line: str, kind: str = 'agent') -> int:
+        """Queue a display line; returns how many lines are now waiting for drain()."""
+        with self._lock:
+            self._pending.append({'t': time.time(), 'kind': kind, 'text': line})
+            self.appended += 1
+            return len(self._pending)
+
+    def drain(self) -> list[dict]:
+        """Take every queued line (oldest first) and spill them to disk in one write."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if batch and self._cfg().get("persist", True):
+                self._write(batch)
+        return batch
+
+    def _open(self):
+        if self._file is None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path(), 'a', encoding='utf-8')
+            self._size = self._file.tell()
+        return self._file
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        backups = max(0, int(self._cfg().get("backups", 5)))
+        for n in range(backups, 0, -1):
+            src = self.path(n - 1)
+            if src.exists():
+                os.replace(src, self.path(n))
+        if backups == 0:
+            self.path().unlink(missing_ok=True)
+        self.rotations += 1
+
+    def _write(self, batch: list[dict]):
+        data = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in batch)
+        nbytes = len(data.encode('utf-8'))
+        try:
+            limit = int(self._cfg().get("max_bytes", 2 * 1024 * 1024))
+            f = self._open()
+            if self._size and self._size + nbytes > limit:
+                self._rotate()
+                f = self._open()
+            f.write(data)
+            f.flush()
+            self._size += nbytes
+        except Exception as e:
+            print('Transcript write failed:', e)
+
+    def files(self) -> list[Path]:
+        """On-disk history, oldest first."""
+        backups = max(0, int(self._cfg().get("backups", 5)))
+        return [p for p in (self.path(n) for n in range(backups, -1, -1)) if p.exists()]
+
+    def search(self, query: str, limit: int = 50, kind: str | None = None) -> list[dict]:
+        """Case-insensitive substring search over the whole history; newest matches last.
+
+        Files are streamed line by line and only matching lines are decoded, so
+        memory stays bounded by ``limit`` however long the history is.
+        """
+        q = (query or '').strip().lower()
+        if not q:
+            return []
+        self.drain()
+        # Lines are stored JSON-escaped; match the escaped form before decoding
+        raw_q = json.dumps(q, ensure_ascii=False)[1:-1]
+        hits: deque = deque(maxlen=max(1, limit))
+        for path in self.files():
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    for raw in f:
+                        if raw_q not in raw.lower():
+                            continue
+                        try:
+                            entry = json.loads(raw)
+                        except ValueError:
+                            continue
+                        if q in entry.get('text', '').lower() and (kind is None or entry.get('kind') == kind):
+                            hits.append(entry)
+            except OSError as e:
+                print('Transcript search skipped', path, e)
+        return list(hits)
+
+    def close(self):
+        self.drain()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+transcript = TranscriptLog()
+
+
+# ===== Local intent router (fast path for simple commands) =====
+_NUMBER_WORDS = {
+    'one': 1, 'won': 1, 'two': 2, 'to': 2, 'too': 2, 'three': 3, 'four': 4, 'for': 4,
+    'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9,
+}
+_NUM = r"(\d+|" + '|'.join(_NUMBER_WORDS) + r")"
+_DIRECTIONS = r"(up|down|left|right|center|centre|top left|top right|bottom left|bottom right)"
+_KEY_NAMES = {
+    'enter': 'enter', 'return': 'enter', 'escape': 'esc', 'esc': 'esc', 'tab': 'tab',
+    'space': 'space', 'spacebar': 'space', 'backspace': 'backspace', 'delete': 'delete',
+    'home': 'home', 'end': 'end', 'page up': 'pageup', 'page down': 'pagedown',
+    'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right',
+}
+_SHORTCUTS = {
+    'copy': ['ctrl', 'c'], 'paste': ['ctrl', 'v'], 'cut': ['ctrl', 'x'], 'undo': ['ctrl', 'z'],
+    'redo': ['ctrl', 'y'], 'select all': ['ctrl', 'a'], 'save': ['ctrl', 's'],
+    'new tab': ['ctrl', 't'], 'close tab': ['ctrl', 'w'], 'next tab': ['ctrl', 'tab'],
+    'previous tab': ['ctrl', 'shift', 'tab'], 'refresh': ['f5'], 'show desktop': ['win', 'd'],
+}
+_WINDOW_OPS = {'maximize': 'maximize', 'maximise': 'maximize', 'minimize': 'minimize',
+               'minimise': 'minimize', 'close': 'close', 'switch': 'switch'}
+
+
+def _parse_num(tok: str) -> int | None:
+    if tok.isdigit():
+        return int(tok)
+    return _NUMBER_WORDS.get(tok)
+
+
+def _route_grid(m):
+    cell = _parse_num(m.group(1))
+    if cell is None or not (1 <= cell <= 9):
+        return None
+    return [{"action": "grid_nav", "cell": cell}]
+
+
+def _route_cursor(m):
+    step = {"action": "cursor_nav", "direction": m.group(1).replace(' ', '_')}
+    if m.group(2):
+        amt = _parse_num(m.group(2))
+        if amt is None:
+            return None
+        step["amount"] = amt
+    return [step]
+
+
+def _route_scroll(m):
+    amount = 300
+    if m.group(2) in ('a lot', 'more', 'fast'):
+        amount = 900
+    elif m.group(2) in ('a little', 'a bit', 'slowly'):
+        amount = 100
+    return [{"action": "mouse", "mouse_action": "scroll", "value": amount if m.group(1) == 'up' else -amount}]
+
+
+# (pattern, builder, required features). Patterns must match the whole normalized utterance.
+_INTENT_RULES: list[tuple["re.Pattern[str]", object, tuple[str, ...]]] = [
+    (re.compile(r"(?:go to |move to |snap to )?(?:grid|cell|zone|sector)(?: number)? " + _NUM), _route_grid, ("grid_nav",)),
+    (re.compile(r"(?:move )?(?:the )?(?:cursor|mouse|pointer) " + _DIRECTIONS + r"(?: by " + _NUM + r"(?: pixels?)?)?"), _route_cursor, ("cursor_nav",)),
+    (re.compile(r"scroll (up|down)(?: (a lot|more|fast|a little|a bit|slowly))?"), _route_scroll, ()),
+    (re.compile(r"(maximi[sz]e|minimi[sz]e|switch)(?: the)?(?: current)?(?: window| windows| app)?"),
+     lambda m: [{"action": "window", "op": _WINDOW_OPS[m.group(1)]}], ()),
+    # Closing is destructive, so a bare "close" still goes to the LLM
+    (re.compile(r"(close)(?: the)?(?: current)? (?:window|app)"),
+     lambda m: [{"action": "window", "op": "close"}], ()),
+    (re.compile(r"alt tab|next window|previous window"), lambda m: [{"action": "window", "op": "switch"}], ()),
+    (re.compile(r"(?:press|hit|tap)(?: the)? (" + '|'.join(sorted(_KEY_NAMES, key=len, reverse=True)) + r")(?: key)?"),
+     lambda m: [{"action": "key", "keys": _KEY_NAMES[m.group(1)]}], ()),
+    (re.compile('(' + '|'.join(sorted(_SHORTCUTS, key=len, reverse=True)) + r")(?: that| it| this)?"),
+     lambda m: [{"action": "key", "keys": list(_SHORTCUTS[m.group(1)])}], ()),
+    (re.compile(r"(?:mouse )?(click|double click|right click)(?: here)?"),
+     lambda m: [{"action": "mouse", "mouse_action": m.group(1).replace(' ', '_')}], ()),
+    (re.compile(r"(show|hide)(?: the)? grid(?: overlay)?"), lambda m: [{"action": f"{m.group(1)}_grid"}], ("grid_nav",)),
+]
+
+
+def route_intent(user_input: str) -> list[dict] | None:
+    """Map simple utterances straight to plan steps; None means ask the LLM."""
+    if not SETTINGS.get("intent_router", True):
+        return None
+    text = normalize_utterance(user_input)
+    if not text:
+        return None
+    feats = SETTINGS.get("features", {})
+    for pattern, build, needs in _INTENT_RULES:
+        m = pattern.fullmatch(text)
+        if not m:
+            continue
+        if not all(feats.get(n, True) for n in needs):
+            return None
+        try:
+            steps = build(m)  # type: ignore[operator]
+        except Exception:
+            steps = None
+        if steps:
+            return steps
+    return None
+
+
+def bench_intent_router(utterances: list[str] | None = None, llm=None) -> dict:
+    """End-to-end plan+dispatch latency: local router vs LLM path with a stubbed client.
+
+    Actions are not executed (plans run with a no-op dispatcher), and plans
+    are requested directly rather than through process_input, so the
+    response cache never answers and every LLM-path call pays its round-trip.
+    Safe to run in a live session: no globals or SETTINGS are changed.
+    """
+    utterances = utterances or ["grid five", "scroll down", "switch window", "press enter", "move cursor left", "copy"]
+    llm = llm or FakeCerebras(ttfb=0.25, chunk_delay=0.01)
+    no_op = lambda step: True  # noqa: E731
+    routed: list[float] = []
+    via_llm: list[float] = []
+    misses: list[str] = []
+    for u in utterances:
+        t0 = time.perf_counter()
+        steps = route_intent(u)
+        if steps is None:
+            misses.append(u)
+        else:
+            handle_ai_response(steps, dispatch=no_op)
+            routed.append(time.perf_counter() - t0)
+        llm.text = json.dumps(steps or [{"action": "chat", "response": "ok"}])
+        t0 = time.perf_counter()
+        handle_ai_response(stream_ai_steps(u, llm=llm), dispatch=no_op)
+        via_llm.append(time.perf_counter() - t0)
+    res = {
+        'router_ms': (sum(routed) / len(routed) * 1000) if routed else 0.0,
+        'llm_ms': (sum(via_llm) / len(via_llm) * 1000) if via_llm else 0.0,
+        'unrouted': misses,
+    }
+    print(f"Intent router: {res['router_ms']:.3f} ms/utterance vs LLM path {res['llm_ms']:.0f} ms; unrouted: {misses}")
+    return res
+
+
+# ===== Plan execution =====
+# Steps that drive the keyboard/mouse/screen; these run strictly in plan order
+_UI_STEPS = {'type', 'key', 'mouse', 'window', 'cursor_nav', 'grid_nav', 'show_grid', 'hide_grid',
+             'click_text', 'double_click_text', 'hover_text', 'type_at_text'}
+# Steps that mostly wait on a process, disk or OCR; these may overlap each other
+_IO_STEPS = {'command', 'observe', 'run_skill', 'update_skill'}
+
+# Per-step timings of the most recent plan (seconds, relative to plan start)
+LAST_PLAN_TIMING: list[dict] = []
+
+_plan_pool = None
+_plan_pool_lock = threading.Lock()
+_active_plans: set = set()
+
+
+def _get_plan_pool():
+    global _plan_pool
+    with _plan_pool_lock:
+        if _plan_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _plan_pool = ThreadPoolExecutor(max_workers=max(2, int(SETTINGS.get("plan_workers", 4))),
+                                            thread_name_prefix='plan')
+        return _plan_pool
+
+
+class PlanExecutor:
+    """Runs plan steps as a dependency graph as they arrive.
+
+    - UI steps wait for every earlier step except chat, so typing never races
+      the command that opens the target window.
+    - command steps keep their order among themselves. They, observe and
+      run_skill wait only for the last UI step, so they overlap one another.
+    - chat is queued speech: it waits for the work submitted before it (so
+      "Done!" is not said before it is done), but blocks nothing; a chat
+      that comes before any work is an acknowledgement and speaks at once.
+    - confirm (and a command that needs a spoken yes) is a barrier.
+
+    Steps start when their dependencies finish. A step returning False
+    (a declined confirm), or cancel(), skips everything not yet started.
+    `dispatch` runs one step (default _dispatch_step).
+    """
+
+    def __init__(self, dispatch=None):
+        self._dispatch = dispatch or _dispatch_step
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._cancelled = threading.Event()
+        self._nodes: list[dict] = []
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._last_ui = None
+        self._last_cmd = None
+        self._barrier = None
+        self._since_barrier: list[dict] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @staticmethod
+    def _kind(step: dict) -> str:
+        action = step.get('action')
+        if action == 'confirm' or (action == 'command' and _command_needs_confirmation(step.get('command', ''))):
+            return 'barrier'
+        if action == 'chat':
+            return 'speech'
+        if action in _IO_STEPS:
+            return 'io'
+        return 'ui'  # unknown actions stay ordered
+
+    def submit(self, step: dict):
+        kind = self._kind(step)
+        node = {'index': len(self._nodes), 'action': step.get('action'), 'kind': kind, 'step': step,
+                'waiting': 0, 'dependents': [], 'done': False, 'status': 'pending',
+                'queued': time.perf_counter() - self._t0}
+        with self._lock:
+            if kind == 'barrier':
+                deps = list(self._since_barrier)
+            elif kind in ('ui', 'speech'):
+                deps = [n for n in self._since_barrier if n['kind'] != 'speech']
+            elif kind == 'io':
+                deps = [self._last_ui] if self._last_ui else []
+                if node['action'] == 'command' and self._last_cmd:
+                    deps.append(self._last_cmd)
+            if self._barrier is not None:
+                deps.append(self._barrier)
+            deps = [d for d in deps if not d['done']]
+            node['waiting'] = len(deps)
+            for d in deps:
+                d['dependents'].append(node)
+            self._nodes.append(node)
+            self._pending += 1
+            if kind == 'barrier':
+                self._barrier, self._since_barrier = node, []
+                self._last_ui = self._last_cmd = None
+            else:
+                self._since_barrier.append(node)
+                if kind == 'ui':
+                    self._last_ui = node
+                elif node['action'] == 'command':
+                    self._last_cmd = node
+            ready = node['waiting'] == 0
+        if ready:
+            self._start(node)
+
+    def _start(self, node: dict):
+        _get_plan_pool().submit(self._run, node)
+
+    def _run(self, node: dict):
+        ok = True
+        try:
+            if self.cancelled:
+                node['status'] = 'skipped'
+                return
+            node['start'] = time.perf_counter() - self._t0
+            node['status'] = 'running'
+            ok = self._dispatch(node['step'])
+            node['status'] = 'done' if ok else 'stopped'
+        except Exception as e:
+            node['status'] = 'error'
+            print('Step failed:', node['action'], e)
+        finally:
+            node['end'] = time.perf_counter() - self._t0
+            if ok is False:
+                self.cancel()
+            ready = []
+            with self._lock:
+                node['done'] = True
+                for d in node['dependents']:
+                    d['waiting'] -= 1
+                    if d['waiting'] == 0:
+                        ready.append(d)
+                self._pending -= 1
+                self._idle.notify_all()
+            for d in ready:
+                self._start(d)
+
+    def join(self, timeout: float | None = None) -> bool:
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def timings(self) -> list[dict]:
+        out = []
+        for n in self._nodes:
+            row = {'index': n['index'], 'action': n['action'], 'status': n['status'], 'queued': n['queued']}
+            if 'start' in n:
+                row['wait'] = n['start'] - n['queued']
+                row['run'] = n.get('end', n['start']) - n['start']
+                row['start'], row['end'] = n['start'], n.get('end', n['start'])
+            out.append(row)
+        return out
+
+
+def cancel_plan():
+    """Stop the running plan(s): steps that have not started yet are skipped and running commands are killed."""
+    for plan in list(_active_plans):
+        plan.cancel()
+    cancel_commands()
+
+
+def process_input(user_input, on_step=None):
+    """Plan and execute one user utterance, streaming steps when enabled."""
+    state_bus.publish('thinking')
+    try:
+        _process_input(user_input, on_step)
+    except Exception as e:
+        state_bus.publish('error', str(e))
+        raise
+    finally:
+        if state_bus.pipeline_state != 'error':
+            state_bus.publish('idle')
+
+
+def _process_input(user_input, on_step=None):
+    routed = route_intent(user_input)
+    if routed is not None:
+        print('[Barbaric] Local intent:', routed)
+        handle_ai_response(routed, on_step=on_step)
+        return
+    cached = response_cache.get(user_input)
+    if cached is not None:
+        print('[Barbaric] Using cached plan for:', normalize_utterance(user_input))
+        handle_ai_response(cached, on_step=on_step)
+        return
+    if SETTINGS.get("stream_llm", True):
+        plan = stream_ai_steps(user_input)
+        seen: list[dict] = []
+
+        def _record(step):
+            seen.append(step)
+            if on_step:
+                on_step(step)
+        handle_ai_response(plan, on_step=_record)
+        # Only a fully received plan may be cached
+        if 'total' in plan.timing:
+            response_cache.put(user_input, seen)
+    else:
+        plan = get_ai_response(user_input)
+        handle_ai_response(plan, on_step=on_step)
+        try:
+            data = json.loads(plan)
+            response_cache.put(user_input, data if isinstance(data, list) else [data])
+        except Exception:
+            pass
+
+
+def handle_ai_response(ai_response, on_step=None, dispatch=None):
+    """Run a plan: a JSON string from the LLM, or an iterable of step dicts (e.g. a StepStream).
+    `dispatch` replaces _dispatch_step for running each step (benchmarks pass a no-op)."""
+    dispatch = dispatch or _dispatch_step
+    try:
+        if isinstance(ai_response, (str, bytes)):
+            data = json.loads(ai_response)
+            steps = data if isinstance(data, list) else [data]
+        else:
+            steps = ai_response
+        if not SETTINGS.get("concurrent_steps", True):
+            for step in steps:
+                state_bus.publish('acting', step.get('action') if isinstance(step, dict) else None)
+                if on_step:
+                    try:
+                        on_step(step)
+                    except Exception:
+                        pass
+                if not dispatch(step):
+                    break
+            return
+        plan = PlanExecutor(dispatch)
+        _active_plans.add(plan)
+        try:
+            for step in steps:
+                if plan.cancelled:
+                    break
+                state_bus.publish('acting', step.get('action') if isinstance(step, dict) else None)
+                if on_step:
+                    try:
+                        on_step(step)
+                    except Exception:
+                        pass
+                plan.submit(step)
+        finally:
+            plan.join()
+            _active_plans.discard(plan)
+            LAST_PLAN_TIMING[:] = plan.timings()
+    except Exception as e:
+        print('AI raw response:', getattr(ai_response, 'raw', ai_response))
+        state_bus.publish('error', 'Could not process the AI response')
+        speak('Sorry, I could not process the AI response.', priority='urgent')
+        print('Error:', e)
+
+
+def _step_region(step: dict):
+    # Optional search hint on *_text steps: "cell" (1-9) or "region"
+    cell = step.get('cell')
+    return cell if cell not in (None, '') else step.get('region')
+
+
+def _dispatch_step(step) -> bool:
+    """Execute a single plan step. Returns False when the workflow should stop."""
+    action = step.get('action')
+    if action == 'command':
+        cmd = step.get('command', '')
+        if cmd:
+            if SETTINGS.get("features", {}).get("speak_ack", True):
+                speak(f'Executing: {cmd}', priority='ack')
+            execute_command(cmd, timeout=step.get('timeout'))
+        else:
+            speak('No command provided by AI.', priority='urgent')
+    elif action == 'type':
+        text_to_type = step.get('text', '')
+        if text_to_type:
+            if SETTINGS.get("features", {}).get("speak_ack", True):
+                speak(f'Typing: {text_to_type}', priority='ack')
+            type_text(text_to_type)
+        else:
+            speak('No text provided to type.', priority='urgent')
+    elif action == 'mouse':
+        mouse_action = step.get('mouse_action', '')
+        mouse_value = step.get('value', None)
+        speed = step.get('speed', None)
+        if SETTINGS.get("features", {}).get("speak_ack", True):
+            speak(f'Performing mouse action: {mouse_action}', priority='ack')
+        control_mouse(mouse_action, mouse_value, speed)
+    elif action == 'cursor_nav':
+        if not SETTINGS.get("features", {}).get("cursor_nav", True):
+            speak('Cursor navigation is disabled in settings.', priority='urgent')
+            return True
+        direction = step.get('direction', '')
+        amount = step.get('amount', None)
+        cursor_nav(direction, amount)
+    elif action == 'grid_nav':
+        if not SETTINGS.get("features", {}).get("grid_nav", True):
+            speak('Grid navigation is disabled in settings.', priority='urgent')
+            return True
+        cell = step.get('cell', None)
+        grid_nav(cell)
+    elif action == 'window':
+        op = step.get('op', '')
+        control_window(op)
+    elif action == 'observe':
+        if not SETTINGS.get("features", {}).get("ocr", True):
+            speak('OCR features are disabled in settings.', priority='urgent')
+            return True
+        txt = screen_ocr()
+        summary = (txt[:600] + '…') if txt and len(txt) > 600 else (txt or '')
+        if summary:
+            speak('I analyzed the screen and found some text.')
+            print('SCREEN OCR:\n', summary)
+        else:
+            speak('I could not read any text from the screen.', priority='urgent')
+    elif action == 'click_text':
+        if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
+            speak('Click by text is disabled in settings.', priority='urgent')
+            return True
+        label = step.get('text', '')
+        if label:
+            ok = click_by_text(label, region=_step_region(step))
+            if not ok:
+                speak('I could not find that text on screen.', priority='urgent')
+    elif action == 'double_click_text':
+        if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
+            speak('Click by text is disabled in settings.', priority='urgent')
+            return True
+        label = step.get('text', '')
+        if label:
+            ok = click_by_text(label, clicks=2, region=_step_region(step))
+            if not ok:
+                speak('I could not find that text on screen.', priority='urgent')
+    elif action == 'hover_text':
+        if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
+            speak('Hover by text is disabled in settings.', priority='urgent')
+            return True
+        label = step.get('text', '')
+        if label:
+            ok = click_by_text(label, clicks=0, move_only=True, region=_step_region(step))
+            if not ok:
+                speak('I could not locate that text to hover.', priority='urgent')
+    elif action == 'type_at_text':
+        if not (SETTINGS.get("features", {}).get("ocr", True) and SETTINGS.get("features", {}).get("click_text", True)):
+            speak('Type at text is disabled in settings.', priority='urgent')
+            return True
+        label = step.get('text', '')
+        value = step.get('value', '')
+        if label and value:
+            ok = click_by_text(label, region=_step_region(step))
+            if ok:
+                type_text(value)
+            else:
+                speak('I could not find the target field by text.', priority='urgent')
+    elif action == 'run_skill':
+        if not SETTINGS.get("features", {}).get("skills", False):
+            speak('Skills are disabled in settings.', priority='urgent')
+            return True
+        name = step.get('name', '')
+        payload = step.get('payload', {})
+        res = run_skill(name, payload)
+        if res is not None:
+            out = str(res)
+            print('Skill result:', out)
+            speak(out[:200])
+    elif action == 'update_skill':
+        if not SETTINGS.get("features", {}).get("skills", False):
+            speak('Skills are disabled in settings.', priority='urgent')
+        elif not SETTINGS.get('dev_mode'):
+            speak('Developer mode is off; code updates are blocked.', priority='urgent')
+        else:
+            name = step.get('name', '')
+            code = step.get('code', '')
+            ok, msg = update_skill(name, code)
+            speak(msg)
+    elif action == 'show_grid':
+        if not SETTINGS.get("features", {}).get("grid_nav", True):
+            speak('Grid navigation is disabled in settings.', priority='urgent')
+            return True
+        _ui = get_ui()
+        fn = getattr(_ui, 'show_grid_overlay', None) if _ui else None
+        if callable(fn):
+            fn()
+        else:
+            speak('Grid overlay not available.', priority='urgent')
+    elif action == 'hide_grid':
+        if not SETTINGS.get("features", {}).get("grid_nav", True):
+            return True
+        _ui = get_ui()
+        fn = getattr(_ui, 'hide_grid_overlay', None) if _ui else None
+        if callable(fn):
+            fn()
+        else:
+            speak('Grid overlay not available.', priority='urgent')
+    elif action == 'key':
+        keys = step.get('keys', '')
+        press_keys(keys)
+    elif action == 'chat':
+        resp = step.get('response', '')
+        print('AI:', resp)
+        speak(resp)
+    elif action == 'confirm':
+        resp = step.get('response', '')
+        print('AI:', resp)
+        with _ConfirmationPending():
+            speak(resp, priority='urgent')
+            confirmation = listen().lower()
+        if 'yes' in confirmation:
+            return True
+        else:
+            speak('Workflow cancelled.', priority='urgent')
+            return False
+    else:
+        speak('Sorry, I did not understand the AI workflow step.', priority='urgent')
+    return True
+
+
+# ===== Startup (background warm-up, import profiling, startup benchmark) =====
+# Seconds spent importing this module and warming each subsystem (see warm_up())
+STARTUP_TIMING: dict[str, float] = {}
+
+
+def warm_up(background: bool = True, on_done=None):
+    """Create the lazily initialized subsystems ahead of their first use.
+
+    Runs in the order the user is likely to need them: the TTS engine for the
+    first reply, the speech model, the LLM connection, input injection, OCR and
+    finally the phrase cache. Each piece still initializes itself on demand if
+    it is used before the warm-up reaches it.
+    """
+    def _run():
+        t_all = time.perf_counter()
+        steps = [
+            ('tts', lambda: (_ensure_tts_thread(), get_tts_engine())),
+            ('stt', lambda: preload_stt(background=False)),
+            ('llm', warm_up_llm),
+            ('pyautogui', pyautogui.load),
+        ]
+        if SETTINGS.get("features", {}).get("ocr", True):
+            steps.append(('ocr', lambda: preload_ocr(background=False)))
+        steps.append(('phrases', lambda: prerender_phrases(background=False)))
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                print(f'Warm-up of {name} failed:', e)
+            STARTUP_TIMING[f'warm_{name}'] = time.perf_counter() - t0
+        STARTUP_TIMING['warm_total'] = time.perf_counter() - t_all
+        if on_done:
+            on_done()
+    if SETTINGS.get("features", {}).get("ocr", True):
+        _preimport_ocr_bindings()
+    if background:
+        threading.Thread(target=_run, daemon=True).start()
+    else:
+        _run()
+
+
+def profile_imports(module: str = 'main', top: int = 15) -> list[tuple[str, float]]:
+    """Slowest imports (cumulative seconds) when importing `module` in a fresh interpreter."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, timeout=120,
+                          cwd=str(Path(__file__).resolve().parent))
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            rows.append((parts[2].strip(), int(parts[1]) / 1e6))
+        except (IndexError, ValueError):
+            continue  # column header
+    rows.sort(key=lambda r: r[1], reverse=True)
+    for name, secs in rows[:top]:
+        print(f'{secs * 1000:8.1f} ms  {name}')
+    if proc.returncode:
+        print('Import failed:', proc.stderr.strip().splitlines()[-1:])
+    return rows[:top]
+
+
+def bench_startup(runs: int = 3, timeout: float = 30.0) -> dict:
+    """Launch the UI in fresh processes and time its startup from process launch.
+
+    time-to-window: until the main window is mapped. time-to-first-listen:
+    Speak is pressed as soon as the window shows; measured until the state bus
+    reports 'listening' (needs a microphone). The child also reports its own
+    STARTUP_TIMING (import of main, per-subsystem warm-up).
+    """
+    script = Path(__file__).resolve().parent / 'barbaric_ui.py'
+    runs_out = []
+    for _ in range(max(1, runs)):
+        marks: dict = {}
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, str(script), '--bench-startup'], cwd=str(script.parent),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+        def _read(p=proc, m=marks, start=t0):
+            for line in p.stdout:
+                if not line.startswith('STARTUP '):
                     continue
-                else:
-                    speak('Workflow cancelled.')
-                    break
-            else:
-                speak('Sorry, I did not understand the AI workflow step.')
-    except Exception as e:
-        print('AI raw response:', ai_response)
-        speak('Sorry, I could not process the AI response.')
-        print('Error:', e)
+                name, _, rest = line[len('STARTUP '):].strip().partition(' ')
+                m[name] = time.perf_counter() - start
+                if name == 'timing':
+                    try:
+                        m['child'] = json.loads(rest)
+                    except ValueError:
+                        pass
+                elif rest:
+                    m[name + '_detail'] = rest
+        reader = threading.Thread(target=_read, daemon=True)
+        reader.start()
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            marks['timed_out'] = True
+        reader.join(1.0)
+        runs_out.append(marks)
+
+    def _median(key):
+        vals = sorted(r[key] for r in runs_out if key in r)
+        return vals[len(vals) // 2] if vals else None
+    result = {'runs': runs_out, 'window_s': _median('window'), 'listen_s': _median('listen')}
+    fmt = lambda v: f'{v * 1000:.0f} ms' if v is not None else 'n/a'
+    print(f"time-to-window {fmt(result['window_s'])}, time-to-first-listen {fmt(result['listen_s'])} "
+          f"(median of {len(runs_out)})")
+    child = next((r['child'] for r in reversed(runs_out) if 'child' in r), {})
+    for k, v in child.items():
+        print(f'  {k:>14}: {v * 1000:7.1f} ms')
+    for r in runs_out:
+        if 'listen_failed_detail' in r:
+            print('  first listen failed:', r['listen_failed_detail'])
+            break
+    return result
+
 
 def main():
+    warm_up()
     speak(f"Hello! I am {AGENT_NAME}, your smart assistant. How can I help you today?")
     while True:
         user_input = listen()
@@ -603,88 +3817,1067 @@ def main():
             if 'exit' in user_input.lower() or 'बंद' in user_input:
                 speak('Goodbye!')
                 break
-            ai_response = get_ai_response(user_input)
-            handle_ai_response(ai_response)
+            process_input(user_input)
 
-if __name__ == '__main__':
-    main()
 
 # ===== Screen observation helpers =====
+_PYTESSERACT_CACHE: dict = {}
+
+
 def _get_pytesseract():
-    """Attempt to import pytesseract and configure tesseract_cmd if provided. Returns (module_or_None, error_str_or_None)."""
+    """Attempt to import pytesseract and configure tesseract_cmd if provided. Returns (module_or_None, error_str_or_None).
+    The import and configuration are cached; they are redone only when tesseract_cmd changes."""
+    cmd = SETTINGS.get('tesseract_cmd')
+    cached = _PYTESSERACT_CACHE.get('result')
+    if cached is not None and _PYTESSERACT_CACHE.get('cmd') == cmd:
+        return cached
     try:
         import pytesseract as _pt
-        cmd = SETTINGS.get('tesseract_cmd')
         if cmd:
             try:
                 _pt.pytesseract.tesseract_cmd = cmd
             except Exception:
                 pass
-        return _pt, None
+        result = (_pt, None)
     except Exception as e:
-        return None, str(e)
+        result = (None, str(e))
+    _PYTESSERACT_CACHE.update(cmd=cmd, result=result)
+    return result
+
+
+_OCR_DATA_KEYS = ('text', 'left', 'top', 'width', 'height', 'conf', 'block_num', 'par_num', 'line_num')
+
+
+def _ocr_workers() -> int:
+    n = int(SETTINGS.get("ocr", {}).get("workers", 0) or 0)
+    return n if n > 0 else max(1, min(4, os.cpu_count() or 1))
+
+
+def _tesseract_binary() -> str | None:
+    import shutil
+    cmd = SETTINGS.get('tesseract_cmd')
+    if cmd and os.path.isfile(cmd):
+        return cmd
+    return shutil.which(cmd or 'tesseract') or shutil.which('tesseract')
+
+
+class OCREngine(ABC):
+    """Common interface for OCR backends. image_to_data() returns the same column
+    layout as pytesseract's Output.DICT, so callers don't care which engine ran."""
+
+    name = 'base'
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @abstractmethod
+    def image_to_data(self, img) -> dict:
+        """OCR one image; columns as pytesseract's Output.DICT (text, conf, left, top, ...)."""
+
+    def image_to_string(self, img) -> str:
+        data = self.image_to_data(img)
+        lines: dict[tuple, list[str]] = {}
+        for i, t in enumerate(data['text']):
+            if t and t.strip():
+                lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(t.strip())
+        return '\n'.join(' '.join(ws) for ws in lines.values())
+
+    def version(self) -> str:
+        return ''
+
+    def map_data(self, images: list) -> list[dict]:
+        """OCR several images concurrently across the engine's workers (order preserved)."""
+        if len(images) <= 1 or self.workers <= 1:
+            return [self.image_to_data(im) for im in images]
+        with self._pool_lock:
+            if self._pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'ocr-{self.name}')
+        return list(self._pool.map(self.image_to_data, images))
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+class TesserocrEngine(OCREngine):
+    """In-process Tesseract through tesserocr. Each worker keeps its own
+    PyTessBaseAPI with the language model loaded. Recognition releases the GIL,
+    so a thread pool runs in parallel across cores."""
+
+    name = 'tesserocr'
+
+    def __init__(self, workers: int = 1, lang: str = 'eng'):
+        super().__init__(workers)
+        import tesserocr  # noqa: F401  (fail fast if the binding is missing)
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self._path = self._tessdata()
+        self._apis: queue.Queue = queue.Queue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._apis.put(self._new_api())  # load the model now, not on the first click
+
+    @staticmethod
+    def _tessdata() -> str | None:
+        path = SETTINGS.get("ocr", {}).get("tessdata")
+        if path:
+            return path
+        cmd = SETTINGS.get('tesseract_cmd')
+        if cmd:
+            guess = os.path.join(os.path.dirname(cmd), 'tessdata')
+            if os.path.isdir(guess):
+                return guess
+        return None
+
+    def _new_api(self):
+        kwargs = {'lang': self.lang}
+        if self._path:
+            kwargs['path'] = self._path
+        api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        self._created += 1
+        return api
+
+    def _acquire(self):
+        try:
+            return self._apis.get_nowait()
+        except queue.Empty:
+            pass
+        with self._create_lock:
+            if self._created < self.workers:
+                return self._new_api()
+        return self._apis.get()
+
+    def version(self) -> str:
+        return self._tesserocr.tesseract_version().splitlines()[0]
+
+    def image_to_data(self, img) -> dict:
+        RIL = self._tesserocr.RIL
+        api = self._acquire()
+        try:
+            api.SetImage(img)
+            api.Recognize()
+            data = {k: [] for k in _OCR_DATA_KEYS}
+            it = api.GetIterator()
+            block = par = line = 0
+            if it is not None:
+                while True:
+                    if it.IsAtBeginningOf(RIL.BLOCK):
+                        block, par, line = block + 1, 0, 0
+                    if it.IsAtBeginningOf(RIL.PARA):
+                        par, line = par + 1, 0
+                    if it.IsAtBeginningOf(RIL.TEXTLINE):
+                        line += 1
+                    try:
+                        text = it.GetUTF8Text(RIL.WORD)
+                    except RuntimeError:  # empty word
+                        text = ''
+                    box = it.BoundingBox(RIL.WORD)
+                    if text and box:
+                        x0, y0, x1, y1 = box
+                        for k, v in zip(_OCR_DATA_KEYS, (text, x0, y0, x1 - x0, y1 - y0, it.Confidence(RIL.WORD), block, par, line)):
+                            data[k].append(v)
+                    if not it.Next(RIL.WORD):
+                        break
+            return data
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def close(self):
+        super().close()
+        while True:
+            try:
+                self._apis.get_nowait().End()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+
+class TesseractCLIEngine(OCREngine):
+    """The tesseract executable, fed the image on stdin and read back as TSV on
+    stdout, so there is no temp file on disk. The CLI cannot stay resident
+    between calls, so this is the fallback when tesserocr is not installed.
+    Calls still run concurrently, up to `workers` at a time."""
+
+    name = 'cli'
+
+    def __init__(self, workers: int = 1, lang: str = 'eng'):
+        super().__init__(workers)
+        self.cmd = _tesseract_binary()
+        if not self.cmd:
+            raise RuntimeError('tesseract executable not found (set tesseract_cmd in settings)')
+        self.lang = lang
+
+    def _run(self, args: list[str], stdin: bytes | None = None) -> bytes:
+        res = subprocess.run([self.cmd, *args], input=stdin, capture_output=True, timeout=60,
+                             creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        if res.returncode != 0:
+            raise RuntimeError((res.stderr or b'').decode('utf-8', 'replace').strip() or f'tesseract exited {res.returncode}')
+        return res.stdout
+
+    def version(self) -> str:
+        return self._run(['--version']).decode('utf-8', 'replace').splitlines()[0]
+
+    def image_to_data(self, img) -> dict:
+        import io
+        buf = io.BytesIO()
+        img.save(buf, format='PNG', compress_level=1)
+        out = self._run(['stdin', 'stdout', '-l', self.lang, 'tsv'], buf.getvalue()).decode('utf-8', 'replace')
+        data = {k: [] for k in _OCR_DATA_KEYS}
+        rows = out.splitlines()
+        if not rows:
+            return data
+        header = rows[0].split('\t')
+        col = {name: i for i, name in enumerate(header)}
+        for row in rows[1:]:
+            f = row.split('\t')
+            if len(f) < len(header) or f[col['level']] != '5':
+                continue
+            data['text'].append(f[col['text']])
+            for k in ('left', 'top', 'width', 'height', 'block_num', 'par_num', 'line_num'):
+                data[k].append(int(f[col[k]]))
+            data['conf'].append(float(f[col['conf']]))
+        return data
+
+
+class PytesseractEngine(OCREngine):
+    """Plain pytesseract (one process and temp file per call); last resort."""
+
+    name = 'pytesseract'
+
+    def __init__(self, workers: int = 1, lang: str = 'eng'):
+        super().__init__(workers)
+        pt, err = _get_pytesseract()
+        if pt is None:
+            raise RuntimeError(f'pytesseract not available: {err}')
+        self._pt = pt
+        self.lang = lang
+
+    def version(self) -> str:
+        return str(self._pt.get_tesseract_version())
+
+    def image_to_data(self, img) -> dict:
+        d = self._pt.image_to_data(img, lang=self.lang, output_type=self._pt.Output.DICT)
+        return {k: list(d.get(k, [])) for k in _OCR_DATA_KEYS}
+
+    def image_to_string(self, img) -> str:
+        return self._pt.image_to_string(img, lang=self.lang)
+
+
+OCR_ENGINES = {
+    'tesserocr': TesserocrEngine,
+    'cli': TesseractCLIEngine,
+    'pytesseract': PytesseractEngine,
+}
+_ocr_engine_state: dict = {}
+_ocr_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """Return (engine_or_None, error_str_or_None). The engine is built once and kept
+    warm; it is rebuilt only when the engine choice, tesseract path or pool size changes.
+    "auto" prefers tesserocr, then the stdin/stdout CLI, then pytesseract."""
+    cfg = SETTINGS.get("ocr", {})
+    choice = cfg.get("engine", "auto")
+    key = (choice, SETTINGS.get('tesseract_cmd'), cfg.get("tessdata"), cfg.get("lang", "eng"), _ocr_workers())
+    with _ocr_engine_lock:
+        if _ocr_engine_state.get('key') == key:
+            return _ocr_engine_state['engine'], _ocr_engine_state['error']
+        old = _ocr_engine_state.get('engine')
+        if old is not None:
+            old.close()
+        engine, err = create_ocr_engine(choice, workers=key[-1], lang=key[3])
+        _ocr_engine_state.update(key=key, engine=engine, error=err)
+        return engine, err
+
+
+def create_ocr_engine(choice: str = 'auto', workers: int = 1, lang: str = 'eng'):
+    """Build a new, unshared engine; returns (engine_or_None, error_str_or_None).
+    The caller owns it and must close() it. get_ocr_engine() keeps the shared one."""
+    names = list(OCR_ENGINES) if choice == 'auto' else [choice]
+    errors = []
+    for name in names:
+        cls = OCR_ENGINES.get(name)
+        if cls is None:
+            errors.append(f'{name}: unknown engine')
+            continue
+        try:
+            return cls(workers=workers, lang=lang), None
+        except Exception as e:
+            errors.append(f'{name}: {e}')
+    return None, '; '.join(errors)
+
+
+def _preimport_ocr_bindings():
+    # tesserocr's cysignals installs signal handlers on import, which fails off the main
+    # thread; import it here (main thread) so the engine can then be built anywhere.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if SETTINGS.get("ocr", {}).get("engine", "auto") not in ('auto', 'tesserocr'):
+        return
+    try:
+        import tesserocr  # noqa: F401
+    except Exception:
+        pass
+
+
+def preload_ocr(background: bool = True):
+    """Start the OCR engine (and load its language model) ahead of the first observe/click."""
+    _preimport_ocr_bindings()
+
+    def _load():
+        try:
+            engine, err = get_ocr_engine()
+            if engine is None:
+                print('OCR engine not available:', err)
+        except Exception as e:
+            print('OCR preload failed:', e)
+    if background:
+        threading.Thread(target=_load, daemon=True).start()
+    else:
+        _load()
+
+
+# ===== Screen snapshot cache (tile hashing, incremental OCR) =====
+_SCREENSHOT_PROVIDER = None
+
+
+def set_screenshot_provider(fn=None):
+    """Override how the screen is captured (e.g. a fake returning canned PIL images). None restores pyautogui."""
+    global _SCREENSHOT_PROVIDER
+    _SCREENSHOT_PROVIDER = fn
+    screen_cache.reset()
+
+
+def _grab_screen():
+    return (_SCREENSHOT_PROVIDER or pyautogui.screenshot)()
+
+
+def _words_from_data(data: dict, dx: int, dy: int, region: int, scale: float = 1.0) -> list[dict]:
+    words = []
+    for i, txt in enumerate(data.get('text', [])):
+        t = (txt or '').strip()
+        if not t:
+            continue
+        words.append({
+            'text': t,
+            'left': int(int(data['left'][i]) / scale) + dx,
+            'top': int(int(data['top'][i]) / scale) + dy,
+            'width': max(1, int(int(data['width'][i]) / scale)),
+            'height': max(1, int(int(data['height'][i]) / scale)),
+            'conf': float(data.get('conf', [-1] * (i + 1))[i]),
+            'region': region,
+            'block': int(data.get('block_num', [0] * (i + 1))[i]),
+            'par': int(data.get('par_num', [0] * (i + 1))[i]),
+            'line': int(data.get('line_num', [0] * (i + 1))[i]),
+        })
+    return words
+
+
+def _split_tiles(box: tuple[int, int, int, int], size: int, overlap: int) -> list[tuple[int, int, int, int]]:
+    """Cover `box` with roughly size x size tiles that overlap their neighbours by `overlap` px."""
+    x0, y0, x1, y1 = box
+    cols = max(1, math.ceil((x1 - x0) / size))
+    rows = max(1, math.ceil((y1 - y0) / size))
+    tw, th = math.ceil((x1 - x0) / cols), math.ceil((y1 - y0) / rows)
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            tiles.append((max(x0, x0 + c * tw - overlap), max(y0, y0 + r * th - overlap),
+                          min(x1, x0 + (c + 1) * tw + overlap), min(y1, y0 + (r + 1) * th + overlap)))
+    return tiles
+
+
+def _merge_tile_words(per_tile: list[tuple[tuple[int, int, int, int], list[dict]]],
+                      outer: tuple[int, int, int, int]) -> list[dict]:
+    """Combine words OCRed from overlapping tiles.
+
+    Near an inner tile edge a word loses context or is cut off ("Cle" for
+    "Close"), so the copy with the most room to its tile's inner edges wins
+    (up to `cap` px), then higher confidence; a word is dropped when most of it
+    is already covered by an accepted word. Lines that were split by a
+    vertical tile edge are then re-joined so phrase lookups still see them.
+    Both passes only compare words that are close together (a coarse spatial
+    grid, and line groups near a shared tile edge), so dense screens stay linear.
+    """
+    cap = int(SETTINGS.get("ocr", {}).get("tiled_overlap", 48))
+    cands = []
+    edges = set()
+    for (tx0, ty0, tx1, ty1), words in per_tile:
+        if tx0 > outer[0]:
+            edges.add(tx0)
+        if tx1 < outer[2]:
+            edges.add(tx1)
+        for w in words:
+            l, t, r, b = w['left'], w['top'], w['left'] + w['width'], w['top'] + w['height']
+            room = min([cap] + [d for d, inner in ((l - tx0, tx0 > outer[0]), (tx1 - r, tx1 < outer[2]),
+                                                   (t - ty0, ty0 > outer[1]), (ty1 - b, ty1 < outer[3])) if inner])
+            cands.append((-room, -w['conf'], w))
+    cands.sort(key=lambda c: (c[0], c[1]))
+
+    # Accepted words indexed by the grid cells their boxes cover
+    cell = 128
+    grid: dict[tuple[int, int], list[dict]] = {}
+    kept: list[dict] = []
+    for _room, _c, w in cands:
+        wb = (w['left'], w['top'], w['left'] + w['width'], w['top'] + w['height'])
+        area = max(1, w['width'] * w['height'])
+        cells = [(cx, cy) for cx in range(wb[0] // cell, (wb[2] - 1) // cell + 1)
+                 for cy in range(wb[1] // cell, (wb[3] - 1) // cell + 1)]
+        dup = False
+        for key in cells:
+            for k in grid.get(key, ()):
+                ix = min(wb[2], k['left'] + k['width']) - max(wb[0], k['left'])
+                iy = min(wb[3], k['top'] + k['height']) - max(wb[1], k['top'])
+                if ix > 0 and iy > 0 and ix * iy > 0.5 * min(area, max(1, k['width'] * k['height'])):
+                    dup = True
+                    break
+            if dup:
+                break
+        if not dup:
+            kept.append(w)
+            for key in cells:
+                grid.setdefault(key, []).append(w)
+
+    # Re-join lines across tiles: same row band, small horizontal gap, different tiles
+    groups: dict[tuple, list[dict]] = {}
+    for w in kept:
+        groups.setdefault((w['region'], w['block'], w['par'], w['line']), []).append(w)
+    parent = {k: k for k in groups}
+
+    def _root(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    bbox = {k: (min(w['left'] for w in g), min(w['top'] for w in g),
+                max(w['left'] + w['width'] for w in g), max(w['top'] + w['height'] for w in g))
+            for k, g in groups.items()}
+    # Only a line that ends near a vertical tile edge can have been split by it
+    edge_list = sorted(edges)
+
+    def _near_edge(A):
+        reach = cap + 1.5 * (A[3] - A[1])
+        return any(A[0] - reach <= e <= A[2] + reach for e in edge_list)
+    near = sorted((k for k in groups if _near_edge(bbox[k])), key=lambda k: bbox[k][1])
+    for i, a in enumerate(near):
+        A = bbox[a]
+        for b in near[i + 1:]:
+            B = bbox[b]
+            if B[1] >= A[3]:
+                break  # sorted by top: nothing further down overlaps this row
+            if a[0] == b[0]:
+                continue
+            h = min(A[3] - A[1], B[3] - B[1])
+            v_overlap = min(A[3], B[3]) - max(A[1], B[1])
+            gap = max(A[0], B[0]) - min(A[2], B[2])
+            if h > 0 and v_overlap > 0.6 * h and gap < 1.5 * h:
+                parent[_root(b)] = _root(a)
+    for k, g in groups.items():
+        root = _root(k)
+        if root != k:
+            for w in g:
+                w['region'], w['block'], w['par'], w['line'] = root
+    return kept
+
+
+class PreparedImage:
+    """An OCR-ready image plus how to map its pixel coordinates back to the original crop."""
+
+    __slots__ = ('image', 'scale', 'dx', 'dy', 'inverted')
+
+    def __init__(self, image, scale: float = 1.0, dx: int = 0, dy: int = 0, inverted: bool = False):
+        self.image = image
+        self.scale = scale
+        self.dx = dx
+        self.dy = dy
+        self.inverted = inverted
+
+
+def _text_height(ink) -> float:
+    """Median height of the horizontal bands that contain ink (a cheap x-height proxy)."""
+    import numpy as np  # type: ignore
+    rows = ink.any(axis=1).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows, [0]))))
+    heights = edges[1::2] - edges[::2]
+    heights = heights[heights >= 3]
+    return float(np.median(heights)) if heights.size else 0.0
+
+
+def preprocess_for_ocr(img, cfg: dict | None = None) -> PreparedImage | None:
+    """Prepare a grayscale crop for Tesseract; returns None when there is nothing to read.
+
+    Steps (each switchable under SETTINGS["ocr"]["preprocess"]):
+      - drop_uniform: blank out flat blocks and crop to the area that has content
+      - invert_dark: light-on-dark themes are inverted to dark-on-light
+      - upscale: small UI text is enlarged so glyphs reach Tesseract's preferred size
+      - binarize: Sauvola-style adaptive threshold from integral images
+    `cfg` replaces those settings for this call. Without NumPy the image is passed through unchanged.
+    """
+    if cfg is None:
+        cfg = SETTINGS.get("ocr", {}).get("preprocess", {})
+    if not cfg.get("enabled", True):
+        return PreparedImage(img)
+    try:
+        import numpy as np  # type: ignore
+    except Exception:
+        return PreparedImage(img)
+    from PIL import Image  # type: ignore
+
+    a = np.asarray(img.convert('L'), dtype=np.uint8)
+    if a.size == 0:
+        return None
+    dx = dy = 0
+    inverted = False
+
+    if cfg.get("drop_uniform", True):
+        block = int(cfg.get("block", 16))
+        h, w = a.shape
+        hb, wb = -(-h // block), -(-w // block)
+        padded = np.pad(a, ((0, hb * block - h), (0, wb * block - w)), mode='edge').astype(np.int16)
+        tiles = padded.reshape(hb, block, wb, block)
+        busy = (tiles.max(axis=(1, 3)) - tiles.min(axis=(1, 3))) > int(cfg.get("uniform_range", 24))
+        if not busy.any():
+            return None
+        # Grow by one block so glyphs at a block edge keep their neighbours
+        grown = busy.copy()
+        grown[1:, :] |= busy[:-1, :]
+        grown[:-1, :] |= busy[1:, :]
+        grown[:, 1:] |= grown[:, :-1].copy()
+        grown[:, :-1] |= grown[:, 1:].copy()
+        ys, xs = np.nonzero(grown)
+        y0, y1 = ys.min() * block, min(h, (ys.max() + 1) * block)
+        x0, x1 = xs.min() * block, min(w, (xs.max() + 1) * block)
+        mask = np.repeat(np.repeat(grown, block, axis=0), block, axis=1)[:h, :w]
+        bg = np.uint8(np.median(a[~mask])) if (~mask).any() else np.uint8(255)
+        a = np.where(mask, a, bg)[y0:y1, x0:x1]
+        dx, dy = int(x0), int(y0)
+
+    if cfg.get("invert_dark", True) and float(np.median(a)) < 110:
+        a = 255 - a
+        inverted = True
+
+    scale = 1.0
+    if cfg.get("upscale", True):
+        ink = a < (int(a.mean()) - 30)
+        th = _text_height(ink)
+        target = float(cfg.get("target_height", 20))
+        if 0 < th < float(cfg.get("upscale_below", 12)):
+            scale = min(float(cfg.get("max_scale", 3.0)), target / th)
+            scale = max(1.0, round(scale * 2) / 2)
+        if scale > 1.0:
+            big = Image.fromarray(a).resize((int(a.shape[1] * scale), int(a.shape[0] * scale)), Image.BICUBIC)
+            a = np.asarray(big, dtype=np.uint8)
+
+    if cfg.get("binarize", True):
+        win = int(cfg.get("window", 31)) | 1
+        k = float(cfg.get("k", 0.2))
+        f = a.astype(np.float64)
+        pad = win // 2
+        p = np.pad(f, pad + 1, mode='edge')
+        s1 = p.cumsum(0).cumsum(1)
+        s2 = (p * p).cumsum(0).cumsum(1)
+        hh, ww = f.shape
+
+        def _box(s):
+            return (s[win:win + hh, win:win + ww] - s[:hh, win:win + ww]
+                    - s[win:win + hh, :ww] + s[:hh, :ww])
+
+        n = float(win * win)
+        mean = _box(s1) / n
+        std = np.sqrt(np.maximum(_box(s2) / n - mean * mean, 0.0))
+        thresh = mean * (1.0 + k * (std / 128.0 - 1.0))
+        a = np.where(f > thresh, 255, 0).astype(np.uint8)
+
+    return PreparedImage(Image.fromarray(a), scale, dx, dy, inverted)
+
+
+def _ocr_boxes(img, boxes: list[tuple[int, int, int, int]], regions: list[int], engine=None) -> list[list[dict]]:
+    """OCR several regions of `img` concurrently; returns word lists in screen coordinates.
+    `engine` defaults to the shared get_ocr_engine() one."""
+    if engine is None:
+        engine, err = get_ocr_engine()
+        if engine is None:
+            raise RuntimeError(f'OCR not available: {err}')
+    results: list[list[dict]] = [[] for _ in boxes]
+    jobs = []
+    for i, b in enumerate(boxes):
+        prep = preprocess_for_ocr(img if b == (0, 0, img.width, img.height) else img.crop(b))
+        if prep is not None:  # None: the crop is blank, nothing to OCR
+            jobs.append((i, prep))
+    for (i, prep), d in zip(jobs, engine.map_data([p.image for _i, p in jobs])):
+        b = boxes[i]
+        results[i] = _words_from_data(d, b[0] + prep.dx, b[1] + prep.dy, regions[i], prep.scale)
+    return results
+
+
+def _use_tiles(box: tuple[int, int, int, int], tiled=None) -> bool:
+    cfg = SETTINGS.get("ocr", {})
+    mode = cfg.get("tiled", "auto") if tiled is None else tiled
+    if mode is False or mode == "off":
+        return False
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    if mode is True or mode == "on":
+        return area > int(cfg.get("tiled_size", 1024)) ** 2
+    return area >= int(cfg.get("tiled_min_px", 2_000_000))
+
+
+def _ocr_words(img, box: tuple[int, int, int, int], region: int, engine=None, tiled=None) -> list[dict]:
+    """OCR one region of `img` and return word dicts in screen coordinates.
+    Large regions (4K / multi-monitor captures) are split into overlapping tiles
+    that are OCRed in parallel and merged back (see _merge_tile_words).
+    `engine` and `tiled` override the shared engine and SETTINGS["ocr"]["tiled"]."""
+    if not _use_tiles(box, tiled):
+        return _ocr_boxes(img, [box], [region], engine)[0]
+    cfg = SETTINGS.get("ocr", {})
+    tiles = _split_tiles(box, int(cfg.get("tiled_size", 1024)), int(cfg.get("tiled_overlap", 48)))
+    # Each tile gets its own sub-region id so Tesseract's per-tile line numbers don't collide
+    subregions = [region * 1000 + i for i in range(len(tiles))]
+    per_tile = list(zip(tiles, _ocr_boxes(img, tiles, subregions, engine)))
+    return _merge_tile_words(per_tile, box)
+
+
+def _boxes_overlap(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_boxes(boxes: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+    """Union overlapping rectangles until none overlap."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        out: list[tuple[int, int, int, int]] = []
+        for b in boxes:
+            for i, o in enumerate(out):
+                if _boxes_overlap(b, o):
+                    out[i] = (min(b[0], o[0]), min(b[1], o[1]), max(b[2], o[2]), max(b[3], o[3]))
+                    merged = True
+                    break
+            else:
+                out.append(b)
+        boxes = out
+    return boxes
+
+
+def _ocr_tokens(text: str) -> list[str]:
+    return re.findall(r"\w+", (text or '').lower())
+
+
+class TextMatch:
+    """A located phrase: the words it spans, their union box and a 0..1 score."""
+
+    __slots__ = ('text', 'score', 'left', 'top', 'width', 'height', 'words')
+
+    def __init__(self, words: list[dict], score: float):
+        self.words = words
+        self.score = score
+        self.text = ' '.join(w['text'] for w in words)
+        self.left = min(w['left'] for w in words)
+        self.top = min(w['top'] for w in words)
+        self.width = max(w['left'] + w['width'] for w in words) - self.left
+        self.height = max(w['top'] + w['height'] for w in words) - self.top
+
+    @property
+    def center(self) -> tuple[int, int]:
+        return self.left + self.width // 2, self.top + self.height // 2
+
+    def __repr__(self):
+        return f"TextMatch({self.text!r}, score={self.score:.2f}, at={self.center})"
+
+
+class OCRWordIndex:
+    """Lookup structure over one snapshot's OCR words.
+
+    Words are grouped into lines by Tesseract's (block, par, line) numbers so a
+    label like "Save As" matches as a phrase. Lookups try, in order: an exact
+    token n-gram, the n-gram with spacing/punctuation ignored ("SaveAs",
+    "Save-As"), then a fuzzy ratio over n-grams of similar length.
+    """
+
+    def __init__(self, words: list[dict]):
+        lines: dict[tuple, list[dict]] = {}
+        for w in words:
+            lines.setdefault((w.get('region', 0), w.get('block', 0), w.get('par', 0), w.get('line', 0)), []).append(w)
+        self.lines: list[list[dict]] = [sorted(ws, key=lambda w: w['left']) for ws in lines.values()]
+        # Each line flattened to (token, word) so words Tesseract split on punctuation still line up
+        self._line_tokens: list[list[tuple[str, dict]]] = []
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        for li, ws in enumerate(self.lines):
+            toks = [(t, w) for w in ws for t in _ocr_tokens(w['text'])]
+            self._line_tokens.append(toks)
+            for ti, (t, _w) in enumerate(toks):
+                self._postings.setdefault(t, []).append((li, ti))
+
+    def __len__(self):
+        return sum(len(t) for t in self._line_tokens)
+
+    def _span(self, li: int, start: int, n: int) -> list[dict]:
+        out: list[dict] = []
+        for _t, w in self._line_tokens[li][start:start + n]:
+            if not out or out[-1] is not w:
+                out.append(w)
+        return out
+
+    def find(self, query: str, limit: int = 5, min_score: float | None = None) -> list[TextMatch]:
+        """Best matches for `query`, highest score first (ties: top-left first)."""
+        q = _ocr_tokens(query)
+        if not q:
+            return []
+        if min_score is None:
+            min_score = float(SETTINGS.get("ocr", {}).get("min_match", 0.75))
+        n = len(q)
+        found: dict[tuple[int, int, int], float] = {}
+
+        # 1) exact n-gram via the first token's postings
+        for li, ti in self._postings.get(q[0], ()):
+            toks = self._line_tokens[li]
+            if [t for t, _ in toks[ti:ti + n]] == q:
+                found[(li, ti, n)] = 1.0
+        if not found:
+            joined_q = ''.join(q)
+            for li, toks in enumerate(self._line_tokens):
+                for ti in range(len(toks)):
+                    # 2) same characters with different token breaks ("SaveAs", "Save-As")
+                    acc = ''
+                    for k in range(ti, len(toks)):
+                        acc += toks[k][0]
+                        if len(acc) >= len(joined_q):
+                            if acc == joined_q:
+                                found[(li, ti, k - ti + 1)] = 0.95
+                            break
+                    # 3) fuzzy over windows of n-1..n+1 tokens
+                    for m in range(max(1, n - 1), n + 2):
+                        if ti + m > len(toks):
+                            break
+                        cand = ' '.join(t for t, _ in toks[ti:ti + m])
+                        sm = difflib.SequenceMatcher(None, ' '.join(q), cand)
+                        if sm.real_quick_ratio() < min_score or sm.quick_ratio() < min_score:
+                            continue
+                        r = sm.ratio() * 0.9
+                        if r >= min_score * 0.9 and r > found.get((li, ti, m), 0.0):
+                            found[(li, ti, m)] = r
+                    # 4) single-word query inside a longer token ("save" in "autosave")
+                    if n == 1 and toks[ti][0] != q[0] and q[0] in toks[ti][0]:
+                        found.setdefault((li, ti, 1), 0.7)
+        matches = [TextMatch(self._span(li, ti, m), s) for (li, ti, m), s in found.items()]
+        matches.sort(key=lambda mt: (-mt.score, mt.top, mt.left))
+        return matches[:limit]
+
+    def best(self, query: str) -> TextMatch | None:
+        hits = self.find(query, limit=1)
+        return hits[0] if hits else None
+
+
+class ScreenSnapshot:
+    """One grayscale capture plus the OCR words found on it."""
+
+    def __init__(self, image, words: list[dict], hashes: dict, taken_at: float):
+        self.image = image
+        self.words = words
+        self.hashes = hashes
+        self.taken_at = taken_at
+        self.ocr_regions: list[tuple[int, int, int, int]] = []
+        self._index: OCRWordIndex | None = None
+
+    @property
+    def index(self) -> OCRWordIndex:
+        """Word index, built on first lookup and shared by every query on this snapshot."""
+        if self._index is None:
+            self._index = OCRWordIndex(self.words)
+        return self._index
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    @property
+    def text(self) -> str:
+        lines: dict[tuple, list[dict]] = {}
+        for w in self.words:
+            lines.setdefault((w['region'], w['block'], w['par'], w['line']), []).append(w)
+        ordered = sorted(lines.values(), key=lambda ws: (min(w['top'] for w in ws), min(w['left'] for w in ws)))
+        return '\n'.join(' '.join(w['text'] for w in sorted(ws, key=lambda w: w['left'])) for ws in ordered)
+
+
+class ScreenOCRCache:
+    """Reuses OCR results between captures and only re-reads tiles that changed.
+
+    The screen is hashed in `ocr_tile` pixel tiles. Within `ocr_staleness` seconds of
+    the last capture the previous snapshot is returned as-is; after that a new
+    screenshot is taken, and only the dirty tiles (grown to cover any word they
+    cut through) are OCRed again. Input actions call invalidate() so a click or
+    keystroke always forces a fresh capture. `grab` replaces the screen capture for
+    this instance only (set_screenshot_provider() changes it for everyone).
+    """
+
+    def __init__(self, grab=None):
+        self._grab = grab or _grab_screen
+        self._lock = threading.Lock()
+        self._last: ScreenSnapshot | None = None
+        self._dirty = True
+        self._region_seq = 0
+        self._frame = None  # (gray image, taken_at) for region lookups
+        self._roi: OrderedDict = OrderedDict()  # box -> (crop digest, words)
+        self.stats = {'reused': 0, 'full': 0, 'incremental': 0, 'unchanged': 0, 'roi': 0, 'roi_reused': 0}
+
+    @staticmethod
+    def _cfg() -> dict:
+        return SETTINGS.get("ocr", {})
+
+    def reset(self):
+        with self._lock:
+            self._last = None
+            self._dirty = True
+            self._frame = None
+            self._roi.clear()
+
+    def invalidate(self):
+        """The screen probably changed (we just clicked/typed); don't serve the snapshot as-is."""
+        self._dirty = True
+        self._frame = None
+
+    def _fresh(self, taken_at: float) -> bool:
+        return time.monotonic() - taken_at <= float(self._cfg().get("staleness", 1.5))
+
+    def frame(self):
+        """Current grayscale screen image, reused within the staleness window."""
+        with self._lock:
+            return self._frame_locked()
+
+    def _frame_locked(self):
+        if self._frame is None or not self._fresh(self._frame[1]):
+            self._frame = (self._grab().convert('L'), time.monotonic())
+        return self._frame[0]
+
+    def region_words(self, box: tuple[int, int, int, int]) -> list[dict]:
+        """OCR words inside `box` only. Served from the full snapshot when that is
+        still fresh, otherwise only the box is OCRed (and reused while its pixels don't change)."""
+        with self._lock:
+            last = self._last
+            if last is not None and not self._dirty and self._fresh(last.taken_at):
+                return [w for w in last.words
+                        if box[0] <= w['left'] + w['width'] // 2 < box[2] and box[1] <= w['top'] + w['height'] // 2 < box[3]]
+            img = self._frame_locked()
+            crop = img.crop(box)
+            digest = hashlib.blake2b(crop.tobytes(), digest_size=16).digest()
+            hit = self._roi.get(box)
+            if hit is not None and hit[0] == digest:
+                self._roi.move_to_end(box)
+                self.stats['roi_reused'] += 1
+                return hit[1]
+            words = _ocr_words(img, box, self._next_region())
+            self._roi[box] = (digest, words)
+            while len(self._roi) > 16:
+                self._roi.popitem(last=False)
+            self.stats['roi'] += 1
+            return words
+
+    def _tile_hashes(self, img) -> dict:
+        tile = max(16, int(self._cfg().get("tile", 128)))
+        w, h = img.size
+        hashes = {}
+        raw = img.tobytes()
+        for ty in range(0, h, tile):
+            rows = [raw[y * w:(y + 1) * w] for y in range(ty, min(h, ty + tile))]
+            for tx in range(0, w, tile):
+                hb = hashlib.blake2b(digest_size=16)
+                for r in rows:
+                    hb.update(r[tx:tx + tile])
+                hashes[(tx, ty, min(w, tx + tile), min(h, ty + tile))] = hb.digest()
+        return hashes
+
+    def _next_region(self) -> int:
+        self._region_seq += 1
+        return self._region_seq
+
+    def snapshot(self, force: bool = False) -> ScreenSnapshot:
+        with self._lock:
+            now = time.monotonic()
+            last = self._last
+            stale = float(self._cfg().get("staleness", 1.5))
+            if last is not None and not force and not self._dirty and now - last.taken_at <= stale:
+                self.stats['reused'] += 1
+                return last
+            img = self._grab().convert('L')
+            hashes = self._tile_hashes(img)
+            if last is None or last.size != img.size:
+                region = (0, 0, img.width, img.height)
+                snap = ScreenSnapshot(img, _ocr_words(img, region, self._next_region()), hashes, now)
+                snap.ocr_regions = [region]
+                self.stats['full'] += 1
+            else:
+                dirty = [t for t, hv in hashes.items() if last.hashes.get(t) != hv]
+                if not dirty:
+                    snap = ScreenSnapshot(img, last.words, hashes, now)
+                    self.stats['unchanged'] += 1
+                else:
+                    margin = int(self._cfg().get("tile_margin", 8))
+                    rects = _merge_boxes([(max(0, x0 - margin), max(0, y0 - margin), min(img.width, x1 + margin), min(img.height, y1 + margin))
+                                          for (x0, y0, x1, y1) in dirty])
+                    # Grow regions over old words they cut through, so those words are re-read whole
+                    for w in last.words:
+                        wb = (w['left'], w['top'], w['left'] + w['width'], w['top'] + w['height'])
+                        for i, r in enumerate(rects):
+                            if _boxes_overlap(wb, r):
+                                rects[i] = (min(r[0], wb[0]), min(r[1], wb[1]), max(r[2], wb[2]), max(r[3], wb[3]))
+                    rects = _merge_boxes(rects)
+                    keep = [w for w in last.words
+                            if not any(_boxes_overlap((w['left'], w['top'], w['left'] + w['width'], w['top'] + w['height']), r) for r in rects)]
+                    small = [r for r in rects if not _use_tiles(r)]
+                    for words in _ocr_boxes(img, small, [self._next_region() for _ in small]):
+                        keep.extend(words)
+                    for r in rects:
+                        if _use_tiles(r):
+                            keep.extend(_ocr_words(img, r, self._next_region()))
+                    snap = ScreenSnapshot(img, keep, hashes, now)
+                    snap.ocr_regions = rects
+                    self.stats['incremental'] += 1
+            self._last = snap
+            self._dirty = False
+            return snap
+
+
+screen_cache = ScreenOCRCache()
 
 
 def screen_ocr() -> str:
     try:
-        _pt, err = _get_pytesseract()
-        if _pt is None:
-            print('pytesseract not available:', err)
+        engine, err = get_ocr_engine()
+        if engine is None:
+            print('OCR not available:', err)
             return ''
-        img = pyautogui.screenshot()
-        gray = img.convert('L')
-        text = _pt.image_to_string(gray)
-        return text or ''
+        return screen_cache.snapshot().text or ''
     except Exception as e:
         print('OCR failed:', e)
         return ''
 
-def click_by_text(target: str, clicks: int = 1, move_only: bool = False) -> bool:
+def _grid_cell_box(cell: int, size: tuple[int, int]) -> tuple[int, int, int, int]:
+    # Same numpad layout as grid_nav: 1 is bottom-left, 9 top-right
+    w, h = size
+    col = (cell - 1) % 3
+    row = 2 - (cell - 1) // 3
+    return (w * col // 3, h * row // 3, w * (col + 1) // 3, h * (row + 1) // 3)
+
+
+def _active_window_box() -> tuple[int, int, int, int] | None:
+    if platform.system() != 'Windows':
+        return None
+    try:
+        user32 = ctypes.windll.user32
+        hwnd = user32.GetForegroundWindow()
+        rect = wintypes.RECT()
+        if hwnd and user32.GetWindowRect(hwnd, ctypes.byref(rect)):
+            return (rect.left, rect.top, rect.right, rect.bottom)
+    except Exception:
+        pass
+    return None
+
+
+def _roi_boxes(region, size: tuple[int, int]) -> list[tuple[int, int, int, int]]:
+    """Regions to search before falling back to the full screen.
+
+    `region` may be a grid cell 1..9 (as in grid_nav), "window" for the focused
+    window, "cursor" (the default) for growing boxes around the mouse, or an
+    explicit [x, y, width, height].
+    """
+    w, h = size
+
+    def _clip(b):
+        b = (max(0, int(b[0])), max(0, int(b[1])), min(w, int(b[2])), min(h, int(b[3])))
+        return b if b[2] - b[0] >= 16 and b[3] - b[1] >= 16 else None
+
+    boxes: list = []
+    if isinstance(region, str) and region.strip().isdigit():
+        region = int(region)
+    if isinstance(region, int) and 1 <= region <= 9:
+        boxes = [_grid_cell_box(region, size)]
+    elif isinstance(region, (list, tuple)) and len(region) == 4:
+        x, y, bw, bh = region
+        boxes = [(x, y, x + bw, y + bh)]
+    elif region == 'window':
+        win = _active_window_box()
+        boxes = [win] if win else []
+    elif region in (None, '', 'cursor'):
+        cx, cy = pyautogui.position()
+        for half in SETTINGS.get("ocr", {}).get("roi_sizes", [240, 520]):
+            boxes.append((cx - half * 2, cy - half, cx + half * 2, cy + half))
+    out = []
+    for b in boxes:
+        b = _clip(b)
+        # Skip regions that are (nearly) the whole screen; the fallback covers those
+        if b and b not in out and (b[2] - b[0]) * (b[3] - b[1]) < 0.6 * w * h:
+            out.append(b)
+    return out
+
+
+def locate_text(target: str, region=None) -> TextMatch | None:
+    """Find `target` (one or more words) on screen using the word index.
+
+    With ROI search on, the region (see _roi_boxes) is OCRed first and the full
+    screen is read only when the target isn't found there exactly. A fuzzy ROI
+    hit is kept and wins only if the full screen has nothing better (ties go
+    to the ROI, which is where the user is looking)."""
+    if not target or not target.strip():
+        return None
+    roi_hit = None
+    if SETTINGS.get("ocr", {}).get("roi", True):
+        try:
+            for box in _roi_boxes(region, screen_cache.frame().size):
+                hit = OCRWordIndex(screen_cache.region_words(box)).best(target)
+                if hit is None:
+                    continue
+                if hit.score >= 0.95:
+                    return hit  # exact (or same characters split differently)
+                if roi_hit is None or hit.score > roi_hit.score:
+                    roi_hit = hit
+        except Exception as e:
+            print('ROI OCR failed, reading full screen:', e)
+    full_hit = screen_cache.snapshot().index.best(target)
+    if roi_hit is not None and (full_hit is None or roi_hit.score >= full_hit.score):
+        return roi_hit
+    return full_hit
+
+
+def click_by_text(target: str, clicks: int = 1, move_only: bool = False, region=None) -> bool:
     try:
         if not target:
             return False
-        _pt, err = _get_pytesseract()
-        if _pt is None:
-            print('pytesseract not available:', err)
+        engine, err = get_ocr_engine()
+        if engine is None:
+            print('OCR not available:', err)
             return False
-        target_l = target.strip().lower()
-        img = pyautogui.screenshot()
-        gray = img.convert('L')
-        data = _pt.image_to_data(gray, output_type=_pt.Output.DICT)
-        best_idx = -1
-        best_score = 0.0
-        for i, txt in enumerate(data.get('text', [])):
-            t = (txt or '').strip()
-            if not t:
-                continue
-            tl = t.lower()
-            score = 1.0 if target_l == tl else (0.7 if target_l in tl or tl in target_l else 0.0)
-            if score > best_score:
-                best_score = score
-                best_idx = i
-        if best_idx >= 0:
-            x = int(data['left'][best_idx]) + int(data['width'][best_idx]) // 2
-            y = int(data['top'][best_idx]) + int(data['height'][best_idx]) // 2
-            pyautogui.moveTo(x, y, duration=0.15)
-            if not move_only:
-                if clicks >= 2:
-                    pyautogui.doubleClick()
-                elif clicks == 1:
-                    pyautogui.click()
-            return True
-        return False
+        hit = locate_text(target, region)
+        if hit is None:
+            return False
+        x, y = hit.center
+        pyautogui.moveTo(x, y, duration=0.15)
+        if not move_only:
+            if clicks >= 2:
+                pyautogui.doubleClick()
+            elif clicks == 1:
+                pyautogui.click()
+            screen_cache.invalidate()
+        return True
     except Exception as e:
         print('click_by_text failed:', e)
         return False
 
 def ocr_is_available() -> tuple[bool, str | None]:
     """Quick check whether OCR stack is usable."""
-    _pt, err = _get_pytesseract()
-    if _pt is None:
+    engine, err = get_ocr_engine()
+    if engine is None:
         return False, err
     try:
         # quick noop to ensure tesseract path is respected
-        _ = _pt.get_tesseract_version()
+        _ = engine.version()
         return True, None
     except Exception as e:
         return False, str(e)
@@ -692,9 +4885,9 @@ def ocr_is_available() -> tuple[bool, str | None]:
 
 def test_ocr() -> tuple[bool, str]:
     """Quick OCR self-test. Uses a generated image if PIL is available; otherwise falls back to version check."""
-    _pt, err = _get_pytesseract()
-    if _pt is None:
-        return False, f"pytesseract not available: {err}"
+    engine, err = get_ocr_engine()
+    if engine is None:
+        return False, f"OCR not available: {err}"
     # Try with a generated image containing known text
     try:
         from PIL import Image, ImageDraw, ImageFont  # type: ignore
@@ -706,19 +4899,219 @@ def test_ocr() -> tuple[bool, str]:
         except Exception:
             font = ImageFont.load_default()
         draw.text((20, 35), text, fill=0, font=font)
-        out = _pt.image_to_string(img)
+        out = engine.image_to_string(img)
         if "barbaric" in (out or '').lower() and "ocr" in (out or '').lower():
             return True, f"Success: {out.strip()}"
         return False, f"Unexpected OCR result: {out.strip()}"
     except Exception:
         # Fallback: report Tesseract version as a minimal verification
         try:
-            ver = _pt.get_tesseract_version()
-            return True, f"Tesseract available: {ver}"
+            ver = engine.version()
+            return True, f"Tesseract available ({engine.name}): {ver}"
         except Exception as e2:
             return False, f"Tesseract not working: {e2}"
 
 
+def test_screen_cache() -> tuple[bool, str]:
+    """Self-check for the snapshot cache using canned screenshots: an unchanged
+    frame must reuse OCR, and a frame with one changed corner must re-read only that corner."""
+    try:
+        from PIL import Image, ImageDraw  # type: ignore
+    except Exception as e:
+        return False, f"PIL not available: {e}"
+    base = Image.new("RGB", (1024, 768), color=(255, 255, 255))
+    ImageDraw.Draw(base).text((40, 40), "File Edit View", fill=(0, 0, 0))
+    changed = base.copy()
+    ImageDraw.Draw(changed).text((900, 700), "Saved", fill=(0, 0, 0))
+    frames = iter([base, base, changed])
+    # A private cache fed the canned frames: the live screen_cache keeps its snapshot and stats
+    cache = ScreenOCRCache(grab=lambda: next(frames))
+    try:
+        cache.snapshot()
+        cache.snapshot(force=True)
+        unchanged = cache.stats['unchanged']
+        snap = cache.snapshot(force=True)
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in snap.ocr_regions)
+        if unchanged != 1 or cache.stats['incremental'] != 1:
+            return False, f"Unexpected cache stats: {cache.stats}"
+        return True, f"Re-OCRed {area / (1024 * 768):.1%} of the screen after a local change"
+    except Exception as e:
+        return False, f"Screen cache check failed: {e}"
+
+
+def _render_ui_fixture(labels: list[str], size: tuple[int, int] = (1280, 800), font_size: int = 18,
+                       bg=(245, 245, 245), fg=(20, 20, 20)):
+    """Synthetic 'screenshot': labels laid out as menu/toolbar rows, the way test_ocr renders text."""
+    from PIL import Image, ImageDraw, ImageFont  # type: ignore
+    img = Image.new("RGB", size, color=bg)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype("arial.ttf", font_size)
+    except Exception:
+        try:
+            font = ImageFont.load_default(font_size)
+        except Exception:
+            font = ImageFont.load_default()
+    x, y = 20, 20
+    for label in labels:
+        w = int(draw.textlength(label, font=font)) if hasattr(draw, 'textlength') else len(label) * 9
+        if x + w > size[0] - 20:
+            x, y = 20, y + max(48, font_size * 3)
+        draw.text((x, y), label, fill=fg, font=font)
+        x += w + 60
+    return img
+
+
+def _naive_best(words: list[dict], target: str) -> dict | None:
+    # The original per-token scoring, kept for comparison in bench_word_index
+    target_l = target.strip().lower()
+    best, best_score = None, 0.0
+    for w in words:
+        tl = w['text'].lower()
+        score = 1.0 if target_l == tl else (0.7 if target_l in tl or tl in target_l else 0.0)
+        if score > best_score:
+            best, best_score = w, score
+    return best
+
+
+def bench_word_index(fixtures_dir=None, repeat: int = 50) -> dict:
+    """Hit rate and lookup latency of OCRWordIndex vs the old per-token scan.
+
+    Fixtures are `*.png` screenshots with a matching `*.json` list of labels that
+    are visible on them. Without a directory a synthetic UI image is rendered.
+    A hit is a match whose box centre lies on a word that belongs to the label.
+    """
+    fixtures = []
+    if fixtures_dir:
+        for png in sorted(Path(fixtures_dir).glob('*.png')):
+            ref = png.with_suffix('.json')
+            if ref.exists():
+                from PIL import Image  # type: ignore
+                fixtures.append((png.name, Image.open(png), json.loads(ref.read_text(encoding='utf-8'))))
+    if not fixtures:
+        labels = ["File", "Edit", "View", "Save As", "Save All", "Open Recent", "Find in Files",
+                  "Run Task", "Terminal", "Go to Line", "Close Window", "Settings", "Print Preview"]
+        fixtures.append(('synthetic', _render_ui_fixture(labels), labels))
+
+    def _covers(words: list[dict], label: str) -> bool:
+        got = {t for w in words for t in _ocr_tokens(w['text'])}
+        return set(_ocr_tokens(label)) <= got
+
+    res = {'queries': 0, 'naive_hits': 0, 'index_hits': 0, 'ocr_s': 0.0,
+           'build_ms': 0.0, 'naive_us': 0.0, 'index_us': 0.0}
+    for name, img, labels in fixtures:
+        gray = img.convert('L')
+        t0 = time.perf_counter()
+        words = _ocr_words(gray, (0, 0, gray.width, gray.height), 1)
+        res['ocr_s'] += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            idx = OCRWordIndex(words)
+        res['build_ms'] += (time.perf_counter() - t0) / repeat * 1000
+        for label in labels:
+            res['queries'] += 1
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                nb = _naive_best(words, label)
+            res['naive_us'] += (time.perf_counter() - t0) / repeat * 1e6
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                hit = idx.best(label)
+            res['index_us'] += (time.perf_counter() - t0) / repeat * 1e6
+            res['naive_hits'] += int(nb is not None and _covers([nb], label))
+            res['index_hits'] += int(hit is not None and _covers(hit.words, label))
+    q = max(1, res['queries'])
+    print(f"{len(fixtures)} fixture(s), {res['queries']} labels, OCR {res['ocr_s']:.2f} s once per snapshot")
+    print(f"  naive scan : {res['naive_hits']}/{q} found  {res['naive_us']/q:7.1f} us/query")
+    print(f"  word index : {res['index_hits']}/{q} found  {res['index_us']/q:7.1f} us/query  (+{res['build_ms']:.2f} ms build)")
+    return res
+
+
+def bench_tiled_ocr(size: tuple[int, int] = (3840, 2160), worker_counts: list[int] | None = None) -> dict:
+    """Single-pass vs tiled OCR on a synthetic high-resolution screen, per worker count.
+    Recall is the share of rendered labels the word index can still find after merging."""
+    labels = [f"{a} {b}" for a in ("Open", "Save", "Close", "Find", "Print", "Export", "Share", "Rename")
+              for b in ("File", "Project", "Window", "Tab", "Folder", "Image", "Report", "Note")]
+    img = _render_ui_fixture(labels * max(1, (size[0] * size[1]) // 600_000), size).convert('L')
+    box = (0, 0, img.width, img.height)
+    cfg = SETTINGS.get("ocr", {})
+    results: dict = {}
+
+    def _run(workers: int, tiled) -> tuple[float, float, int]:
+        # A private engine per worker count: the shared one and SETTINGS stay untouched
+        _preimport_ocr_bindings()
+        engine, err = create_ocr_engine(cfg.get("engine", "auto"), workers=workers, lang=cfg.get("lang", "eng"))
+        if engine is None:
+            raise RuntimeError(err)
+        try:
+            engine.map_data([img.crop((0, 0, 400, 120))] * workers)  # start every worker before timing
+            t0 = time.perf_counter()
+            words = _ocr_words(img, box, 1, engine=engine, tiled=tiled)
+            dt = time.perf_counter() - t0
+        finally:
+            engine.close()
+        idx = OCRWordIndex(words)
+        recall = sum(1 for lb in labels if idx.best(lb) is not None) / len(labels)
+        return dt, recall, len(words)
+
+    try:
+        base_s, base_recall, base_n = _run(1, False)
+        results['single'] = {'s': base_s, 'recall': base_recall, 'words': base_n}
+        print(f"{size[0]}x{size[1]}  single pass : {base_s:6.2f} s  recall {base_recall:.0%}  {base_n} words")
+        for n in worker_counts or sorted({1, 2, 4, os.cpu_count() or 1}):
+            dt, recall, count = _run(n, True)
+            results[n] = {'s': dt, 'recall': recall, 'words': count, 'speedup': base_s / dt if dt else 0.0}
+            print(f"{'':>{len(str(size[0])) * 2 + 1}}  tiled x{n:<3}   : {dt:6.2f} s  recall {recall:.0%}  {count} words  speedup {base_s / dt:4.2f}x")
+    except Exception as e:
+        print('Tiled OCR benchmark failed:', e)
+    return results
+
+
+def bench_preprocess(repeat: int = 3) -> dict:
+    """Label recall, OCR latency and Tesseract input size with and without preprocess_for_ocr,
+    on rendered fixtures covering light, dark, small and low-contrast UI text."""
+    labels = ["File", "Edit", "Selection", "View", "Go to Line", "Save As", "Open Recent", "Close Editor",
+              "Find in Files", "Replace All", "Toggle Terminal", "Run Task", "Settings", "Extensions"]
+    fixtures = {
+        'light 18px': _render_ui_fixture(labels, (1280, 400)),
+        'dark 18px': _render_ui_fixture(labels, (1280, 400), bg=(30, 30, 30), fg=(212, 212, 212)),
+        'small 10px': _render_ui_fixture(labels, (1280, 400), font_size=10, fg=(90, 90, 90), bg=(255, 255, 255)),
+        'low contrast': _render_ui_fixture(labels, (1280, 400), bg=(200, 200, 200), fg=(120, 120, 120)),
+        'sparse dark': _render_ui_fixture(labels[:4], (1920, 1080), bg=(37, 37, 38), fg=(200, 200, 200)),
+    }
+    engine, err = get_ocr_engine()
+    if engine is None:
+        print('OCR not available:', err)
+        return {}
+    cfg = SETTINGS.get("ocr", {}).get("preprocess", {})
+    results: dict = {}
+    warm = fixtures['light 18px'].convert('L').crop((0, 0, 400, 120))
+    preprocess_for_ocr(warm)  # pay the numpy import and model warm-up outside the timings
+    engine.image_to_data(warm)
+    for name, img in fixtures.items():
+        gray = img.convert('L')
+        expected = [lb for lb in labels if lb in labels[:4] or not name.startswith('sparse')]
+        row = {}
+        for mode in ('raw', 'prep'):
+            mode_cfg = dict(cfg, enabled=mode == 'prep')
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                prep = preprocess_for_ocr(gray, mode_cfg)
+                data = engine.image_to_data(prep.image) if prep is not None else {'text': []}
+            dt = (time.perf_counter() - t0) / repeat
+            words = _words_from_data(data, prep.dx, prep.dy, 1, prep.scale) if prep is not None else []
+            idx = OCRWordIndex(words)
+            found = sum(1 for lb in expected
+                        if (hit := idx.best(lb)) is not None and set(_ocr_tokens(lb)) <= {t for w in hit.words for t in _ocr_tokens(w['text'])})
+            px = prep.image.width * prep.image.height if prep is not None else 0
+            row[mode] = {'recall': found / len(expected), 'ms': dt * 1000, 'pixels': px}
+        results[name] = row
+        r, p = row['raw'], row['prep']
+        print(f"{name:>13}: raw {r['recall']:4.0%} {r['ms']:7.0f} ms {r['pixels'] / 1e6:5.2f} MP"
+              f"  | prep {p['recall']:4.0%} {p['ms']:7.0f} ms {p['pixels'] / 1e6:5.2f} MP")
+    return results
+
+
 # ===== Cursor navigation helpers =====
 def cursor_nav(direction: str, amount: int | None = None):
     try:
@@ -746,7 +5139,7 @@ def cursor_nav(direction: str, amount: int | None = None):
         elif direction == 'bottom_right':
             x, y = sw - 10, sh - 10
         else:
-            speak('Unknown cursor direction.')
+            speak('Unknown cursor direction.', priority='urgent')
             return
         pyautogui.moveTo(x, y, duration=0.12)
     except Exception as e:
@@ -759,7 +5152,7 @@ def grid_nav(cell):
         if isinstance(cell, str) and cell.isdigit():
             cell = int(cell)
         if not isinstance(cell, int) or not (1 <= cell <= 9):
-            speak('Unknown grid cell.')
+            speak('Unknown grid cell.', priority='urgent')
             return
         sw, sh = pyautogui.size()
         thirds_x = [int(sw * 1/6), int(sw * 3/6), int(sw * 5/6)]
@@ -867,3 +5260,8 @@ def _import_module_from_path(fullname: str, path: Path) -> types.ModuleType | No
     except Exception as e:
         print('Import skill failed:', e)
         return None
+
+STARTUP_TIMING['import'] = time.perf_counter() - _IMPORT_T0
+
+if __name__ == '__main__':
+    main()